@@ -1,20 +1,63 @@
 # -*- coding: utf-8 -*-
 
+"""
+Row generators and application urls.
+
+The public names are loaded lazily, on first access, so importing the package doesn't pull in
+the URL, download and generator modules, or their dependencies, until they are used.
+"""
+
 DEFAULT_EPSG=4326
 
-from .appurl.url import parse_app_url, Url
-from .appurl.util import get_cache, set_default_cache_name
-from .core import get_generator, dataframe, geoframe, iterator
-from .source import  Source, RowGenerator
-from .appurl.web.download import Downloader
-from .exceptions import SourceError
+# Public name -> module that defines it
+_lazy_names = {
+    'parse_app_url': '.appurl.url',
+    'Url': '.appurl.url',
+    'get_cache': '.appurl.util',
+    'set_default_cache_name': '.appurl.util',
+    'get_generator': '.core',
+    'dataframe': '.core',
+    'geoframe': '.core',
+    'iterator': '.core',
+    'Source': '.source',
+    'RowGenerator': '.source',
+    'Downloader': '.appurl.web.download',
+    'SourceError': '.exceptions',
+}
+
+__all__ = ['DEFAULT_EPSG'] + list(_lazy_names)
+
+
+def __getattr__(name):
+    import importlib
+
+    if name == '__version__':
+        try:
+            from importlib.metadata import version, PackageNotFoundError
+        except ImportError:
+            from pkg_resources import get_distribution, DistributionNotFound as PackageNotFoundError
+            version = lambda n: get_distribution(n).version
+
+        try:
+            v = version(__name__)
+        except PackageNotFoundError:
+            # package is not installed
+            raise AttributeError(name)
+
+        globals()['__version__'] = v
+        return v
+
+    try:
+        module_name = _lazy_names[name]
+    except KeyError:
+        raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+
+    value = getattr(importlib.import_module(module_name, __name__), name)
 
+    globals()[name] = value
 
-from pkg_resources import get_distribution, DistributionNotFound
-try:
-    __version__ = get_distribution(__name__).version
-except DistributionNotFound:
-    # package is not installed
-    pass
+    return value
 
 
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
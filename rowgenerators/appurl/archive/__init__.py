@@ -8,6 +8,8 @@ target file from the archive and store it in the file cache, returning a new Url
 the extracted file."""
 
 
+from .base import ArchiveUrl
 from .zip import ZipUrl
+from .tar import TarUrl
 
-__all__ = ["ZipUrl"]
\ No newline at end of file
+__all__ = ["ArchiveUrl", "ZipUrl", "TarUrl"]
\ No newline at end of file
@@ -0,0 +1,240 @@
+# Copyright (c) 2017 Civic Knowledge. This file is licensed under the terms of the
+# MIT, included in this distribution as LICENSE
+
+""" Base class for Urls of archives, such as zip and tar files """
+
+from rowgenerators.appurl.file.file import FileUrl
+
+
+class ArchiveUrl(FileUrl):
+    """Base class for archive Urls. An archive Url is a local archive file, with a target file that is one
+    of the members of the archive. The target file may be a name or a regular expression, and the target
+    segment may be the index of the file in the archive.
+
+    Subclasses implement the access to the members: get_member_name(), member_names() and open_member().
+    This class extracts members to the cache, and streams them to generators that can read from a stream.
+    """
+
+    match_priority = FileUrl.match_priority - 10
+
+    # Value for resource_format
+    archive_format = None
+
+    # Formats that generators can read from a member stream, without extracting the member. These are
+    # target formats, or for Urls with a scheme extension, like fixed+, the scheme extension, since it
+    # selects the generator. Others, like xlsx and shapefiles, need seekable files.
+    streaming_formats = ('csv', 'tsv', 'pipe', 'json', 'fixed')
+
+    def __init__(self, url=None, downloader=None, **kwargs):
+
+        super().__init__(url, downloader=downloader, **kwargs)
+
+        if self.resource_format != self.archive_format:
+            self.resource_format = self.archive_format
+
+    @property
+    def target_file(self):
+        """
+        Returns the target file, which is usually stored in the first slot in the ``fragment``,
+        but may have been overridden with a ``fragment_query``.
+
+        :return:
+        """
+
+        return self._parts['target_file'] or None
+
+    @target_file.setter
+    def target_file(self, v):
+        self._parts['target_file'] = v
+
+    def join_target(self, tf):
+        """
+        Joins the target ``tf`` by setting the value of the first slot of the fragment.
+
+        :param tf:
+        :return: a clone of this url with a new fragment.
+        """
+        u = self.clone()
+
+        try:
+            u.target_file = str(tf.path)
+        except AttributeError:
+            u.target_file = tf
+
+        return u
+
+    def get_resource(self):
+        return self
+
+    def get_member_name(self):
+        """Return the full name of the target file in the archive"""
+        raise NotImplementedError()
+
+    def member_names(self):
+        """Return the names of the regular files in the archive, without hidden and __MACOSX files"""
+        raise NotImplementedError()
+
+    def open_member(self, name):
+        """Open a member of the archive as a binary stream"""
+        raise NotImplementedError()
+
+    @property
+    def archive_dir(self):
+        """Directory that files will be extracted to"""
+
+        from os.path import abspath
+
+        cache_dir = self.downloader.cache.getsyspath('/')
+        target_path = abspath(self.fspath)
+
+        if target_path.startswith(cache_dir):  # Case when file is already in cache
+            return str(self.fspath) + '_d'
+        else:  # file is not in cache; it may exist elsewhere.
+            return self.downloader.cache.getsyspath(target_path.lstrip('/')) + '_d'
+
+    def _archive_stamp(self):
+        """Identify the version of the archive, for the extracted files"""
+        import os
+
+        st = os.stat(str(self.fspath))
+
+        return '{} {}'.format(st.st_mtime_ns, st.st_size)
+
+    @staticmethod
+    def _stamp_path(target_path):
+        """Path of the file that records the version of the archive a member was extracted from. It is
+        hidden, so it isn't listed as a member of the extraction directory"""
+        return target_path.with_name('.' + target_path.name + '.archive')
+
+    def _is_extracted(self, target_path):
+        """Return True if the target file was extracted from the current version of the archive. The
+        version is recorded in a stamp file, rather than compared to the time of the extracted file,
+        because extracted files can be links to blobs, which have the time of the first file with the
+        same contents."""
+        from pathlib import Path
+
+        if not target_path.exists():
+            return False
+
+        try:
+            return self._stamp_path(target_path).read_text() == self._archive_stamp()
+        except FileNotFoundError:
+            # Extracted before stamps were recorded
+            return target_path.stat().st_mtime >= Path(str(self.fspath)).stat().st_mtime
+
+    def _extract(self, name, target_path):
+        """Extract a member to a new file, and move it to the target path. The target path gets a new
+        file, rather than being overwritten, since it may be linked to a blob that other files share.
+
+        :return: The sha256 hex digest of the member
+        """
+        import os
+        from uuid import uuid4
+        from rowgenerators.appurl.cache import HashingWriter
+        from rowgenerators.appurl.util import copy_file_or_flo
+
+        stamp = self._archive_stamp()
+
+        partial_path = '{}.{}.partial'.format(target_path, uuid4().hex[:8])
+
+        try:
+            with HashingWriter(open(partial_path, 'wb')) as f, self.open_member(name) as flo:
+                copy_file_or_flo(flo, f)
+
+            os.replace(partial_path, str(target_path))
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+
+        # Members with the same contents, in this archive or others, share storage
+        self.downloader.store_blob(target_path, f.hexdigest)
+
+        self._stamp_path(target_path).write_text(stamp)
+
+        return f.hexdigest
+
+    def get_target(self):
+        """
+        Extract the target file from the archive, store it in the cache, and return a file Url to the
+        cached file.
+
+        """
+        from pathlib import Path
+        from rowgenerators.appurl.util import ensure_dir
+
+        self.target_file = self.get_member_name()
+
+        target_path = Path(self.archive_dir).joinpath(self.target_file)
+        ensure_dir(target_path.parent)
+
+        # Unpack the file if it does not exist, or if it was extracted from another version of the archive
+        if not self._is_extracted(target_path):
+            self._extract(self.target_file, target_path)
+            disp = 'copied'
+        else:
+            disp = 'extant'
+
+        tu = self._target_url(target_path)
+
+        tu._disp = disp
+
+        return tu
+
+    def _target_url(self, target_path):
+        """Return the Url for the target file, at a path in the archive_dir"""
+        from rowgenerators.appurl.url import parse_app_url
+
+        fq = self.frag_dict
+
+        for k in ('resource_format', 'resource_file', 'target_file'):
+            if k in fq:
+                del fq[k]
+
+        tu = parse_app_url(str(target_path),
+                           scheme_extension=self.scheme_extension,
+                           downloader=self.downloader,
+                           **fq
+                           )
+
+        if self.target_format != tu.target_format:
+
+            try:
+                tu.target_format = self.target_format
+            except AttributeError:
+                pass  # Some URLS don't allow resetting target type.
+
+        return tu
+
+    def stream_target(self):
+        """Return a Url for the target file that generators read directly from the archive member,
+        without extracting it, if the target format can be read from a stream. Otherwise, return None. The
+        Url is at the path the member would be extracted to, and if that file already exists,
+        generators read it instead."""
+        import functools
+        from pathlib import Path
+
+        if self.scheme_extension and self.scheme_extension not in self.streaming_formats:
+            return None
+
+        target_file = self.get_member_name()
+
+        u = self.clone()
+        u.target_file = target_file
+
+        if (self.scheme_extension or u.target_format) not in self.streaming_formats:
+            return None
+
+        tu = u._target_url(Path(self.archive_dir).joinpath(target_file))
+
+        tu.opener = functools.partial(self.open_member, target_file)
+
+        return tu
+
+    def list(self):
+        """List the files in the referenced archive"""
+
+        if self.target_file:
+            return list(self.set_target_segment(tl.target_segment) for tl in self.get_target().list())
+        else:
+            return list(self.set_target_file(rf) for rf in self.member_names())
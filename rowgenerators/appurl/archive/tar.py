@@ -0,0 +1,185 @@
+# Copyright (c) 2017 Civic Knowledge. This file is licensed under the terms of the
+# MIT, included in this distribution as LICENSE
+
+""" Urls for tar archives, uncompressed or compressed with gzip, bz2 or xz """
+
+import io
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from rowgenerators.appurl.archive.base import ArchiveUrl
+from rowgenerators.exceptions import AppUrlError
+
+TAR_EXTENSIONS = ('.tar', '.tgz', '.tbz2', '.txz', '.tar.gz', '.tar.bz2', '.tar.xz')
+
+
+class TarUrlError(AppUrlError):
+    pass
+
+
+def is_tar_name(name):
+    """Return True if a file name has one of the tar archive extensions"""
+    return bool(name) and name.lower().endswith(TAR_EXTENSIONS)
+
+
+TarIndex = namedtuple('TarIndex', 'names members compressed')
+
+
+@lru_cache(maxsize=16)
+def _cached_tar_index(path, mtime_ns, size):
+    import tarfile
+
+    with open(path, 'rb') as f:
+        compressed = f.read(6).startswith((b'\x1f\x8b', b'BZh', b'\xfd7zXZ'))
+
+    try:
+        # Stream mode reads the archive once, front to back, so compressed archives aren't
+        # decompressed more than once.
+        with tarfile.open(path, 'r|*') as tf:
+            members = {}
+            names = []
+
+            for ti in tf:
+                if ti.isfile():
+                    members[ti.name] = ti
+                    names.append(ti.name)
+
+    except tarfile.TarError as e:
+        raise TarUrlError("Not a tar file: {}: {}".format(path, e))
+
+    return TarIndex(names, members, compressed)
+
+
+def tar_index(path):
+    """Return the index of the regular files in a tar archive: the member names, in archive order, a
+    dict of names to TarInfo objects, which hold the offset of each member's data, and whether the
+    archive is compressed. The index is cached for each version of the archive."""
+    import os
+
+    path = str(path)
+    st = os.stat(path)
+
+    return _cached_tar_index(path, st.st_mtime_ns, st.st_size)
+
+
+class _MemberReader(io.RawIOBase):
+    """Read a member of a tar file, and close the tar file when the member is closed"""
+
+    def __init__(self, f, tf):
+        super().__init__()
+        self._f = f
+        self._tf = tf
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._f.read(len(b))
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._f.close()
+            self._tf.close()
+        super().close()
+
+
+def open_member(path, name):
+    """Open a member of a tar archive as a binary stream, without extracting it.
+
+    Members of uncompressed archives are read by seeking directly to the offset of the member's
+    data, from the index. Members of compressed archives are read by decompressing the archive up
+    to the member.
+
+    :param path: Path to the archive
+    :param name: Name of the member
+    :return: A binary file object
+    """
+    import tarfile
+
+    idx = tar_index(path)
+
+    if name not in idx.members:
+        raise TarUrlError("No file '{}' in tar archive {}".format(name, path))
+
+    if not idx.compressed:
+        tf = tarfile.open(str(path), 'r:')
+        return io.BufferedReader(_MemberReader(tf.extractfile(idx.members[name]), tf))
+
+    tf = tarfile.open(str(path), 'r|*')
+
+    for ti in tf:
+        if ti.name == name:
+            return io.BufferedReader(_MemberReader(tf.extractfile(ti), tf))
+
+    tf.close()
+    raise TarUrlError("No file '{}' in tar archive {}".format(name, path))
+
+
+class TarUrl(ArchiveUrl):
+    """Tar URLS represent a tar archive, as a local resource. The archive may be compressed with gzip,
+    bz2 or xz. Targets are selected the same way as for ZipUrl: the target file may be a name or
+    a regular expression, and the target segment may be the index of the file in the archive."""
+
+    archive_format = 'tar'
+
+    def get_member_name(self):
+        return TarUrl.get_file_from_tar(self)
+
+    def member_names(self):
+        return TarUrl.real_files(tar_index(self.fspath))
+
+    def open_member(self, name):
+        return open_member(str(self.fspath), name)
+
+    @staticmethod
+    def real_files(idx):
+        """Return the names of regular files in a tar index, skipping hidden and __MACOSX files"""
+        from os.path import basename
+
+        for name in idx.names:
+            if basename(name).startswith('__') or basename(name).startswith('.') or name.startswith('__MACOSX'):
+                continue
+
+            yield name
+
+    @staticmethod
+    def get_file_from_tar(url):
+        """Given a file name that may be a regular expression, return the full name for the file
+        from a tar archive"""
+
+        nl = list(TarUrl.real_files(tar_index(url.fspath)))
+
+        tf = url.target_file
+        ts = url.target_segment
+
+        if tf:
+
+            if tf.startswith('*'):
+                # Common user error using a glob instead of a regex
+                tf = tf.replace('*', '.*')
+
+            names = [e for e in nl if re.search(tf, e)]
+
+            if names:
+                return names[0]
+
+        if ts:
+            try:
+                return nl[int(ts)]
+            except (IndexError, ValueError):
+                pass
+
+        if not tf and not ts and nl:
+            return nl[0]
+
+        raise TarUrlError("Could not find file in tar {} for target='{}' nor segment='{}'"
+                          .format(url.fspath, url.target_file, url.target_segment))
+
+    @classmethod
+    def _match(cls, url, **kwargs):
+
+        return url.resource_format in ('tar', 'tgz', 'tbz2', 'txz') or is_tar_name(url.resource_file)
@@ -3,7 +3,9 @@
 
 """ """
 
-from rowgenerators.appurl.file.file import FileUrl
+from functools import lru_cache
+
+from rowgenerators.appurl.archive.base import ArchiveUrl
 from rowgenerators.exceptions import AppUrlError
 
 
@@ -11,18 +13,29 @@ class ZipUrlError(AppUrlError):
     pass
 
 
-class ZipUrl(FileUrl):
-    """Zip URLS represent a zip file, as a local resource. """
+@lru_cache(maxsize=16)
+def _cached_zip_file(path, mtime_ns, size):
+    from zipfile import ZipFile
+
+    return ZipFile(path)
 
-    match_priority = FileUrl.match_priority - 10
 
-    def __init__(self, url=None, downloader=None, **kwargs):
+def zip_file(path):
+    """Return a ZipFile for an archive. The ZipFile is cached, so the central directory is read once for
+    each version of the archive, rather than on every call to list(), get_target() or get_file_from_zip().
+    Members can be opened from several threads at once."""
+    import os
 
-        super().__init__(url, downloader=downloader, **kwargs)
+    path = str(path)
+    st = os.stat(path)
 
-        if self.resource_format != 'zip':
-            self.resource_format = 'zip'
+    return _cached_zip_file(path, st.st_mtime_ns, st.st_size)
+
+
+class ZipUrl(ArchiveUrl):
+    """Zip URLS represent a zip file, as a local resource. """
 
+    archive_format = 'zip'
 
     @property
     def target_file(self):
@@ -49,120 +62,26 @@ class ZipUrl(FileUrl):
     def target_file(self, v):
         self._parts['target_file'] = v
 
-    def join_target(self, tf):
-        """
-        Joins the target ``tf`` by setting the value of the first slot of the fragment.
+    # Directory that files will be extracted to
+    zip_dir = ArchiveUrl.archive_dir
 
-        :param tf:
-        :return: a clone of this url with a new fragment.
-        """
-        u = self.clone()
+    def _zip_file(self):
+        from zipfile import BadZipFile
 
         try:
-            u.target_file = str(tf.path)
-        except AttributeError:
-            u.target_file = tf
-
-        return u
-
-    def get_resource(self):
-        return self
-
-    @property
-    def zip_dir(self):
-        """Directory that files will be extracted to"""
-
-        from os.path import abspath
-
-        cache_dir = self.downloader.cache.getsyspath('/')
-        target_path = abspath(self.fspath)
-
-        if target_path.startswith(cache_dir):  # Case when file is already in cache
-            return str(self.fspath) + '_d'
-        else:  # file is not in cache; it may exist elsewhere.
-            return self.downloader.cache.getsyspath(target_path.lstrip('/'))+'_d'
-
-    def get_target(self):
-        """
-        Extract the target file from the archive, store it in the cache, and return a file Url to the
-        cached file.
-
-        """
-
-        from rowgenerators.appurl.url import parse_app_url
-        from zipfile import ZipFile, BadZipFile
-        from rowgenerators.appurl.util import copy_file_or_flo, ensure_dir
-        from pathlib import Path
-        from time import time
-
-
-        assert self.zip_dir
-
-        try:
-            zf = ZipFile(str(self.fspath))
+            return zip_file(self.fspath)
         except BadZipFile:
             raise ZipUrlError(f"Not a zip file: {str(self.fspath)} for url {str(self)}")
 
-        self.target_file = ZipUrl.get_file_from_zip(self)
-
-        target_path = Path(self.zip_dir).joinpath(self.target_file)
-        ensure_dir(target_path.parent)
-
-        def age(p):
-            """File age in minutes"""
-            try:
-                return (time() - p.stat().st_mtime) / 60
-            except:
-                print("XXXX", p, p.exists())
-                raise
-
-        # Unpack the file if it dos not exist, or if the zile file is newer
-        if not target_path.exists() or age(target_path) > age(Path(self.fspath)):
-            with target_path.open('wb') as f, zf.open(self.target_file) as flo:
-                copy_file_or_flo(flo, f)
-            disp = 'copied'
-        else:
-            disp = 'extant'
-
-        fq = self.frag_dict
-
-        if 'resource_format' in fq:
-            del fq['resource_format']
-
-        if 'resource_file' in fq:
-            del fq['resource_file']
+    def get_member_name(self):
+        self._zip_file()
+        return ZipUrl.get_file_from_zip(self)
 
-        if 'target_file' in fq:
-            del fq['target_file']
+    def member_names(self):
+        return ZipUrl.real_files_in_zf(self._zip_file())
 
-        tu =  parse_app_url(str(target_path),
-                             scheme_extension=self.scheme_extension,
-                             downloader=self.downloader,
-                             **fq
-                             )
-
-        if self.target_format != tu.target_format:
-
-            try:
-                tu.target_format = self.target_format
-            except AttributeError:
-                pass # Some URLS don't allow resetting target type.
-
-        tu._disp = disp
-
-        return tu
-
-    def list(self):
-        """List the files in the referenced Zip file"""
-
-        from zipfile import ZipFile
-
-
-        if self.target_file:
-            return list(self.set_target_segment(tl.target_segment) for tl in self.get_target().list())
-        else:
-            real_files = ZipUrl.real_files_in_zf(ZipFile(str(self.fspath)))
-            return list(self.set_target_file(rf) for rf in real_files)
+    def open_member(self, name):
+        return self._zip_file().open(name)
 
     @staticmethod
     def get_file_from_zip(url):
@@ -170,12 +89,12 @@ class ZipUrl(FileUrl):
         from a zip archive"""
 
         from rowgenerators.exceptions import AppUrlError
-        from zipfile import ZipFile, BadZipFile
+        from zipfile import BadZipFile
         import re
 
         names = []
         try:
-            zf = ZipFile(str(url.fspath))
+            zf = zip_file(url.fspath)
         except BadZipFile:
             raise AppUrlError(f"Bad zip file: '{str(url.fspath)}' ")
 
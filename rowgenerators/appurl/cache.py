@@ -0,0 +1,484 @@
+# Copyright (c) 2017 Civic Knowledge. This file is licensed under the terms of the
+# MIT License, included in this distribution as LICENSE.txt
+
+"""
+Persistent index of the files in a download cache.
+
+The index is an SQLite database in the root of the cache. It records the size, last access time,
+source URL and content hash of every file the Downloader writes, and keeps a running total of the
+size of the cache, so the cache can be held to a byte budget by evicting the least recently used
+files, without walking the cache directory. It also holds the HTTP validators used to revalidate
+cached files.
+
+The BlobStore is an optional content addressed store under the cache. Files with the same
+contents, such as the same file mirrored at different URLs, or the same member extracted from
+different archives, are hard links to a single blob, so they are only stored once.
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+
+INDEX_NAME = '_cache_index.sqlite'
+
+# Names in the cache root that are part of the index, not cached resources.
+INDEX_FILES = (INDEX_NAME, INDEX_NAME + '-wal', INDEX_NAME + '-shm', INDEX_NAME + '-journal')
+
+# Directory in the cache root that holds the BlobStore
+BLOB_DIR = '_blobs'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    url TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    hash TEXT,
+    created REAL,
+    accessed REAL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE TABLE IF NOT EXISTS validators (
+    path TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT
+);
+CREATE TABLE IF NOT EXISTS totals (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    size INTEGER NOT NULL,
+    count INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO totals VALUES (0, 0, 0);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE totals SET size = size + new.size, count = count + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE totals SET size = size - old.size, count = count - 1;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+    UPDATE totals SET size = size - old.size + new.size;
+END;
+"""
+
+
+class HashingWriter(object):
+    """Wrap a binary file opened for writing, to compute the size and hash of the data as it is
+    written, so the file doesn't have to be read again to index it."""
+
+    def __init__(self, f, algorithm='sha256'):
+        self._f = f
+        self._hash = hashlib.new(algorithm)
+        self.size = 0
+
+    def write(self, b):
+        self.update(b)
+        return self._f.write(b)
+
+    def update(self, b):
+        """Add bytes to the hash and size without writing them, for data already in the file"""
+        self._hash.update(b)
+        self.size += len(b)
+
+    @property
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def __getattr__(self, item):
+        return getattr(self._f, item)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._f.close()
+
+
+def hash_file(path, algorithm='sha256', block_size=1024 * 1024):
+    """Return the hex digest of the contents of a file"""
+
+    h = hashlib.new(algorithm)
+
+    with open(path, 'rb') as f:
+        for b in iter(lambda: f.read(block_size), b''):
+            h.update(b)
+
+    return h.hexdigest()
+
+
+class BlobStore(object):
+    """Content addressed storage for files in a cache. Each distinct content is stored once, as a
+    blob named for its sha256 hash, and files in the cache with that content are hard links to the
+    blob. The files keep their own paths, so readers don't need to know about the store.
+
+    A blob is deleted when the last file that links to it is, which the store detects from the
+    blob's link count. If the filesystem does not support hard links, files are left as they are.
+
+    :param cache: A PyFs filesystem object, the cache. It must have sys paths.
+    """
+
+    def __init__(self, cache):
+        from os.path import join
+
+        self.cache = cache
+        self.root = join(cache.getsyspath('/'), BLOB_DIR)
+
+    def blob_path(self, hash):
+        """Return the sys path of the blob for a hash"""
+        from os.path import join
+
+        return join(self.root, hash[:2], hash)
+
+    def has(self, hash):
+        from os.path import exists
+
+        return exists(self.blob_path(hash))
+
+    def link(self, path, hash=None):
+        """Store a file in the blob store. If there is already a blob with the same contents, the
+        file is replaced with a link to the blob; otherwise, the file becomes the blob.
+
+        :param path: Sys path of the file
+        :param hash: sha256 hex digest of the file. If None, it is computed from the file.
+        :return: True if the file was replaced with a link to an existing blob
+        """
+        import os
+
+        hash = hash or hash_file(path)
+        blob_path = self.blob_path(hash)
+
+        os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+
+        try:
+            os.link(path, blob_path)
+            return False
+        except FileExistsError:
+            pass
+        except OSError:
+            return False  # Links are not supported, or the file is on another device
+
+        if os.path.samefile(path, blob_path):
+            return False
+
+        # Replace the file atomically, so readers see either the old file or the link
+        tmp_path = path + '.link'
+
+        try:
+            os.link(blob_path, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            return False
+
+        # The link has the modification time of the blob, which is shared by all of the links to it,
+        # so it must not be changed here. Callers that need to know when a file was stored must
+        # record it elsewhere. See ArchiveUrl._is_extracted()
+
+        return True
+
+    def release(self, hash):
+        """Delete the blob for a hash, if no file in the cache links to it any more"""
+        import os
+
+        blob_path = self.blob_path(hash)
+
+        try:
+            if os.stat(blob_path).st_nlink <= 1:
+                os.remove(blob_path)
+        except FileNotFoundError:
+            pass
+
+    def collect(self):
+        """Delete all of the blobs that no file links to, such as the blobs for files that were
+        deleted without being released.
+
+        :return: The number of blobs deleted
+        """
+        import os
+
+        n = 0
+
+        for dir_path, _, names in os.walk(self.root):
+            for name in names:
+                p = os.path.join(dir_path, name)
+                if os.stat(p).st_nlink <= 1:
+                    os.remove(p)
+                    n += 1
+
+        return n
+
+    @property
+    def size(self):
+        """Total size of the blobs, in bytes, which is the storage used by the deduplicated files"""
+        import os
+
+        return sum(os.path.getsize(os.path.join(dp, n)) for dp, _, names in os.walk(self.root) for n in names)
+
+
+class CacheIndex(object):
+    """Index of the files in a pyfilesystem cache, with size accounting and LRU eviction.
+
+    :param cache: A PyFs filesystem object, the cache to index
+    :param max_size: Budget for the total size of the indexed files, in bytes. If set, adding a file
+        evicts the least recently used files until the total is under the budget.
+    :param blobs: Optional BlobStore that the indexed files are linked into. Blobs are released
+        when the files that link to them are deleted or replaced.
+    """
+
+    def __init__(self, cache, max_size=None, blobs=None):
+        from fs.errors import NoSysPath
+
+        self.cache = cache
+        self.max_size = max_size
+        self.blobs = blobs
+
+        try:
+            self.db_path = cache.getsyspath(INDEX_NAME)
+        except NoSysPath:
+            # Caches without sys paths, like mem:, are only used in one process.
+            self.db_path = ':memory:'
+
+        self._lock = threading.RLock()
+        self._connection = None
+
+    @property
+    def connection(self):
+
+        with self._lock:
+            if self._connection is None:
+                c = sqlite3.connect(self.db_path, timeout=60, check_same_thread=False,
+                                    isolation_level=None)
+                if self.db_path != ':memory:':
+                    c.execute('PRAGMA journal_mode=WAL')
+                c.executescript(SCHEMA)
+                self._connection = c
+
+            return self._connection
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    @staticmethod
+    def _key(path):
+        """Normalize a path in the cache, so 'a/b' and '/a/b' are the same entry"""
+        from fs.path import normpath
+
+        return normpath(path).lstrip('/')
+
+    def _execute(self, sql, args=()):
+        with self._lock:
+            return self.connection.execute(sql, args)
+
+    def add(self, path, url=None, size=None, hash=None):
+        """Record a file that has been written to the cache, then evict files if the cache is
+        over budget.
+
+        :param path: Path of the file in the cache
+        :param url: Source URL of the file
+        :param size: Size in bytes. If None, it is read from the cache filesystem.
+        :param hash: Hex digest of the contents
+        """
+
+        path = self._key(path)
+
+        if size is None:
+            size = self.cache.getsize(path)
+
+        now = time.time()
+
+        old = self.get(path)
+
+        self._execute("""INSERT INTO entries (path, url, size, hash, created, accessed)
+                         VALUES (?, ?, ?, ?, ?, ?)
+                         ON CONFLICT(path) DO UPDATE SET url=excluded.url, size=excluded.size,
+                         hash=excluded.hash, created=excluded.created, accessed=excluded.accessed""",
+                      (path, url, size, hash, now, now))
+
+        if self.blobs is not None and old and old['hash'] and old['hash'] != hash:
+            self.blobs.release(old['hash'])
+
+        self.evict(protect=(path,))
+
+    def touch(self, path, url=None):
+        """Record an access to a file. Files that are in the cache but not in the index, such as
+        ones written before the index existed, are added."""
+
+        path = self._key(path)
+
+        cur = self._execute("UPDATE entries SET accessed = ? WHERE path = ?", (time.time(), path))
+
+        if cur.rowcount == 0 and self.cache.exists(path):
+            self.add(path, url)
+
+    def remove(self, path):
+        """Remove a file from the index. Does not delete the file"""
+        path = self._key(path)
+
+        with self._lock:
+            self._execute("DELETE FROM entries WHERE path = ?", (path,))
+            self._execute("DELETE FROM validators WHERE path = ?", (path,))
+
+    def set_validators(self, path, etag=None, last_modified=None):
+        """Store the HTTP ETag and Last-Modified headers from the response a file was downloaded from"""
+
+        path = self._key(path)
+
+        if etag is None and last_modified is None:
+            self._execute("DELETE FROM validators WHERE path = ?", (path,))
+        else:
+            self._execute("INSERT OR REPLACE INTO validators (path, etag, last_modified) VALUES (?, ?, ?)",
+                          (path, etag, last_modified))
+
+    def get_validators(self, path):
+        """Return the stored (etag, last_modified) for a path, with None for missing values"""
+
+        row = self._execute("SELECT etag, last_modified FROM validators WHERE path = ?",
+                            (self._key(path),)).fetchone()
+
+        return tuple(row) if row is not None else (None, None)
+
+    def move_validators(self, src, dst):
+        """Move the validators for a file that has been moved in the cache"""
+
+        with self._lock:
+            self.set_validators(dst, *self.get_validators(src))
+            self.set_validators(src)
+
+    def conditional_headers(self, path):
+        """Return the HTTP headers for a conditional GET request for a cached file, or an
+        empty dict if there are no validators for it"""
+
+        etag, last_modified = self.get_validators(path)
+
+        headers = {}
+
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+        return headers
+
+    def get(self, path):
+        """Return the index entry for a path, as a dict, or None"""
+
+        cur = self._execute("SELECT path, url, size, hash, created, accessed FROM entries WHERE path = ?",
+                            (self._key(path),))
+        row = cur.fetchone()
+
+        if row is None:
+            return None
+
+        return dict(zip(('path', 'url', 'size', 'hash', 'created', 'accessed'), row))
+
+    @property
+    def total_size(self):
+        """Total size of the indexed files, in bytes"""
+        return self._execute("SELECT size FROM totals").fetchone()[0]
+
+    def __len__(self):
+        return self._execute("SELECT count FROM totals").fetchone()[0]
+
+    def _delete(self, paths):
+        """Delete files from the cache and the index"""
+        from fs.errors import ResourceNotFound
+
+        for path in paths:
+            entry = self.get(path) if self.blobs is not None else None
+
+            try:
+                self.cache.remove(path)
+            except ResourceNotFound:
+                pass
+
+            self.remove(path)
+
+            if entry and entry['hash']:
+                self.blobs.release(entry['hash'])
+
+    def evict(self, max_size=None, protect=()):
+        """Delete the least recently used files until the total size is at most max_size.
+
+        :param max_size: Budget in bytes. Defaults to the max_size of the index; if both are None,
+            nothing is evicted.
+        :param protect: Paths that must not be evicted
+        :return: List of the paths that were deleted
+        """
+
+        max_size = max_size if max_size is not None else self.max_size
+
+        if max_size is None:
+            return []
+
+        evicted = []
+
+        with self._lock:
+            while self.total_size > max_size:
+
+                excess = self.total_size - max_size
+
+                rows = self._execute("SELECT path, size FROM entries ORDER BY accessed LIMIT 100").fetchall()
+
+                batch = []
+                for path, size in rows:
+                    if path in protect:
+                        continue
+
+                    batch.append(path)
+                    excess -= size
+
+                    if excess <= 0:
+                        break
+
+                if not batch:
+                    break
+
+                self._delete(batch)
+                evicted.extend(batch)
+
+        return evicted
+
+    def expire(self, max_age):
+        """Delete files that were added to the cache more than max_age seconds ago
+
+        :return: List of the paths that were deleted
+        """
+
+        paths = [r[0] for r in
+                 self._execute("SELECT path FROM entries WHERE created < ?", (time.time() - max_age,))]
+
+        self._delete(paths)
+
+        return paths
+
+    def clear(self):
+        """Delete all of the indexed files"""
+        paths = [r[0] for r in self._execute("SELECT path FROM entries")]
+        self._delete(paths)
+        return paths
+
+    def rebuild(self):
+        """Index the files in the cache that are not indexed yet, and remove entries for files
+        that no longer exist. This walks the whole cache, so it should only be needed once, to
+        index a cache that was created before the index was."""
+
+        indexed = {r[0] for r in self._execute("SELECT path FROM entries")}
+
+        found = set()
+
+        for path, info in self.cache.walk.info(namespaces=['details']):
+
+            path = self._key(path)
+
+            if info.is_dir or path in INDEX_FILES or path.startswith(BLOB_DIR + '/') or \
+                    path.endswith(('.lock', '.stream', '.partial', '.link')):
+                continue
+
+            found.add(path)
+
+            if path not in indexed:
+                self.add(path, size=info.size)
+
+        for path in indexed - found:
+            self.remove(path)
@@ -10,7 +10,7 @@ CLI program for managing Metatab files
 
 def appurl():
     import sys
-    from pkg_resources import iter_entry_points
+    from rowgenerators.registry import get_registry, URL_GROUP
     from tabulate import tabulate
     from rowgenerators.appurl import parse_app_url
 
@@ -30,10 +30,10 @@ def appurl():
     args = parser.parse_args(sys.argv[1:])
 
     entries = []
-    for ep in iter_entry_points('appurl.urls'):
+    for e in get_registry(URL_GROUP).entries:
         try:
-            c = ep.load()
-            entries.append([c.match_priority, ep.name, ep.module_name,  c.__name__, ])
+            c = e.load()
+            entries.append([c.match_priority, e.name, e.module,  c.__name__, ])
         except ModuleNotFoundError as e:
             print(e)
 
@@ -45,3 +45,159 @@ def md5(fname):
 
 
 
+
+class LocalWebServer(object):
+    """Serve a directory over HTTP on localhost, from a background thread, for
+    tests of the downloader that shouldn't depend on the network.
+
+        with LocalWebServer(data_path('')) as server:
+            url = server.url('sources.csv')
+
+    The request headers for each request are appended to ``requests``. Files are served with an
+    ETag, made from the modification time and size, and conditional requests with If-None-Match
+    or If-Modified-Since get 304 responses. Requests with a 'Range: bytes=N-' header get the
+    rest of the file from N, if the If-Range header, if any, matches.
+
+    Set ``fail_after`` to a number of bytes to drop the connection after sending that much of
+    the next response body, and put status codes in ``errors`` to respond with those before
+    serving files normally. Connections are kept alive, and the client address of each
+    connection is added to ``connections``.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.requests = []
+        self.connections = set()
+        self.errors = []
+        self.fail_after = None
+        self._httpd = None
+        self._thread = None
+
+    def handler_class(self):
+        import functools
+        from http.server import SimpleHTTPRequestHandler
+
+        server = self
+
+        class Handler(SimpleHTTPRequestHandler):
+
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _etag(self):
+                import os
+
+                path = self.translate_path(self.path)
+
+                if not os.path.isfile(path):
+                    return None
+
+                st = os.stat(path)
+                return '"{:x}-{:x}"'.format(st.st_mtime_ns, st.st_size)
+
+            def send_head(self):
+                server.requests.append((self.command, self.path, dict(self.headers)))
+                server.connections.add(self.client_address)
+
+                if server.errors:
+                    self.send_error(server.errors.pop(0))
+                    return None
+
+                etag = self._etag()
+
+                if etag and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return None
+
+                if etag and self.headers.get('Range', '').startswith('bytes=') and self._if_range(etag):
+                    return self._send_range()
+
+                return super().send_head()
+
+            def _if_range(self, etag):
+                import os
+                from email.utils import formatdate
+
+                if_range = self.headers.get('If-Range')
+                mtime = os.stat(self.translate_path(self.path)).st_mtime
+
+                return if_range is None or if_range in (etag, formatdate(mtime, usegmt=True))
+
+            def _send_range(self):
+                import os
+                from email.utils import formatdate
+
+                path = self.translate_path(self.path)
+                start, end = self.headers['Range'][len('bytes='):].split('-')
+
+                f = open(path, 'rb')
+                st = os.fstat(f.fileno())
+
+                start = int(start)
+                end = min(int(end), st.st_size - 1) if end else st.st_size - 1
+
+                if start >= st.st_size:
+                    f.close()
+                    self.send_error(416)
+                    return None
+
+                f.seek(start)
+
+                self.send_response(206)
+                self.send_header('Content-type', self.guess_type(path))
+                self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, st.st_size))
+                self.send_header('Content-Length', str(end - start + 1))
+                self.send_header('Last-Modified', formatdate(st.st_mtime, usegmt=True))
+                self.end_headers()
+
+                self._remaining = end - start + 1
+
+                return f
+
+            def copyfile(self, source, outputfile):
+                import io
+
+                remaining = getattr(self, '_remaining', None)
+
+                if remaining is not None:
+                    source = io.BytesIO(source.read(remaining))
+                    self._remaining = None
+
+                if server.fail_after is None:
+                    return super().copyfile(source, outputfile)
+
+                outputfile.write(source.read(server.fail_after))
+                server.fail_after = None
+                self.close_connection = True
+
+            def send_header(self, keyword, value):
+                super().send_header(keyword, value)
+
+                # The base class sends Last-Modified for files
+                if keyword == 'Last-Modified':
+                    super().send_header('ETag', self._etag())
+                    super().send_header('Accept-Ranges', 'bytes')
+
+        return functools.partial(Handler, directory=self.directory)
+
+    def url(self, path):
+        return 'http://127.0.0.1:{}/{}'.format(self._httpd.server_address[1], path.lstrip('/'))
+
+    def __enter__(self):
+        import threading
+        from http.server import ThreadingHTTPServer
+
+        self._httpd = ThreadingHTTPServer(('127.0.0.1', 0), self.handler_class())
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
@@ -85,6 +85,32 @@ class BasicTests(unittest.TestCase):
         self.assertIn('ExcelFileUrl', eps)
         self.assertIn('WebUrl', eps)
 
+    def test_entry_point_registry(self):
+        from pkg_resources import iter_entry_points
+        from rowgenerators.appurl.url import match_url_classes
+        from rowgenerators.registry import get_registry, refresh, URL_GROUP
+
+        urls = ['http://example.com/foo.csv', 'https://example.com/foo.zip#bar.xlsx;2',
+                'file:/tmp/foo.xls', '/tmp/foo.dta', 'program+file:foo.py', 'gs:1qjjtkMqpxtk#2038675149',
+                'https://docs.google.com/spreadsheets/d/1qjjtkMqpxtk/edit', 's3://bucket/foo.csv',
+                'socrata+http://example.com/data', 'python:foo.bar', 'foo.h5', 'ftp://example.com/foo.tsv']
+
+        for us in urls:
+            # Compare with a scan of all of the entry points
+            u = Url(us, downloader=None)
+            expected = sorted([ep.load() for ep in iter_entry_points(group='appurl.urls')
+                               if u._match_entry_point(ep.name)], key=lambda cls: cls.match_priority)
+
+            self.assertEqual(expected, match_url_classes(us), us)
+
+        r = get_registry(URL_GROUP)
+        entries = r.entries
+        self.assertIs(entries, get_registry(URL_GROUP).entries)
+
+        refresh()
+        self.assertIsNot(entries, r.entries)
+        self.assertEqual([e.name for e in entries], [e.name for e in r.entries])
+
 
     def test_download(self):
         """Test all three stages of a collection of downloadable URLS"""
@@ -117,6 +143,733 @@ class BasicTests(unittest.TestCase):
                 self.assertEqual(e['target_format'], t.target_format, e['name'])
                 self.assertTrue(exists(t.fspath))
 
+    def test_streaming_download(self):
+        """Parse a CSV file from a web server while it downloads into the cache"""
+        import csv
+        from tempfile import TemporaryDirectory
+        from rowgenerators.appurl.test.support import LocalWebServer, cache_fs
+
+        with TemporaryDirectory() as d:
+
+            rows = [['id', 'name', 'value']] + [[str(i), 'name-{}'.format(i), str(i * 1.5)] for i in range(20000)]
+
+            with open(os.path.join(d, 'stream.csv'), 'w', newline='') as f:
+                csv.writer(f).writerows(rows)
+
+            with LocalWebServer(d) as server:
+
+                dldr = Downloader(cache=cache_fs(), streaming=True)
+
+                u = parse_app_url(server.url('stream.csv'), downloader=dldr)
+                cache_path = dldr.cache_path(u.resource_url)
+
+                # Closing the generator early discards the partial file
+                g = iter(u.generator)
+                self.assertEqual(rows[0], next(g))
+                self.assertEqual(rows[1], next(g))
+                self.assertFalse(dldr.cache.exists(cache_path))
+                g.close()
+                self.assertFalse(dldr.cache.exists(cache_path))
+                self.assertFalse(dldr.cache.exists(cache_path + '.stream'))
+
+                self.assertEqual(rows, list(u.generator))
+                self.assertTrue(dldr.cache.exists(cache_path))
+                self.assertEqual(2, len(server.requests))
+
+                # Later runs read the cache
+                self.assertEqual(rows, list(parse_app_url(server.url('stream.csv'), downloader=dldr).generator))
+                self.assertEqual(2, len(server.requests))
+
+                # Reading the headers while iterating opens the resource again, which downloads it rather
+                # than waiting for the stream that is being iterated
+                dldr = Downloader(cache=cache_fs(), streaming=True)
+
+                g = parse_app_url(server.url('stream.csv'), downloader=dldr).generator
+                itr = iter(g)
+                self.assertEqual(rows[:2], [next(itr), next(itr)])
+
+                self.assertEqual(rows[0], g.headers)
+                self.assertTrue(dldr.cache.exists(cache_path))
+
+                self.assertEqual(rows[2:], list(itr))
+                self.assertEqual(4, len(server.requests))
+                self.assertEqual(set(), dldr._streams)
+
+    def test_prefetch(self):
+        """Download several resources at once, with duplicates and failures"""
+        from tempfile import TemporaryDirectory
+        from rowgenerators.appurl.test.support import LocalWebServer, cache_fs
+        from rowgenerators.exceptions import DownloadError
+
+        with TemporaryDirectory() as d:
+
+            names = ['file{}.csv'.format(i) for i in range(10)]
+
+            for name in names:
+                with open(os.path.join(d, name), 'w') as f:
+                    f.write('a,b\n{},2\n'.format(name))
+
+            with LocalWebServer(d) as server:
+
+                dldr = Downloader(cache=cache_fs())
+
+                urls = [server.url(n) for n in names] + [server.url(names[0]), server.url('missing.csv')]
+                urls.append(parse_app_url(server.url(names[1]), downloader=dldr))
+
+                results = dldr.prefetch(urls, max_workers=4)
+
+                self.assertEqual(len(urls), len(results))
+                self.assertEqual(urls, [r.url for r in results])
+
+                for name, r in zip(names + [names[0]], results):
+                    self.assertIsNone(r.error)
+                    with open(r.sys_path) as f:
+                        self.assertIn(name, f.read())
+
+                self.assertIsInstance(results[-2].error, DownloadError)
+                self.assertIsNone(results[-2].sys_path)
+                self.assertEqual(results[1].sys_path, results[-1].sys_path)
+
+                fetched = [p for m, p, h in server.requests if p != '/missing.csv']
+                self.assertEqual(sorted('/' + n for n in names), sorted(fetched))
+
+                # Everything is cached now
+                dldr.prefetch(urls[:-3])
+                self.assertEqual(len(fetched), len([p for m, p, h in server.requests if p != '/missing.csv']))
+
+    def test_cache_index(self):
+        """Record downloads in the cache index and evict the least recently used files"""
+        import hashlib
+        from tempfile import TemporaryDirectory
+        from rowgenerators.appurl.cache import CacheIndex
+        from rowgenerators.appurl.test.support import LocalWebServer, cache_fs
+
+        with TemporaryDirectory() as d:
+
+            contents = {}
+            for i in range(4):
+                contents['file{}.csv'.format(i)] = ('a,b\n' + '{},2\n'.format(i) * 250).encode('ascii')
+
+            for name, data in contents.items():
+                with open(os.path.join(d, name), 'wb') as f:
+                    f.write(data)
+
+            size = len(contents['file0.csv'])
+
+            with LocalWebServer(d) as server:
+
+                cache = cache_fs()
+                dldr = Downloader(cache=cache, max_cache_size=size * 3)
+
+                def get(name):
+                    return dldr.download(parse_app_url(server.url(name))).cache_path
+
+                paths = {name: get(name) for name in ['file0.csv', 'file1.csv', 'file2.csv']}
+
+                self.assertEqual(3, len(dldr.index))
+                self.assertEqual(size * 3, dldr.index.total_size)
+
+                e = dldr.index.get(paths['file1.csv'])
+                self.assertEqual(server.url('file1.csv'), e['url'])
+                self.assertEqual(hashlib.sha256(contents['file1.csv']).hexdigest(), e['hash'])
+
+                get('file0.csv')  # Now file1.csv is the least recently used
+                paths['file3.csv'] = get('file3.csv')
+
+                self.assertFalse(cache.exists(paths['file1.csv']))
+                self.assertIsNone(dldr.index.get(paths['file1.csv']))
+                for name in ['file0.csv', 'file2.csv', 'file3.csv']:
+                    self.assertTrue(cache.exists(paths[name]))
+
+                self.assertEqual(size * 3, dldr.index.total_size)
+
+                # A new index on the same cache sees the same entries
+                idx = CacheIndex(cache)
+                self.assertEqual(3, len(idx))
+                self.assertEqual([], idx.evict(size * 3))
+                self.assertEqual(2, len(idx.evict(size)))
+                self.assertEqual(size, idx.total_size)
+
+                idx.remove(paths['file3.csv'])
+                idx.rebuild()
+                self.assertEqual(1, len(idx))
+
+    def test_clean_cache(self):
+        """Clean files the cache index doesn't track, as well as the ones it does"""
+        from tempfile import TemporaryDirectory
+        from zipfile import ZipFile
+        from rowgenerators.appurl.cache import CacheIndex
+        from rowgenerators.appurl.util import clean_cache
+        from rowgenerators.appurl.test.support import cache_fs
+
+        with TemporaryDirectory() as d:
+
+            with ZipFile(os.path.join(d, 'a.zip'), 'w') as zf:
+                zf.writestr('x.csv', 'a,b\n1,2\n')
+
+            cache = cache_fs()
+            dldr = Downloader(cache=cache)
+
+            member = parse_app_url(os.path.join(d, 'a.zip') + '#x.csv', downloader=dldr).get_target()
+            member_dir = dirname(str(member.fspath))
+
+            index = CacheIndex(cache)
+
+            cache.makedirs('web/host')
+            for name in ('indexed.csv', 'new.csv', 'old.csv', 'old.csv.lock', 'old.csv.partial'):
+                cache.writetext('web/host/' + name, 'a,b\n')
+
+            index.add('web/host/indexed.csv')
+
+            # Age everything but new.csv, including the extracted member, its stamp and directories
+            day_ago = os.path.getmtime(cache.getsyspath('web/host/new.csv')) - 60 * 60 * 25
+
+            for p in [member_dir, dirname(member_dir), str(member.fspath),
+                      os.path.join(member_dir, '.x.csv.archive')] + \
+                     [cache.getsyspath('web/host/' + n)
+                      for n in ('indexed.csv', 'old.csv', 'old.csv.lock', 'old.csv.partial')]:
+                self.assertTrue(os.path.exists(p), p)
+                os.utime(p, (day_ago, day_ago))
+
+            clean_cache(cache)
+
+            # The index decides for the files it tracks; it recorded indexed.csv as added just now
+            self.assertTrue(cache.exists('web/host/indexed.csv'))
+            self.assertTrue(cache.exists('web/host/new.csv'))
+
+            for name in ('old.csv', 'old.csv.lock', 'old.csv.partial'):
+                self.assertFalse(cache.exists('web/host/' + name), name)
+
+            # The extraction directory is removed with the member
+            self.assertFalse(os.path.exists(member_dir))
+            self.assertFalse(os.path.exists(dirname(member_dir)))
+
+            index.expire(0)
+            self.assertFalse(cache.exists('web/host/indexed.csv'))
+
+    def test_revalidate(self):
+        """Revalidate cached files with conditional requests"""
+        from tempfile import TemporaryDirectory
+        from rowgenerators.appurl.test.support import LocalWebServer, cache_fs
+
+        with TemporaryDirectory() as d:
+
+            path = os.path.join(d, 'file.csv')
+
+            with open(path, 'w') as f:
+                f.write('a,b\n1,2\n')
+
+            with LocalWebServer(d) as server:
+
+                cache = cache_fs()
+                u = parse_app_url(server.url('file.csv'))
+
+                r = Downloader(cache=cache).download(u)
+                self.assertIsNotNone(r.download_time)
+
+                # Without revalidation, the server isn't contacted
+                r = Downloader(cache=cache).download(u)
+                self.assertIsNone(r.download_time)
+                self.assertEqual(1, len(server.requests))
+
+                dldr = Downloader(cache=cache, revalidate=True)
+
+                r = dldr.download(u)
+                self.assertIsNone(r.download_time)
+                self.assertEqual(2, len(server.requests))
+                self.assertIn('If-None-Match', server.requests[-1][2])
+                self.assertIn('If-Modified-Since', server.requests[-1][2])
+
+                with open(path, 'w') as f:
+                    f.write('a,b\n3,4\n')
+                os.utime(path, (0, 0))
+
+                r = dldr.download(u)
+                self.assertIsNotNone(r.download_time)
+                with open(r.sys_path) as f:
+                    self.assertEqual('a,b\n3,4\n', f.read())
+
+                # A failed revalidation leaves the cached file
+                os.remove(path)
+                with self.assertRaises(Exception):
+                    dldr.download(u)
+                self.assertTrue(cache.exists(r.cache_path))
+                self.assertFalse(cache.exists(r.cache_path + '.partial'))
+
+    def test_resume_download(self):
+        """Resume failed downloads with Range requests"""
+        import hashlib
+        from tempfile import TemporaryDirectory
+        from rowgenerators.appurl.test.support import LocalWebServer, cache_fs
+
+        with TemporaryDirectory() as d:
+
+            path = os.path.join(d, 'file.csv')
+
+            data = ''.join('{},{}\n'.format(i, i * i) for i in range(50000)).encode('ascii')
+
+            with open(path, 'wb') as f:
+                f.write(data)
+
+            with LocalWebServer(d) as server:
+
+                dldr = Downloader(cache=cache_fs())
+                u = parse_app_url(server.url('file.csv'))
+                partial_path = dldr.cache_path(u.resource_url) + '.partial'
+
+                server.fail_after = 100000
+
+                with self.assertRaises(Exception):
+                    dldr.download(u)
+
+                self.assertEqual(100000, dldr.cache.getsize(partial_path))
+
+                r = dldr.download(u)
+
+                self.assertEqual('bytes=100000-', server.requests[-1][2].get('Range'))
+                self.assertFalse(dldr.cache.exists(partial_path))
+
+                with open(r.sys_path, 'rb') as f:
+                    self.assertEqual(data, f.read())
+
+                self.assertEqual(hashlib.sha256(data).hexdigest(), dldr.index.get(r.cache_path)['hash'])
+
+                # If the file changes, the partial file is discarded
+                dldr = Downloader(cache=cache_fs())
+                server.fail_after = 100000
+
+                with self.assertRaises(Exception):
+                    dldr.download(u)
+
+                data = data.replace(b'\n', b'\r\n')
+                with open(path, 'wb') as f:
+                    f.write(data)
+                os.utime(path, (0, 0))
+
+                r = dldr.download(u)
+
+                self.assertEqual('bytes=100000-', server.requests[-1][2].get('Range'))
+
+                with open(r.sys_path, 'rb') as f:
+                    self.assertEqual(data, f.read())
+
+    def test_segmented_download(self):
+        """Download byte ranges of a file concurrently"""
+        import hashlib
+        from tempfile import TemporaryDirectory
+        from rowgenerators.appurl.test.support import LocalWebServer, cache_fs
+
+        with TemporaryDirectory() as d:
+
+            data = ''.join('{},{}\n'.format(i, i * i) for i in range(50000)).encode('ascii')
+
+            with open(os.path.join(d, 'file.csv'), 'wb') as f:
+                f.write(data)
+
+            with LocalWebServer(d) as server:
+
+                dldr = Downloader(cache=cache_fs(), segments=4, segment_size=len(data) // 10)
+
+                r = dldr.download(parse_app_url(server.url('file.csv')))
+
+                with open(r.sys_path, 'rb') as f:
+                    self.assertEqual(data, f.read())
+
+                self.assertEqual(hashlib.sha256(data).hexdigest(), dldr.index.get(r.cache_path)['hash'])
+
+                ranges = sorted(h['Range'] for m, p, h in server.requests if 'Range' in h)
+                self.assertEqual(3, len(ranges))
+                self.assertEqual(4, len(server.requests))
+
+                # A failed segment leaves a partial file that can be resumed
+                dldr = Downloader(cache=cache_fs(), segments=4, segment_size=len(data) // 10)
+                u = parse_app_url(server.url('file.csv'))
+                server.fail_after = 1000
+
+                with self.assertRaises(Exception):
+                    dldr.download(u)
+
+                partial_path = dldr.cache_path(u.resource_url) + '.partial'
+                self.assertLess(dldr.cache.getsize(partial_path), len(data))
+
+                r = dldr.download(u)
+
+                with open(r.sys_path, 'rb') as f:
+                    self.assertEqual(data, f.read())
+
+    def test_download_session(self):
+        """Reuse connections across downloads, and retry temporary failures"""
+        from tempfile import TemporaryDirectory
+        from urllib3.util.retry import Retry
+        from rowgenerators.appurl.test.support import LocalWebServer, cache_fs
+
+        with TemporaryDirectory() as d:
+
+            names = ['file{}.csv'.format(i) for i in range(5)]
+
+            for name in names:
+                with open(os.path.join(d, name), 'w') as f:
+                    f.write('a,b\n{},2\n'.format(name))
+
+            with LocalWebServer(d) as server:
+
+                dldr = Downloader(cache=cache_fs(), retries=Retry(3, backoff_factor=0, status_forcelist=[503]))
+
+                for name in names[:3]:
+                    dldr.download(parse_app_url(server.url(name)))
+
+                self.assertEqual(3, len(server.requests))
+                self.assertEqual(1, len(server.connections))
+
+                server.errors = [503, 503]
+
+                r = dldr.download(parse_app_url(server.url(names[3])))
+
+                self.assertEqual(6, len(server.requests))
+                with open(r.sys_path) as f:
+                    self.assertIn(names[3], f.read())
+
+        # By default, the session retries getting a response, but leaves failed reads to be resumed
+        from rowgenerators.appurl.web.download import make_session
+
+        adapter = make_session(max_connections=4).get_adapter('https://example.com')
+
+        self.assertEqual(4, adapter._pool_maxsize)
+        self.assertEqual(3, adapter.max_retries.total)
+        self.assertEqual(0, adapter.max_retries.read)
+
+    def test_zip_streaming(self):
+        """Read CSV members of zip files without extracting them"""
+        import csv
+        from io import StringIO
+        from tempfile import TemporaryDirectory
+        from zipfile import ZipFile
+        from rowgenerators.appurl.archive.zip import zip_file
+        from rowgenerators.appurl.test.support import cache_fs
+
+        rows = [['id', 'name']] + [[str(i), 'name-{}'.format(i)] for i in range(1000)]
+
+        sio = StringIO()
+        csv.writer(sio).writerows(rows)
+
+        with TemporaryDirectory() as d:
+
+            path = os.path.join(d, 'archive.zip')
+
+            for name, text in (('readme.txt', 'Not data'), ('rows.csv', sio.getvalue()), ('more.csv', 'a,b\n')):
+                with open(os.path.join(d, name), 'w', newline='') as f:
+                    f.write(text)
+
+            with ZipFile(path, 'w') as zf:
+                zf.write(os.path.join(d, 'readme.txt'), 'readme.txt')
+                zf.write(os.path.join(d, 'rows.csv'), 'data/rows.csv')
+
+            dldr = Downloader(cache=cache_fs())
+
+            u = parse_app_url(path + '#rows.csv', downloader=dldr)
+
+            t = u.stream_target()
+            self.assertEqual('csv', t.target_format)
+            self.assertFalse(exists(t.fspath))
+
+            self.assertEqual(rows, list(u.generator))
+            self.assertFalse(exists(t.fspath))
+
+            self.assertEqual(len(rows) - 1, len(u.generator.dataframe()))
+
+            self.assertIs(zip_file(path), zip_file(path))
+            self.assertEqual(2, len(u.clone(target_file=None).list()))
+
+            # Extracting still works, and the extracted file is used once it exists
+            self.assertTrue(exists(u.get_target().fspath))
+            self.assertEqual(rows, list(u.generator))
+
+            zf1 = zip_file(path)
+
+            with ZipFile(path, 'a') as zf:
+                zf.write(os.path.join(d, 'more.csv'), 'more.csv')
+
+            self.assertIsNot(zf1, zip_file(path))
+            self.assertEqual(3, len(u.clone(target_file=None).list()))
+
+            # Fixed width members are streamed too
+            from rowgenerators.core import get_generator
+            from rowgenerators.generator.fixed import FixedSource
+            from rowgenerators.table import Table
+
+            with ZipFile(os.path.join(d, 'fixed.zip'), 'w') as zf:
+                zf.writestr('data.txt', ' 1abc\n22 de\n')
+
+            table = Table()
+            table.add_column('a', int, 2)
+            table.add_column('b', str, 3)
+
+            u = parse_app_url('fixed+file:' + os.path.join(d, 'fixed.zip') + '#data.txt', downloader=dldr)
+
+            t = u.stream_target()
+            self.assertIsNotNone(t)
+
+            g = get_generator(t, source_url=u, opener=t.opener, table=table)
+            self.assertIsInstance(g, FixedSource)
+            self.assertEqual([['1', 'abc'], ['22', 'de']], list(g))
+            self.assertFalse(exists(t.fspath))
+
+    def test_tar_urls(self):
+        """Read members of tar and tar.gz archives"""
+        import csv
+        import tarfile
+        from tempfile import TemporaryDirectory
+        from rowgenerators.appurl.archive.tar import TarUrl, tar_index, open_member
+        from rowgenerators.appurl.test.support import cache_fs
+
+        rows = [['id', 'name']] + [[str(i), 'name-{}'.format(i)] for i in range(1000)]
+
+        with TemporaryDirectory() as d:
+
+            with open(os.path.join(d, 'rows.csv'), 'w', newline='') as f:
+                csv.writer(f).writerows(rows)
+
+            with open(os.path.join(d, 'readme.txt'), 'w') as f:
+                f.write('Not data')
+
+            dldr = Downloader(cache=cache_fs())
+
+            for name, mode in (('archive.tar', 'w'), ('archive.tar.gz', 'w:gz'), ('archive.tar.bz2', 'w:bz2')):
+
+                path = os.path.join(d, name)
+
+                with tarfile.open(path, mode) as tf:
+                    tf.add(os.path.join(d, 'readme.txt'), 'bundle/readme.txt')
+                    tf.add(os.path.join(d, 'rows.csv'), 'bundle/data/rows.csv')
+
+                u = parse_app_url(path + '#rows.csv', downloader=dldr)
+
+                self.assertIsInstance(u, TarUrl, name)
+                self.assertEqual('tar', u.resource_format)
+                self.assertEqual('csv', u.target_format)
+
+                idx = tar_index(path)
+                self.assertIs(idx, tar_index(path))
+                self.assertEqual(name != 'archive.tar', idx.compressed)
+                self.assertEqual(['bundle/readme.txt', 'bundle/data/rows.csv'], idx.names)
+
+                with open_member(path, 'bundle/readme.txt') as f:
+                    self.assertEqual(b'Not data', f.read())
+
+                t = u.stream_target()
+                self.assertFalse(exists(t.fspath))
+                self.assertEqual(rows, list(u.generator))
+                self.assertFalse(exists(t.fspath))
+
+                self.assertEqual(['bundle/readme.txt', 'bundle/data/rows.csv'],
+                                 [e.target_file for e in parse_app_url(path, downloader=dldr).list()])
+
+                tu = u.get_target()
+                self.assertTrue(exists(tu.fspath))
+                self.assertEqual('csv', tu.target_format)
+                self.assertEqual(rows, list(tu.generator))
+
+            # Compressed files that aren't tar archives are still plain files
+            self.assertNotIsInstance(parse_app_url(os.path.join(d, 'rows.csv.gz')), TarUrl)
+
+    def test_blob_store(self):
+        """Store files with the same contents once, for downloads and zip extractions"""
+        import hashlib
+        from tempfile import TemporaryDirectory
+        from zipfile import ZipFile
+        from rowgenerators.appurl.test.support import LocalWebServer, cache_fs
+
+        data = ('a,b\n' + '1,2\n' * 500).encode('ascii')
+
+        with TemporaryDirectory() as d:
+
+            for name in ('mirror1.csv', 'mirror2.csv'):
+                with open(os.path.join(d, name), 'wb') as f:
+                    f.write(data)
+
+            with open(os.path.join(d, 'other.csv'), 'wb') as f:
+                f.write(b'a,b\n3,4\n')
+
+            for name in ('one.zip', 'two.zip'):
+                with ZipFile(os.path.join(d, name), 'w') as zf:
+                    zf.write(os.path.join(d, 'mirror1.csv'), 'data.csv')
+
+            with LocalWebServer(d) as server:
+
+                cache = cache_fs()
+                dldr = Downloader(cache=cache, dedupe=True)
+                blobs = dldr.blobs
+
+                def get(name):
+                    return cache.getsyspath(dldr.download(parse_app_url(server.url(name))).cache_path)
+
+                p1, p2, p3 = get('mirror1.csv'), get('mirror2.csv'), get('other.csv')
+
+                digest = hashlib.sha256(data).hexdigest()
+
+                self.assertTrue(blobs.has(digest))
+                self.assertTrue(os.path.samefile(p1, p2))
+                self.assertTrue(os.path.samefile(p1, blobs.blob_path(digest)))
+                self.assertFalse(os.path.samefile(p1, p3))
+                self.assertEqual(data, open(p2, 'rb').read())
+                self.assertEqual(len(data) + 8, blobs.size)
+
+                # Zip members with the same contents share the blob too
+                targets = [parse_app_url(os.path.join(d, name) + '#data.csv', downloader=dldr).get_target()
+                           for name in ('one.zip', 'two.zip')]
+
+                self.assertTrue(all(os.path.samefile(p1, t.fspath) for t in targets))
+                self.assertEqual('extant', parse_app_url(os.path.join(d, 'one.zip') + '#data.csv',
+                                                         downloader=dldr).get_target()._disp)
+
+                # The blob is deleted with the last file that links to it
+                dldr.index.clear()
+                self.assertTrue(blobs.has(digest))
+
+                for t in targets:
+                    os.remove(str(t.fspath))
+
+                self.assertEqual(1, blobs.collect())
+                self.assertFalse(blobs.has(digest))
+                self.assertEqual(0, blobs.size)
+
+            # Without dedupe, there is no blob store
+            self.assertIsNone(Downloader(cache=cache_fs()).blobs)
+
+    def test_reextract_linked_member(self):
+        """Re-extracting a member from a changed archive doesn't change the files linked to its old blob"""
+        import hashlib
+        import time
+        from tempfile import TemporaryDirectory
+        from zipfile import ZipFile
+        from rowgenerators.appurl.test.support import cache_fs
+
+        old = b'a,b\n1,2\n'
+        new = b'a,b\n1,2\n3,4\n'
+
+        with TemporaryDirectory() as d:
+
+            def write_zip(name, data):
+                with ZipFile(os.path.join(d, name), 'w') as zf:
+                    zf.writestr('x.csv', data)
+
+            def target(name):
+                return parse_app_url(os.path.join(d, name) + '#x.csv', downloader=dldr).get_target()
+
+            write_zip('a.zip', old)
+            write_zip('b.zip', old)
+
+            dldr = Downloader(cache=cache_fs(), dedupe=True)
+
+            ta, tb = target('a.zip'), target('b.zip')
+            self.assertTrue(os.path.samefile(ta.fspath, tb.fspath))
+
+            time.sleep(0.01)
+            write_zip('a.zip', new)
+
+            ta = target('a.zip')
+            self.assertEqual('copied', ta._disp)
+            self.assertEqual(new, open(str(ta.fspath), 'rb').read())
+
+            # b.zip's copy, and the blob, still have the old contents
+            self.assertEqual(old, open(str(tb.fspath), 'rb').read())
+            self.assertEqual(old, open(dldr.blobs.blob_path(hashlib.sha256(old).hexdigest()), 'rb').read())
+            self.assertFalse(os.path.samefile(ta.fspath, tb.fspath))
+
+            self.assertEqual('extant', target('a.zip')._disp)
+            self.assertEqual('extant', target('b.zip')._disp)
+
+            # A member linked to a blob that is older than its archive is not extracted again
+            time.sleep(0.01)
+            write_zip('c.zip', old)
+
+            tc = target('c.zip')
+            self.assertTrue(os.path.samefile(tb.fspath, tc.fspath))
+            self.assertEqual('extant', target('c.zip')._disp)
+
+    def test_fetch_metrics(self):
+        """Record bytes, times and cache status for each fetch"""
+        import json
+        from io import StringIO
+        from tempfile import TemporaryDirectory
+        import threading
+        from fs.memoryfs import MemoryFS
+        from rowgenerators.appurl.web.metrics import MemoryMetrics, JsonLinesMetrics, MultiMetrics
+        from rowgenerators.appurl.test.support import LocalWebServer, cache_fs
+        from rowgenerators.exceptions import DownloadError
+
+        data = ('a,b\n' + '1,2\n' * 1000).encode('ascii')
+
+        with TemporaryDirectory() as d:
+
+            for name in ('one.csv', 'two.csv'):
+                with open(os.path.join(d, name), 'wb') as f:
+                    f.write(data)
+
+            with LocalWebServer(d) as server:
+
+                mem = MemoryMetrics()
+                lines = StringIO()
+                dldr = Downloader(cache=cache_fs(), metrics=MultiMetrics(mem, JsonLinesMetrics(lines)),
+                                  retries=0)
+
+                dldr.download(parse_app_url(server.url('one.csv')))
+                dldr.download(parse_app_url(server.url('one.csv')))
+
+                with dldr.open_stream(server.url('two.csv')) as f:
+                    self.assertEqual(data, f.read())
+
+                with self.assertRaises(DownloadError):
+                    dldr.download(parse_app_url(server.url('missing.csv')))
+
+                # Fetches of the same url that overlap each get their own record. A mem: cache has no lock
+                # to keep them apart, and the stream is read in another thread.
+                overlap = MemoryMetrics()
+                mem_dldr = Downloader(cache=MemoryFS(), metrics=overlap, retries=0)
+
+                read = []
+                with mem_dldr.open_stream(server.url('two.csv')) as f:
+                    mem_dldr._download_with_lock(server.url('two.csv'))
+
+                    t = threading.Thread(target=lambda: read.append(f.read()))
+                    t.start()
+                    t.join()
+
+                self.assertEqual([data], read)
+                self.assertEqual([len(data), len(data)], [r.bytes for r in overlap.records])
+                self.assertTrue(all(r.ttfb is not None for r in overlap.records))
+                self.assertEqual({}, mem_dldr._fetches)
+
+            # The failed download is tried again as an S3 url, which is a second failed fetch
+            miss, hit, stream, error, s3_error = mem.records
+
+            self.assertEqual(('miss', 'hit', 'miss', 'error'), (miss.status, hit.status, stream.status, error.status))
+
+            self.assertEqual(len(data), miss.bytes)
+            self.assertEqual(len(data), miss.size)
+            self.assertEqual(len(data), stream.bytes)
+            self.assertEqual(0, hit.bytes)
+
+            self.assertIsNotNone(miss.ttfb)
+            self.assertIsNone(hit.ttfb)
+            self.assertLessEqual(miss.ttfb, miss.wall_time)
+            self.assertGreaterEqual(miss.lock_wait, 0)
+            self.assertEqual(0, miss.retries)
+            self.assertIsNotNone(error.error)
+
+            s = mem.summary()
+            self.assertEqual(5, s['count'])
+            self.assertEqual(1, s['hits'])
+            self.assertEqual(2, s['misses'])
+            self.assertEqual(2, s['errors'])
+            self.assertEqual(len(data) * 2, s['bytes'])
+
+            self.assertEqual(2, mem.by_url()[server.url('one.csv')]['count'])
+            self.assertEqual(1, len(mem.slowest(1)))
+
+            exported = [json.loads(l) for l in lines.getvalue().splitlines()]
+            self.assertEqual([r.as_dict() for r in mem.records], exported)
+
     def test_url_classes(self):
 
         from rowgenerators.appurl import match_url_classes
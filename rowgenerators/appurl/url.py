@@ -17,18 +17,13 @@ def match_url_classes(u_str, **kwargs):
     :return:
     """
 
-    from pkg_resources import iter_entry_points
+    from rowgenerators.registry import get_registry, URL_GROUP
 
     u = Url(str(u_str), downloader=None, **kwargs)
 
     try:
-        classes = []
-
-        for ep in iter_entry_points(group='appurl.urls'):
-            if u._match_entry_point(ep.name):
-                classes.append(ep.load())
-
-        classes = sorted(classes, key=lambda cls: cls.match_priority)
+        classes = get_registry(URL_GROUP).classes(u._entry_point_names(), u._match_entry_point,
+                                                  key=lambda cls: cls.match_priority)
 
     except ModuleNotFoundError as e:
         raise ModuleNotFoundError("Failed to find module for url string '{}', entrypoint: "
@@ -106,7 +101,7 @@ class UrlParts(object):
                  'target_file', 'target_format', 'target_segment']
 
     _fragment_query_parts = ['start','end','headers','encoding',
-                             'resource_file','resource_format','target_format']
+                             'resource_file','resource_format','target_format', 'compression']
 
     _fragment_segments_parts = ['target_file','target_segment']
 
@@ -213,12 +208,13 @@ class UrlParts(object):
 
     @property
     def target_format(self):
-        from .util import file_ext
+        from .util import file_ext, strip_compression_ext
 
         target_format = self._parts.get('target_format')
 
         if not target_format and self.target_file:
-            target_format = file_ext(self.target_file)
+            # For compressed files, like 'foo.csv.gz', the format is the extension before the compression's
+            target_format = file_ext(strip_compression_ext(self.target_file))
 
         if not target_format:
             target_format = self.resource_format
@@ -234,6 +230,23 @@ class UrlParts(object):
     def target_format(self, v):
         self._parts['target_format'] = v
 
+    @property
+    def compression(self):
+        """The compression of the target file, such as 'gzip' for 'foo.csv.gz', or None if it
+        isn't compressed. May be set in the fragment query, with 'none' to disable decompression"""
+        from .util import compression_format
+
+        c = self._parts.get('compression')
+
+        if c:
+            return c
+
+        return compression_format(self.target_file)
+
+    @compression.setter
+    def compression(self, v):
+        self._parts['compression'] = v
+
 
 
     def clear_fragment(self):
@@ -384,6 +397,8 @@ class Url(UrlParts):
     - ``headers``. For row-oriented data, the row numbers of the headers, as a comma-seperated list of integers.
     - ``start``. For row-oriented data, the row number of the first row of data ( as opposed to headers. )
     - ``end``. For row-oriented data, the row number of the last row of data.
+    - ``compression``. Compression of the target file, if it isn't implied by the extension. One of
+      ``gzip``, ``bz2``, ``xz``, ``zstd`` or ``none``
 
     """
 
@@ -628,10 +643,23 @@ class Url(UrlParts):
         from rowgenerators.core import get_generator
 
         r = self.get_resource()
+
+        t = r.stream_target()
+
+        if t is not None:
+            return get_generator(t, source_url=self, opener=t.opener)
+
         t = r.get_target()
 
         return get_generator(t.get_target(), source_url=self)
 
+    def stream_target(self):
+        """Return a Url for the target, with an ``opener`` attribute holding a callable that opens the target
+        as a binary stream, for generators that can read the target without it being written to
+        a file first. Returns None if the target must be read from a file; this implementation always does.
+        """
+        return None
+
 
     #
     # Matching methods
@@ -673,6 +701,26 @@ class Url(UrlParts):
         else:
             return False
 
+    def _entry_point_names(self):
+        """Return the entrypoint names that this URL matches directly, without evaluating
+        pattern or compound names. See _match_entry_point()"""
+
+        names = ['*']
+
+        if self.scheme is not None:
+            names.append('{}:'.format(self.scheme))
+
+        if self.proto is not None:
+            names.append('{}+'.format(self.proto))
+
+        if self.resource_format is not None:
+            names.append('.{}'.format(self.resource_format))
+
+        if self.target_format is not None:
+            names.append('#.{}'.format(self.target_format))
+
+        return names
+
     @classmethod
     def _match(cls, url, **kwargs):
         """Return True if this handler can handle the input URL"""
@@ -279,6 +279,68 @@ def file_ext(v):
         return None
 
 
+# File extensions for compressed files, and the compression for each. The compression names are
+# the same as the ones pandas uses.
+COMPRESSION_EXTENSIONS = {
+    'gz': 'gzip',
+    'gzip': 'gzip',
+    'bz2': 'bz2',
+    'xz': 'xz',
+    'zst': 'zstd',
+}
+
+
+def compression_format(v):
+    """Return the compression for a file name, based on its extension, or None if the
+    extension isn't for a compressed file"""
+
+    return COMPRESSION_EXTENSIONS.get(file_ext(v))
+
+
+def strip_compression_ext(v):
+    """Remove the compression extension from a filename, so 'foo.csv.gz' becomes 'foo.csv'"""
+    from os.path import splitext
+
+    if v and compression_format(v):
+        return splitext(v)[0]
+
+    return v
+
+
+def open_decompressed(path, compression=None):
+    """Open a file for reading bytes, decompressing it as it is read if compression is set.
+    Nothing is written to disk.
+
+    :param path: Path to the file, or a binary file-like object
+    :param compression: One of 'gzip', 'bz2', 'xz' or 'zstd'. 'zstd' requires the zstandard package.
+    :return: A binary file-like object
+    """
+
+    from rowgenerators.exceptions import AppUrlError
+
+    is_flo = hasattr(path, 'read')
+
+    if not compression or compression == 'none':
+        return path if is_flo else open(path, 'rb')
+    elif compression == 'gzip':
+        import gzip
+        return gzip.open(path, 'rb')
+    elif compression == 'bz2':
+        import bz2
+        return bz2.open(path, 'rb')
+    elif compression == 'xz':
+        import lzma
+        return lzma.open(path, 'rb')
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise AppUrlError("Reading zstd compressed files requires the zstandard package")
+
+        return zstandard.ZstdDecompressor().stream_reader(path if is_flo else open(path, 'rb'), closefd=True)
+    else:
+        raise AppUrlError("Unknown compression '{}' for '{}'".format(compression, path))
+
 
 def copy_file_or_flo(input_, output, buffer_size=64 * 1024, cb=None):
     """ Copy a file name or file-like-object to another file name or file-like object"""
@@ -376,31 +438,60 @@ def get_cache(cache_name=None, clean=False):
 
 
 def clean_cache(cache = None, cache_name=None):
-    """Delete items in the cache older than 24 hours"""
+    """Delete items in the cache older than 24 hours. If the cache has an index, the indexed files are
+    expired by the index. The cache is still walked for the files the index doesn't track, such as
+    extracted archive members, lock files and partial downloads left by failed processes, and files
+    written before the index was created, which are deleted by age. Directories that are left empty,
+    like the extraction directories of deleted archives, are removed too."""
     import datetime
+    from fs.path import dirname
+    from rowgenerators.appurl.cache import CacheIndex, BlobStore, INDEX_NAME, INDEX_FILES, BLOB_DIR
 
     cache = cache if cache else get_cache( get_cache_name(cache_name))
 
-    ignores = ['index.json', 'index.json.bak']
+    max_age = 60 * 60 * 24
 
-    for step in cache.walk.info():
-        details = cache.getdetails(step[0])
-        mod = details.modified
+    index = None
+
+    if cache.exists(INDEX_NAME):
+        index = CacheIndex(cache)
+        index.expire(max_age)
+
+    ignores = ['index.json', 'index.json.bak'] + list(INDEX_FILES)
+
+    emptied = set()  # Directories that files were deleted from
+
+    # Depth first, so directories come after the files in them. Blobs are deleted by BlobStore.collect()
+    for path, info in cache.walk.info(search='depth', exclude_dirs=[BLOB_DIR], namespaces=['details']):
+        mod = info.modified
         now = datetime.datetime.now(tz=mod.tzinfo)
-        age = (now - mod).total_seconds()
-        if age > (60 * 60 * 24) and details.is_file:
-            if step[0] not in ignores:
-                cache.remove(step[0])
+        old = (now - mod).total_seconds() > max_age
+
+        if info.is_dir:
+            if (old or path in emptied) and cache.isempty(path):
+                cache.removedir(path)
+                emptied.add(dirname(path))
+
+        elif old and path.lstrip('/') not in ignores and (index is None or index.get(path) is None):
+            cache.remove(path)
+            emptied.add(dirname(path))
+
+    if cache.exists(BLOB_DIR):
+        BlobStore(cache).collect()
 
 def nuke_cache(cache = None, cache_name=None):
     """Delete Everythong in the cache"""
+    from rowgenerators.appurl.cache import CacheIndex, INDEX_NAME, INDEX_FILES
 
     cache = cache if cache else get_cache(get_cache_name(cache_name))
 
     for step in cache.walk.info():
-        if not step[1].is_dir:
+        if not step[1].is_dir and step[0].lstrip('/') not in INDEX_FILES:
             cache.remove(step[0])
 
+    if cache.exists(INDEX_NAME):
+        CacheIndex(cache).clear()
+
 def ensure_dir(path):
     from os import makedirs
     from os.path import exists
@@ -8,6 +8,7 @@ cache, returning a new Url object pointing to the downloaded file.
 """
 
 from .download import Downloader
+from .metrics import MemoryMetrics, JsonLinesMetrics, MultiMetrics
 from .ckan import CkanUrl
 from .google import GoogleProtoCsvUrl, GoogleSpreadsheetUrl
 from .s3 import S3Url
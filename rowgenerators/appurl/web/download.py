@@ -3,9 +3,16 @@
 
 """ """
 
+import io
 import logging
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 from functools import lru_cache
 
+from rowgenerators.appurl.web.metrics import HIT, MISS, NOT_MODIFIED, ERROR
+
 _logger = logger = logging.getLogger('rowgenerators.appurl.web.download')
 
 
@@ -30,9 +37,11 @@ class _NoOpFileLock(object):
 
 
 class Resource(object):
+    url = None
     cache_path = None
     sys_path = None
     download_time = None
+    error = None # Exception, for resources that failed in Downloader.prefetch()
 
     def __init__(self):
         super().__init__()
@@ -40,6 +49,45 @@ class Resource(object):
     def __str__(self):
         return str(self.__dict__)
 
+DEFAULT_SEGMENT_SIZE = 16 * 1024 * 1024
+
+DEFAULT_MAX_CONNECTIONS = 10  # Per host
+DEFAULT_RETRIES = 3
+
+
+def make_session(max_connections=DEFAULT_MAX_CONNECTIONS, retries=DEFAULT_RETRIES):
+    """Create a requests Session with a connection pool for each host, and retries with exponential backoff
+    for connection errors and for the responses that servers use for temporary failures.
+
+    The retries are only for getting a response. Errors reading the body aren't retried by the session,
+    and neither are read timeouts, since the Downloader keeps the partial file and resumes it on the next
+    download of the url. The default backoff is short, less than a second for all of the retries, so a
+    failing download isn't held up for long before it can be resumed, although a Retry-After header from
+    the server is still respected.
+
+    :param max_connections: Maximum number of connections to each host. Requests that would need more wait
+        for a connection to be released.
+    :param retries: Number of times to retry a request, or a urllib3 Retry object
+    :return: requests.Session
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    if not isinstance(retries, Retry):
+        retries = Retry(total=retries, read=0, backoff_factor=0.1, status_forcelist=(429, 500, 502, 503, 504),
+                        raise_on_status=False)
+
+    # pool_connections is the number of hosts to keep pools for, not a connection limit
+    adapter = HTTPAdapter(pool_maxsize=max_connections, pool_block=True, max_retries=retries)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
 def default_downloader_callback(msg_type, message, read_len, total_len):
     pass
 
@@ -54,7 +102,9 @@ class Downloader(object):
     singleton = None
 
     def __init__(self, cache=None, account_accessor=None, logger=None,
-                 working_dir='', callback=None, use_cache=True):
+                 working_dir='', callback=None, use_cache=True, streaming=False, max_cache_size=None,
+                 revalidate=False, segments=1, segment_size=DEFAULT_SEGMENT_SIZE,
+                 max_connections=DEFAULT_MAX_CONNECTIONS, retries=DEFAULT_RETRIES, dedupe=False, metrics=None):
         """
         Download and cache files, via HTTP and FTP, with retry and decompression.
 
@@ -64,6 +114,22 @@ class Downloader(object):
         :param logger: Logging object to write debug logs to
         :param working_dir:
         :param callback: Call back to call with progress reports during downloads.
+        :param streaming: If True, generators for web resources that aren't cached yet read
+            the response while it downloads. See open_stream()
+        :param max_cache_size: If set, the maximum total size of the downloaded files in the cache, in bytes.
+            The least recently used files are deleted to keep the cache under the limit.
+        :param revalidate: If True, check cached HTTP resources with the server, using the ETag and
+            Last-Modified headers from the original response, and download them again only if they
+            have changed.
+        :param segments: Number of byte ranges to download concurrently, for HTTP resources from servers that
+            support ranges. Resources are split into segments of at least segment_size bytes.
+        :param segment_size: Minimum size of a segment, in bytes.
+        :param max_connections: Maximum number of HTTP connections to each host. See make_session()
+        :param retries: Number of times to retry failed HTTP requests, or a urllib3 Retry object. See make_session()
+        :param dedupe: If True, files with the same contents, downloaded from different URLs or extracted
+            from archives, share storage in the cache's BlobStore.
+        :param metrics: Metrics sink that receives a FetchRecord for each fetch, such as a MemoryMetrics
+            or JsonLinesMetrics. See rowgenerators.appurl.web.metrics
         :return:
         """
 
@@ -78,6 +144,42 @@ class Downloader(object):
 
         self.use_cache = use_cache # Set to false to ignore cache
 
+        self.streaming = streaming
+
+        self.max_cache_size = max_cache_size
+        self._index = None
+
+        self.dedupe = dedupe
+        self._blobs = None
+
+        self.revalidate = revalidate
+
+        self.segments = segments
+        self.segment_size = segment_size
+
+        self.max_connections = max_connections
+        self.retries = retries
+        self._session = None
+        self._session_lock = threading.Lock()
+
+        self.metrics = metrics
+        # FetchRecords of the downloads in progress, by the id of the thread doing the download, for the
+        # byte counts from callback() and the responses from _http_get(). Concurrent downloads of the same
+        # url each have their own record.
+        self._fetches = {}
+
+        # Downloads running in prefetch(), by resource url, shared by concurrent calls
+        self._in_flight = {}
+        self._in_flight_lock = threading.Lock()
+
+        # Cache locks, by path, shared by all of the downloads of a path in this process, so a thread
+        # that already holds a lock can acquire it again. See _lock()
+        self._locks = weakref.WeakValueDictionary()
+        self._locks_lock = threading.Lock()
+
+        # Cache paths that open_stream() is writing to, until the streams are closed
+        self._streams = set()
+
         # For debugging singletonness
         #from metapack.util import dump_stack
         #print('======')
@@ -105,6 +207,12 @@ class Downloader(object):
         return Downloader.singleton
 
     def callback(self, msg_type, message, read_len=-1, total_len=-1 ):
+
+        if msg_type in ('copy', 'ftp read'):
+            rec = self._current_fetch(message)
+            if rec is not None:
+                rec.add_bytes(read_len)
+
         if True or self._callback:
             self._callback( msg_type, message, read_len, total_len)
 
@@ -129,6 +237,62 @@ class Downloader(object):
 
         return self._cache
 
+    @property
+    def session(self):
+        """The requests Session for all of the HTTP requests of this downloader, so connections to a host
+        are kept alive and reused across downloads and threads."""
+
+        with self._session_lock:
+            if self._session is None:
+                self._session = make_session(self.max_connections, self.retries)
+
+            return self._session
+
+    @property
+    def index(self):
+        """The CacheIndex for the cache, which records the downloaded files and enforces max_cache_size"""
+        from rowgenerators.appurl.cache import CacheIndex
+
+        if self._index is None or self._index.cache is not self.cache:
+            self._index = CacheIndex(self.cache, self.max_cache_size, self.blobs)
+
+        return self._index
+
+    @property
+    def blobs(self):
+        """The BlobStore for the cache, if dedupe is set and the cache is on a local filesystem, or None"""
+        from fs.errors import NoSysPath
+        from rowgenerators.appurl.cache import BlobStore
+
+        if not self.dedupe:
+            return None
+
+        if self._blobs is None or self._blobs.cache is not self.cache:
+            try:
+                self._blobs = BlobStore(self.cache)
+            except NoSysPath:
+                return None
+
+        return self._blobs
+
+    def store_blob(self, path, hash=None):
+        """Link a file into the BlobStore, so it shares storage with other files that have the same
+        contents. Does nothing if dedupe is not set.
+
+        :param path: Sys path of the file, or the path of a file in the cache
+        :param hash: sha256 hex digest of the file, if it is already known
+        :return: True if the file now shares storage with an earlier file
+        """
+        from os.path import isabs
+
+        if self.blobs is None:
+            return False
+
+        if not isabs(str(path)):
+            path = self.cache.getsyspath(str(path))
+
+        return self.blobs.link(str(path), hash)
+
     def get_resource(url):
         pass
 
@@ -220,6 +384,230 @@ class Downloader(object):
 
         return cache_path
 
+    def prefetch(self, urls, max_workers=8):
+        """Download many resources concurrently, in a thread pool.
+
+        Each download takes the same cache lock as download(), so a resource that another thread or
+        process is already downloading is fetched only once. URLs that have the same resource url
+        share a single download, including with downloads from other prefetch() calls that are still
+        running.
+
+        :param urls: Iterable of Url objects or URL strings
+        :param max_workers: Number of downloads to run at once
+        :return: A list of Resource objects, one for each url, in the same order. Each has a ``url``
+            attribute with the input url, and ``error`` is set to the exception for failed downloads.
+        """
+        import copy
+        from concurrent.futures import ThreadPoolExecutor
+        from rowgenerators import parse_app_url
+
+        urls = list(urls)
+
+        self.cache  # Create the cache before the threads start
+
+        def _inner(u):
+            if isinstance(u, str):
+                u = parse_app_url(u, downloader=self)
+            return u.inner
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+
+            futures = []
+
+            for url in urls:
+                try:
+                    inner = _inner(url)
+                except Exception as e:
+                    futures.append(e)
+                    continue
+
+                key = inner.resource_url
+
+                with self._in_flight_lock:
+                    f = self._in_flight.get(key)
+                    submitted = f is None
+
+                    if submitted:
+                        f = executor.submit(self.download, inner)
+                        self._in_flight[key] = f
+
+                # The callback runs immediately if the download has already finished, so it
+                # must be added outside of the lock.
+                if submitted:
+                    f.add_done_callback(lambda f, key=key: self._done_in_flight(key, f))
+
+                futures.append(f)
+
+            results = []
+
+            for url, f in zip(urls, futures):
+                try:
+                    if isinstance(f, Exception):
+                        raise f
+
+                    r = copy.copy(f.result())
+                except Exception as e:
+                    r = Resource()
+                    r.error = e
+
+                r.url = url
+                results.append(r)
+
+        return results
+
+    def _done_in_flight(self, key, f):
+        with self._in_flight_lock:
+            if self._in_flight.get(key) is f:
+                del self._in_flight[key]
+
+    def is_cached(self, url):
+        """Return True if the resource for a URL string is already in the cache"""
+        return self.use_cache and self.cache.exists(self.cache_path(url))
+
+    def _begin_fetch(self, url):
+        from rowgenerators.appurl.web.metrics import FetchRecord
+
+        return FetchRecord(url)
+
+    def _track_fetch(self, rec):
+        """Make rec the record for the download in the current thread"""
+        self._fetches[threading.get_ident()] = rec
+
+    def _untrack_fetch(self, rec):
+        """Remove rec from the downloads in progress, in any thread"""
+        for k, v in list(self._fetches.items()):
+            if v is rec:
+                self._fetches.pop(k, None)
+
+    def _current_fetch(self, url):
+        """Return the record for the download of url in the current thread, or None"""
+        rec = self._fetches.get(threading.get_ident())
+
+        return rec if rec is not None and rec.url == url else None
+
+    def _end_fetch(self, rec, status, error=None):
+        """Finish a FetchRecord and send it to the metrics sink"""
+
+        rec.finish(status, error)
+
+        self._untrack_fetch(rec)
+
+        if self.metrics is not None:
+            self.metrics.record(rec)
+
+    @contextmanager
+    def _fetch_metrics(self, url):
+        """Context manager for a FetchRecord. The status is MISS unless the body sets it, or ERROR if the
+        body raises an exception"""
+
+        rec = self._begin_fetch(url)
+
+        try:
+            yield rec
+        except BaseException as e:
+            self._end_fetch(rec, ERROR, e)
+            raise
+
+        self._end_fetch(rec, rec.status or MISS)
+
+    def _lock(self, cache_path):
+        """Return the lock for a path in the cache. There is one lock object for each path, while it is in
+        use, which is reentrant in the thread that holds it and blocks other threads and processes."""
+        from fs.errors import NoSysPath
+
+        try:
+            from filelock import FileLock
+            lock_path = self.cache.getsyspath(cache_path + '.lock')
+
+        except NoSysPath:
+            # mem: caches, and others, don't have sys paths.
+            return _NoOpFileLock(None)
+
+        with self._locks_lock:
+            lock = self._locks.get(lock_path)
+
+            if lock is None:
+                lock = FileLock(lock_path)
+                self._locks[lock_path] = lock
+
+            return lock
+
+    def open_stream(self, url):
+        """Open a web resource for reading while it downloads into the cache.
+
+        Returns a binary file object. If the resource is already cached, it is the cached file.
+        Otherwise, the bytes are written to a temporary file in the cache as they are read, and
+        the temporary file is moved to the cache path when the whole response has been read. If
+        the stream is closed before the end, the partial file is discarded. The cache lock is held
+        until the stream is closed, so other processes wait for the download rather than
+        repeating it.
+
+        Resources that are not HTTP are downloaded completely, then opened, and so are resources that
+        another stream in this process is still downloading. In the thread of that stream, such as when a
+        generator reads its headers while it is being iterated, waiting for the stream would deadlock.
+
+        :param url: URL string
+        :return: A binary file object
+        """
+        import os.path
+        from requests import HTTPError
+        from rowgenerators.exceptions import AccessError, DownloadError
+
+        if not url.startswith('http'):
+            cache_path, _ = self._download_with_lock(url)
+            return self.cache.openbin(cache_path, 'r')
+
+        cache_path = self.cache_path(url)
+
+        if cache_path in self._streams:
+            cache_path, _ = self._download_with_lock(url)
+            return self.cache.openbin(cache_path, 'r')
+
+        self.cache.makedirs(os.path.dirname(cache_path), recreate=True)
+
+        rec = self._begin_fetch(url)
+        rec.cache_path = cache_path
+
+        lock = self._lock(cache_path)
+        t = time.perf_counter()
+        lock.acquire()
+        rec.lock_wait = time.perf_counter() - t
+
+        try:
+            if self.cache.exists(cache_path):
+                if self.use_cache:
+                    self.index.touch(cache_path, url)
+                    lock.release()
+                    self._end_fetch(rec, HIT)
+                    return self.cache.openbin(cache_path, 'r')
+                else:
+                    self.cache.remove(cache_path)
+                    self.index.remove(cache_path)
+
+            self._track_fetch(rec)
+            self.callback('download', url)
+
+            try:
+                r = self._http_get(url)
+            except HTTPError as e:
+                if e.response.status_code == 403:
+                    raise AccessError("Access error on download: {}".format(e))
+                else:
+                    raise DownloadError("Failed to download: {}".format(e))
+
+            # The stream may be read in another thread, so it counts the bytes itself
+            self._untrack_fetch(rec)
+
+            stream = io.BufferedReader(_TeeStream(self, url, r, cache_path, lock, rec))
+            self._streams.add(cache_path)
+
+            return stream
+
+        except (KeyboardInterrupt, Exception) as e:
+            lock.release()
+            self._end_fetch(rec, ERROR, e)
+            raise
+
     def _download_with_lock(self, url):
         """
         Download a URL and store it in the cache.
@@ -237,7 +625,7 @@ class Downloader(object):
         from os.path import join
         import time
 
-        from fs.errors import DirectoryExpected, NoSysPath, ResourceInvalid, DirectoryExists
+        from fs.errors import DirectoryExpected, ResourceInvalid, DirectoryExists
         from requests import HTTPError
         from rowgenerators.exceptions import AccessError, DownloadError
 
@@ -274,69 +662,95 @@ class Downloader(object):
                     # Exhausted all of the trial values
                     raise e
 
-        try:
-            from filelock import FileLock
-            lock = FileLock(self.cache.getsyspath(cache_path + '.lock'))
+        # FIXME should check for MP operation and raise if there would be
+        # contention. Mem  caches are only for testing with single processes
+        lock = self._lock(cache_path)
 
-        except NoSysPath:
-            # mem: caches, and others, don't have sys paths.
-            # FIXME should check for MP operation and raise if there would be
-            # contention. Mem  caches are only for testing with single processes
-            lock = _NoOpFileLock()
+        with self._fetch_metrics(url) as rec:
+            t = time.perf_counter()
 
-        with lock:
-            if self.cache.exists(cache_path):
-                # Rather than ignoring the cache when use_cache is False, we
-                # delete the file and re-download it, because if you ignore the cached file,
-                # you still have to download the resource to a file somewhere.
-                if self.use_cache:
-                    logger.debug(f"Found {cache_path} in cache, and cache is active")
-                    return cache_path, None
-                else:
-                    logger.debug(f"File {cache_path} is not in cache")
-                    try:
-                        logger.debug(f"Found {cache_path} in cache, but cache not active; deleting")
-                        self.cache.remove(cache_path)
-                    except ResourceInvalid:
-                        pass  # Well, we tried.
+            with lock:
+                rec.lock_wait = time.perf_counter() - t
+                rec.cache_path = cache_path
+                self._track_fetch(rec)
 
-            try:
-                self._download(url, cache_path)
+                revalidating = False
 
-                return cache_path, time.time()
+                if self.cache.exists(cache_path):
+                    # Rather than ignoring the cache when use_cache is False, we
+                    # delete the file and re-download it, because if you ignore the cached file,
+                    # you still have to download the resource to a file somewhere.
+                    if self.use_cache and self.revalidate and url.startswith('http'):
+                        logger.debug(f"Found {cache_path} in cache; revalidating")
+                        revalidating = True
+                    elif self.use_cache:
+                        logger.debug(f"Found {cache_path} in cache, and cache is active")
+                        self.index.touch(cache_path, url)
+                        rec.status = HIT
+                        return cache_path, None
+                    else:
+                        logger.debug(f"File {cache_path} is not in cache")
+                        try:
+                            logger.debug(f"Found {cache_path} in cache, but cache not active; deleting")
+                            self.cache.remove(cache_path)
+                            self.index.remove(cache_path)
+                        except ResourceInvalid:
+                            pass  # Well, we tried.
 
-            except HTTPError as e:
-                if e.response.status_code == 403:
-                    raise AccessError("Access error on download: {}".format(e))
-                else:
-                    raise DownloadError("Failed to download: {}".format(e))
+                try:
+                    w = self._download(url, cache_path, revalidate=revalidating)
 
-            except (KeyboardInterrupt, Exception):
-                # This is really important -- its really bad to have partly downloaded
-                # files being confused with fully downloaded ones.
-                # FIXME. Should also handle signals. deleting partly downloaded files is important.
-                # Maybe should have a sentinel file, or download to another name and move the
-                # file after done.
-                if self.cache.exists(cache_path):
-                    self.cache.remove(cache_path)
+                    if w is None:
+                        logger.debug(f"{cache_path} is not modified")
+                        self.index.touch(cache_path, url)
+                        rec.status = NOT_MODIFIED
+                        return cache_path, None
 
-                raise
+                    self.index.add(cache_path, url, w.size, w.hexdigest)
+                    self.store_blob(cache_path, w.hexdigest)
+                    rec.status, rec.size = MISS, w.size
+
+                    return cache_path, time.time()
+
+                except HTTPError as e:
+                    if e.response.status_code == 403:
+                        raise AccessError("Access error on download: {}".format(e))
+                    else:
+                        raise DownloadError("Failed to download: {}".format(e))
+
+                except (KeyboardInterrupt, Exception):
+                    # This is really important -- its really bad to have partly downloaded
+                    # files being confused with fully downloaded ones. Downloads are written to
+                    # a partial file, which is moved to the cache path when it is complete, so
+                    # a failed download, including a failed revalidation, leaves the cached file alone.
+                    # HTTP and FTP partial files are kept, so the next attempt can resume them.
+                    if not url.startswith(('http', 'ftp')) and self.cache.exists(cache_path + '.partial'):
+                        self.cache.remove(cache_path + '.partial')
+
+                    raise
 
         assert False, 'Should never get here'
 
-    def _download(self, url, cache_path):
-        import requests
-        import functools
-        from urllib.request import urlopen
+    def _download(self, url, cache_path, revalidate=False):
+        """Download a url to a partial file, then move it to the cache path.
 
-        from requests.exceptions import SSLError
+        If an HTTP or FTP download fails, the partial file is kept, and the next download of
+        the url resumes it, if the server supports it and the resource hasn't changed. See _download_http()
+        and _download_ftp()
 
-        from rowgenerators.appurl.util import parse_url_to_dict, copy_file_or_flo
+        :param url: URL string
+        :param cache_path: Path in the cache
+        :param revalidate: If True, make the HTTP request conditional on the validators stored for the
+            cached file, and return None if the server responds that it has not been modified.
+        :return: The HashingWriter the file was written with, for its size and hash
+        """
+        from rowgenerators.appurl.cache import HashingWriter
         from rowgenerators.exceptions import DownloadError
-        from ftplib import FTP
 
         self.callback('download', url)
 
+        partial_path = cache_path + '.partial'
+
         if url.startswith('s3:'):
 
             from rowgenerators import parse_app_url
@@ -344,67 +758,440 @@ class Downloader(object):
             s3url = parse_app_url(url)
 
             try:
-                with self.cache.open(cache_path, 'wb') as f:
+                with HashingWriter(self.cache.openbin(partial_path, 'w')) as f:
                     s3url.object.download_fileobj(f)
             except Exception as e:
                 raise DownloadError("Failed to fetch S3 url '{}': {}".format(url, e))
 
         elif url.startswith('ftp:'):
+            f = self._download_ftp(url, partial_path)
 
-            logger.debug("Fetch " + str(url))
+        else:
+            f = self._download_http(url, cache_path, partial_path, revalidate)
 
-            u = parse_url_to_dict(url)
+            if f is None:
+                return None
 
-            try:
-                with FTP(u['netloc']) as ftp, self.cache.open(cache_path, 'wb') as fout:
+        self.cache.move(partial_path, cache_path, overwrite=True)
+        self.index.move_validators(partial_path, cache_path)
 
-                    total_len = [0]
+        return f # The HashingWriter, for the size and hash of the file
 
-                    def _read(d):
-                        fout.write(d)
+    def _partial_writer(self, partial_path, offset):
+        """Open a HashingWriter on a partial file. If offset is non zero, the writer appends to
+        the file, and the hash starts with the bytes that are already in it. """
+        from rowgenerators.appurl.cache import HashingWriter
+
+        if not offset:
+            return HashingWriter(self.cache.openbin(partial_path, 'w'))
+
+        f = HashingWriter(self.cache.openbin(partial_path, 'a'))
+
+        with self.cache.openbin(partial_path, 'r') as pf:
+            for chunk in iter(lambda: pf.read(1024 * 1024), b''):
+                f.update(chunk)
+
+        return f
+
+    def _resume_headers(self, partial_path):
+        """Return the offset to resume an HTTP download of a partial file from, and the Range headers to
+        request the rest of it. The offset is 0 if there is no partial file, or it can't be validated."""
+
+        if not self.cache.exists(partial_path):
+            return 0, {}
+
+        etag, last_modified = self.index.get_validators(partial_path)
+
+        # If-Range requires a strong validator
+        validator = etag if etag and not etag.startswith('W/') else last_modified
+
+        size = self.cache.getsize(partial_path)
+
+        if not validator or not size:
+            return 0, {}
+
+        return size, {'Range': 'bytes={}-'.format(size), 'If-Range': validator}
+
+    def _download_http(self, url, cache_path, partial_path, revalidate):
+        """Download an HTTP url to a partial file, resuming an earlier partial download with a Range request"""
+        from requests import HTTPError
+        from rowgenerators.appurl.util import copy_file_or_flo
+        from rowgenerators.exceptions import DownloadError
+
+        offset, headers = self._resume_headers(partial_path)
+
+        if revalidate:
+            headers.update(self.index.conditional_headers(cache_path))
+
+        try:
+            r = self._http_get(url, headers=headers)
+        except HTTPError as e:
+            if e.response.status_code != 416 or not offset:
+                raise
 
-                        total_len[0] = total_len[0] + len(d)
+            # Range not satisfiable; the resource must have changed size. Start over.
+            self.cache.remove(partial_path)
+            offset, headers = 0, {k: v for k, v in headers.items() if k not in ('Range', 'If-Range')}
+            r = self._http_get(url, headers=headers)
 
-                        self.callback('ftp read', url, len(d), total_len[0])
+        if r.status_code == 304:
+            r.close()
+            return None
 
-                    ftp.login()
-                    ftp.retrbinary('RETR ' + u['path'], _read)
-                    ftp.quit()
-            except ConnectionError as e:
-                raise DownloadError("Failed to get FTP url '{}': {} ".format(url, e))
+        encoded = bool(r.headers.get('content-encoding'))
+
+        if r.status_code == 206:
+            # Content-Range: bytes start-end/total
+            content_range = r.headers.get('Content-Range', '')
+
+            try:
+                start = int(content_range.split()[1].split('-')[0])
+                total = content_range.split('/')[1]
+                total = None if total == '*' else int(total)
+            except (IndexError, ValueError):
+                raise DownloadError("Bad Content-Range '{}' for {}".format(content_range, url))
+
+            if start != offset:
+                raise DownloadError("Requested range from {} but got {} for {}".format(offset, start, url))
+
+            logger.debug(f"Resuming {url} at {offset}")
 
         else:
+            offset = 0
+
+            # The length of the file will be the Content-Length only if it isn't compressed in transfer.
+            # Ranges are also offsets in the encoded body, so an encoded transfer can't be resumed.
+            total = None if encoded or 'Content-Length' not in r.headers else int(r.headers['Content-Length'])
+
+            if encoded:
+                self.index.set_validators(partial_path)
+            else:
+                self.index.set_validators(partial_path, r.headers.get('ETag'), r.headers.get('Last-Modified'))
+
+            n = self._segment_count(r, total, partial_path)
+
+            if n > 1:
+                return self._download_segments(url, r, partial_path, total, n)
+
+        def copy_cb(message, read_len, total_len):
+            # Message is just the read len
+            self.callback('copy', url, read_len, total_len)
+
+        logger.debug(f"Response code={r.status_code} {r.headers}" )
+
+        with self._partial_writer(partial_path, offset) as f:
+            copy_file_or_flo(r.raw, f, cb=copy_cb)
+
+        if total is not None and f.size != total:
+            raise DownloadError("Incomplete download of {}: got {} of {} bytes".format(url, f.size, total))
+
+        return f
+
+    def _segment_count(self, r, total, partial_path):
+        """Return the number of segments to download a response in, or 0 if it should be downloaded
+        in one stream"""
+        from fs.errors import NoSysPath
+
+        if self.segments < 2 or not total or r.headers.get('Accept-Ranges', '').lower() != 'bytes':
+            return 0
+
+        # The segment requests need a validator for If-Range, so all of them get the same version
+        etag, last_modified = self.index.get_validators(partial_path)
+
+        if not (etag and not etag.startswith('W/')) and not last_modified:
+            return 0
+
+        try:
+            self.cache.getsyspath(partial_path)
+        except NoSysPath:
+            return 0
+
+        return min(self.segments, total // self.segment_size)
+
+    def _download_segments(self, url, r, partial_path, total, n):
+        """Download a response in n byte ranges, concurrently, into a preallocated partial file.
+
+        The first segment is read from the response to the original request, and the others are
+        requested with Range headers. If a segment fails, the partial file is truncated to the bytes
+        that were downloaded contiguously from the start, so the download can be resumed.
+        """
+        import os
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from rowgenerators.appurl.cache import HashingWriter
+        from rowgenerators.exceptions import DownloadError
+
+        sys_path = self.cache.getsyspath(partial_path)
+
+        etag, last_modified = self.index.get_validators(partial_path)
+        validator = etag if etag and not etag.startswith('W/') else last_modified
+
+        bounds = [(i * total // n, (i + 1) * total // n) for i in range(n)]
+        progress = [0] * n
+        failed = threading.Event()
+        lock = threading.Lock()
+        copied = [0]
+        rec = self._current_fetch(url)
+
+        logger.debug(f"Downloading {url} in {n} segments")
+
+        with open(sys_path, 'wb') as f:
+            try:
+                os.posix_fallocate(f.fileno(), 0, total)
+            except (AttributeError, OSError):
+                f.truncate(total)
+
+        def fetch(i):
+            start, end = bounds[i]
+
+            # The segments are part of the download in the calling thread
+            if rec is not None:
+                self._track_fetch(rec)
 
-            logger.debug("Request " + str(url))
+            if i == 0:
+                resp = r
+            else:
+                resp = self._http_get(url, headers={'Range': 'bytes={}-{}'.format(start, end - 1),
+                                                    'If-Range': validator})
 
-            headers = {}
+                if resp.status_code != 206 or \
+                        not resp.headers.get('Content-Range', '').startswith('bytes {}-{}/'.format(start, end - 1)):
+                    resp.close()
+                    raise DownloadError("Server did not return range {}-{} of {}".format(start, end - 1, url))
 
             try:
-                r = requests.get(url, headers=headers, stream=True)
-                r.raise_for_status()
-            except SSLError as e:
-                raise DownloadError("Failed to GET {}: {} ".format(url, e))
-
-            if r.status_code>=300:
-                if r.status_code>=304:
-                    raise DownloadError(f"Server Returned 304: Not Modified. for {str(url)}");
+                with open(sys_path, 'r+b') as f:
+                    f.seek(start)
+
+                    while progress[i] < end - start and not failed.is_set():
+                        buf = resp.raw.read(min(end - start - progress[i], 1024 * 1024))
+
+                        if not buf:
+                            break
+
+                        f.write(buf)
+                        progress[i] += len(buf)
+
+                        with lock:
+                            copied[0] += len(buf)
+                            self.callback('copy', url, len(buf), copied[0])
+            finally:
+                resp.close()
+
+            if progress[i] != end - start:
+                raise DownloadError("Incomplete segment {}-{} of {}: got {} bytes"
+                                    .format(start, end - 1, url, progress[i]))
+
+        try:
+            with ThreadPoolExecutor(max_workers=n) as executor:
+                futures = [executor.submit(fetch, i) for i in range(n)]
+
+                for future in futures:
+                    try:
+                        future.result()
+                    except BaseException:
+                        failed.set()
+                        raise
+
+        except BaseException:
+            keep = 0
+            for (start, end), p in zip(bounds, progress):
+                keep += p
+                if p != end - start:
+                    break
+
+            with open(sys_path, 'r+b') as f:
+                f.truncate(keep)
+
+            raise
+
+        if os.path.getsize(sys_path) != total:
+            raise DownloadError("Incomplete download of {}: got {} of {} bytes"
+                                .format(url, os.path.getsize(sys_path), total))
+
+        # The segments arrive out of order, so the file is hashed after it is complete
+        w = HashingWriter(None)
+
+        with open(sys_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                w.update(chunk)
+
+        return w
+
+    def _download_ftp(self, url, partial_path):
+        """Download an FTP url to a partial file, resuming an earlier partial download with REST. The
+        file's modification time, from MDTM, is stored in place of the HTTP Last-Modified header to check
+        that the file hasn't changed."""
+        from ftplib import FTP, error_perm
+        from rowgenerators.appurl.util import parse_url_to_dict
+        from rowgenerators.exceptions import DownloadError
+
+        logger.debug("Fetch " + str(url))
+
+        u = parse_url_to_dict(url)
+
+        try:
+            with FTP(u['netloc']) as ftp:
+
+                ftp.login()
+                ftp.voidcmd('TYPE I')
+
+                try:
+                    size = ftp.size(u['path'])
+                except error_perm:
+                    size = None
+
+                try:
+                    mdtm = ftp.sendcmd('MDTM ' + u['path'])[4:].strip()
+                except error_perm:
+                    mdtm = None
+
+                offset = 0
+
+                if mdtm and self.cache.exists(partial_path) and \
+                        self.index.get_validators(partial_path) == (None, mdtm):
+                    offset = self.cache.getsize(partial_path)
+
+                    if size is not None and offset > size:
+                        offset = 0
+
+                if offset:
+                    logger.debug(f"Resuming {url} at {offset}")
                 else:
-                    raise DownloadError(f"Can't handle server response, {r.status_code}");
+                    self.index.set_validators(partial_path, None, mdtm)
+
+                with self._partial_writer(partial_path, offset) as f:
+
+                    def _read(d):
+                        f.write(d)
+                        self.callback('ftp read', url, len(d), f.size)
 
-            # Requests will auto decode gzip responses, but not when streaming. This following
-            # monkey patch is recommended by a core developer at
-            # https://github.com/kennethreitz/requests/issues/2155
-            if r.headers.get('content-encoding') in ('gzip', 'br'):
-                r.raw.read = functools.partial(r.raw.read, decode_content=True)
+                    ftp.retrbinary('RETR ' + u['path'], _read, rest=offset or None)
 
-            def copy_cb(message, read_len, total_len):
-                # Message is just the read len
-                self.callback('copy', url, read_len, total_len)
+                ftp.quit()
 
-            logger.debug(f"Response code={r.status_code} {r.headers}" )
+        except ConnectionError as e:
+            raise DownloadError("Failed to get FTP url '{}': {} ".format(url, e))
 
-            with self.cache.open(cache_path, 'wb') as f:
-                copy_file_or_flo(r.raw, f, cb=copy_cb)
+        if size is not None and f.size != size:
+            raise DownloadError("Incomplete download of {}: got {} of {} bytes".format(url, f.size, size))
 
-            assert self.cache.exists(cache_path)
+        return f
 
+    def _http_get(self, url, headers=None):
+        """Start a streaming GET request, and return the response, with the body not yet read"""
+        import functools
+        from requests.exceptions import SSLError
+        from rowgenerators.exceptions import DownloadError
+
+        logger.debug("Request " + str(url))
+
+        headers = headers or {}
+
+        try:
+            r = self.session.get(url, headers=headers, stream=True)
+
+            rec = self._current_fetch(url)
+            if rec is not None:
+                rec.add_response(r)
+
+            r.raise_for_status()
+        except SSLError as e:
+            raise DownloadError("Failed to GET {}: {} ".format(url, e))
+
+        if r.status_code == 304 and ('If-None-Match' in headers or 'If-Modified-Since' in headers):
+            return r # Not modified, for a conditional request
+
+        if r.status_code>=300:
+            if r.status_code>=304:
+                raise DownloadError(f"Server Returned 304: Not Modified. for {str(url)}");
+            else:
+                raise DownloadError(f"Can't handle server response, {r.status_code}");
+
+        # Requests will auto decode gzip responses, but not when streaming. This following
+        # monkey patch is recommended by a core developer at
+        # https://github.com/kennethreitz/requests/issues/2155
+        if r.headers.get('content-encoding') in ('gzip', 'br'):
+            r.raw.read = functools.partial(r.raw.read, decode_content=True)
+
+        return r
+
+
+class _TeeStream(io.RawIOBase):
+    """Read the body of a response, writing a copy of everything read to a temporary
+    file in the cache. At the end of the body, the temporary file is moved to the cache
+    path; if the stream is closed before that, it is deleted."""
+
+    def __init__(self, downloader, url, response, cache_path, lock, rec):
+        from rowgenerators.appurl.cache import HashingWriter
+
+        super().__init__()
+
+        self._downloader = downloader
+        self._url = url
+        self._response = response
+        self._cache_path = cache_path
+        self._tmp_path = cache_path + '.stream'
+        self._lock = lock
+        self._rec = rec
+        self._f = HashingWriter(downloader.cache.openbin(self._tmp_path, 'w'))
+        self._total = 0
+        self._complete = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+
+        if self._complete:
+            return 0
+
+        data = self._response.raw.read(len(b))
+
+        if not data:
+            self._finish()
+            return 0
+
+        self._f.write(data)
+        self._total += len(data)
+        self._rec.add_bytes(len(data))
+        self._downloader.callback('copy', self._url, len(data), self._total)
+
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def _finish(self):
+
+        self._f.close()
+        self._downloader.cache.move(self._tmp_path, self._cache_path, overwrite=True)
+        self._downloader.index.add(self._cache_path, self._url, self._f.size, self._f.hexdigest)
+        self._downloader.store_blob(self._cache_path, self._f.hexdigest)
+        self._downloader.index.set_validators(self._cache_path, self._response.headers.get('ETag'),
+                                              self._response.headers.get('Last-Modified'))
+        self._complete = True
+        self._rec.size = self._f.size
+
+        logger.debug(f"Streamed {self._url} to {self._cache_path}")
+
+    def close(self):
+
+        if self.closed:
+            return
+
+        try:
+            self._response.close()
+
+            if not self._complete:
+                self._f.close()
+
+                if self._downloader.cache.exists(self._tmp_path):
+                    self._downloader.cache.remove(self._tmp_path)
+        finally:
+            self._downloader._streams.discard(self._cache_path)
+            self._lock.release()
+            # A stream closed before the end is an abandoned download, not a failed one, but
+            # nothing was cached.
+            self._downloader._end_fetch(self._rec, MISS if self._complete else ERROR,
+                                        None if self._complete else 'Stream closed before the end')
+            super().close()
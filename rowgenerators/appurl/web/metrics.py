@@ -0,0 +1,201 @@
+# Copyright (c) 2017 Civic Knowledge. This file is licensed under the terms of the
+# MIT, included in this distribution as LICENSE
+
+"""
+Metrics for the fetches made by a Downloader.
+
+Each call to Downloader.download(), prefetch() or open_stream() for a remote resource produces a
+FetchRecord, with the bytes transferred, wall time, time to first byte, whether the resource was
+in the cache, the time spent waiting for the cache lock, and the number of retried requests. When
+the fetch finishes, the record is passed to the Downloader's metrics sink. Sinks are any object with
+a ``record(fetch)`` method; MemoryMetrics aggregates records in memory and JsonLinesMetrics writes
+them to a file, one JSON object per line.
+
+    metrics = MemoryMetrics()
+    dldr = Downloader(metrics=metrics)
+    ...
+    for r in metrics.slowest(5):
+        print(r.url, r.wall_time)
+"""
+
+import threading
+import time
+
+HIT = 'hit'  # The resource was in the cache
+MISS = 'miss'  # The resource was downloaded
+NOT_MODIFIED = 'not_modified'  # The resource was cached, and revalidated with the server
+ERROR = 'error'  # The fetch failed
+
+
+class FetchRecord(object):
+    """Metrics for one fetch of a resource. Times are in seconds, and are None if the event did not
+    happen, such as the time to first byte for a cache hit."""
+
+    fields = ('url', 'cache_path', 'status', 'bytes', 'size', 'start', 'wall_time', 'ttfb',
+              'lock_wait', 'retries', 'error')
+
+    def __init__(self, url):
+        self.url = url
+        self.cache_path = None
+        self.status = None
+        self.bytes = 0  # Bytes read from the network
+        self.size = None  # Size of the cached file
+        self.start = time.time()
+        self.wall_time = None
+        self.ttfb = None
+        self.lock_wait = 0.0
+        self.retries = 0
+        self.error = None
+
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def elapsed(self):
+        """Seconds since the start of the fetch"""
+        return time.perf_counter() - self._t0
+
+    def add_bytes(self, n):
+        # Segmented downloads read in several threads
+        with self._lock:
+            self.bytes += n
+
+    def add_response(self, r):
+        """Record a response: the time to the first response, and the retries urllib3 made to get it"""
+
+        with self._lock:
+            if self.ttfb is None:
+                self.ttfb = self.elapsed()
+
+            try:
+                self.retries += len(r.raw.retries.history)
+            except AttributeError:
+                pass
+
+    def finish(self, status, error=None):
+        self.status = status
+        self.error = str(error) if error is not None else None
+        self.wall_time = self.elapsed()
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.fields}
+
+    def __repr__(self):
+        return '<FetchRecord {} {} {} bytes {:.3f}s>'.format(self.status, self.url, self.bytes,
+                                                               self.wall_time or 0)
+
+
+class MetricsSink(object):
+    """Base class for metrics sinks"""
+
+    def record(self, fetch):
+        """Receive the FetchRecord for a finished fetch"""
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class MemoryMetrics(MetricsSink):
+    """Collect fetch records in memory, and aggregate them"""
+
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+
+    def record(self, fetch):
+        with self._lock:
+            self.records.append(fetch)
+
+    def clear(self):
+        with self._lock:
+            self.records = []
+
+    @staticmethod
+    def _aggregate(records):
+
+        d = {
+            'count': len(records),
+            'hits': sum(1 for r in records if r.status in (HIT, NOT_MODIFIED)),
+            'misses': sum(1 for r in records if r.status == MISS),
+            'errors': sum(1 for r in records if r.status == ERROR),
+            'bytes': sum(r.bytes for r in records),
+            'wall_time': sum(r.wall_time or 0 for r in records),
+            'lock_wait': sum(r.lock_wait for r in records),
+            'retries': sum(r.retries for r in records),
+        }
+
+        ttfbs = [r.ttfb for r in records if r.ttfb is not None]
+        d['mean_ttfb'] = sum(ttfbs) / len(ttfbs) if ttfbs else None
+        d['hit_rate'] = d['hits'] / d['count'] if d['count'] else None
+
+        return d
+
+    def summary(self):
+        """Return a dict of totals for all of the fetches: count, hits, misses, errors, bytes, wall_time,
+        lock_wait, retries, mean_ttfb and hit_rate"""
+
+        with self._lock:
+            return self._aggregate(list(self.records))
+
+    def by_url(self):
+        """Return a dict of urls to the summary of the fetches of each url"""
+
+        groups = {}
+
+        with self._lock:
+            for r in self.records:
+                groups.setdefault(r.url, []).append(r)
+
+        return {url: self._aggregate(records) for url, records in groups.items()}
+
+    def slowest(self, n=10):
+        """Return the n fetches with the longest wall time"""
+
+        with self._lock:
+            return sorted(self.records, key=lambda r: r.wall_time or 0, reverse=True)[:n]
+
+
+class JsonLinesMetrics(MetricsSink):
+    """Write each fetch record to a file as a line of JSON
+
+    :param f: Path of the file to append to, or a text file object
+    """
+
+    def __init__(self, f):
+
+        if isinstance(f, str):
+            self._f = open(f, 'a')
+            self._close = True
+        else:
+            self._f = f
+            self._close = False
+
+        self._lock = threading.Lock()
+
+    def record(self, fetch):
+        import json
+
+        line = json.dumps(fetch.as_dict())
+
+        with self._lock:
+            self._f.write(line + '\n')
+            self._f.flush()
+
+    def close(self):
+        if self._close:
+            self._f.close()
+
+
+class MultiMetrics(MetricsSink):
+    """Send fetch records to several sinks"""
+
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def record(self, fetch):
+        for s in self.sinks:
+            s.record(fetch)
+
+    def close(self):
+        for s in self.sinks:
+            s.close()
@@ -17,6 +17,9 @@ class WebUrl(Url):
 
     match_priority = 20
 
+    # Target formats that generators can parse from a stream, while it downloads
+    streaming_formats = ('csv', 'tsv', 'pipe', 'json')
+
     def __init__(self, url=None, downloader=None, **kwargs):
 
         self._resource = None  # return value from the downloader
@@ -62,6 +65,52 @@ class WebUrl(Url):
 
         return ru
 
+    def _can_stream(self):
+        """Return True if the generator for this URL can read the resource while it downloads"""
+        from fs.errors import NoSysPath
+
+        if not getattr(self._downloader, 'streaming', False):
+            return False
+
+        if not self.scheme.startswith('http') or self.scheme_extension:
+            return False
+
+        # Archives have to be downloaded completely to find the target file
+        if self.resource_format != self.target_format or self.target_format not in self.streaming_formats:
+            return False
+
+        if self._downloader.is_cached(self.resource_url):
+            return False
+
+        try:
+            self._downloader.cache.getsyspath('/')
+        except NoSysPath:
+            return False
+
+        return True
+
+    @property
+    def generator(self):
+        """Return the generator for this URL. If the downloader has streaming enabled, CSV and JSON
+        resources that are not in the cache yet are parsed while they download, and copied
+        into the cache as they are read. """
+        import functools
+        from rowgenerators import parse_app_url
+        from rowgenerators.core import get_generator
+
+        if not self._can_stream():
+            return super().generator
+
+        d = self._downloader
+
+        ru = parse_app_url(d.cache.getsyspath(d.cache_path(self.resource_url)),
+                           downloader=d,
+                           scheme_extension=self.scheme_extension,
+                           **self.frag_dict)
+
+        return get_generator(ru.get_target(), source_url=self,
+                             opener=functools.partial(d.open_stream, self.resource_url))
+
     def dirname(self):
         from os.path import dirname
         return dirname(self.path)
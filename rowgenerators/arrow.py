@@ -0,0 +1,160 @@
+# Copyright (c) 2017 Civic Knowledge. This file is licensed under the terms of the
+# MIT License, included in this distribution as LICENSE.txt
+
+"""
+Convert the output of row generators to Apache Arrow record batches. Requires the
+optional pyarrow package.
+"""
+
+import datetime
+
+from rowgenerators.exceptions import RowGeneratorError
+
+# Type names used in the 'type' field of the dicts returned by Source.columns
+_TYPE_NAMES = {
+    'int': 'int64',
+    'integer': 'int64',
+    'long': 'int64',
+    'float': 'float64',
+    'real': 'float64',
+    'number': 'float64',
+    'str': 'string',
+    'string': 'string',
+    'text': 'string',
+    'unicode': 'string',
+    'bool': 'bool',
+    'boolean': 'bool',
+    'date': 'date32',
+    'datetime': 'timestamp',
+    'time': 'time64',
+    'bytes': 'binary',
+}
+
+
+def arrow_type(t):
+    """Return the Arrow type for a Python type or a type name, or None if there is no
+    direct equivalent and the type should be inferred from the data.
+
+    :param t: A Python type, such as int, or a type name, such as 'int'
+    :return: A pyarrow.DataType, or None
+    """
+    import pyarrow as pa
+
+    if t is None:
+        return None
+
+    if isinstance(t, pa.DataType):
+        return t
+
+    if isinstance(t, str):
+        t = _TYPE_NAMES.get(t.lower())
+
+    elif isinstance(t, type):
+        # bool is a subclass of int, and datetime a subclass of date, so the order matters.
+        for pt, name in ((bool, 'bool'), (int, 'int64'), (float, 'float64'), (str, 'string'),
+                         (bytes, 'binary'), (datetime.datetime, 'timestamp'),
+                         (datetime.date, 'date32'), (datetime.time, 'time64')):
+            if issubclass(t, pt):
+                t = name
+                break
+        else:
+            t = None
+
+    else:
+        t = None
+
+    if t is None:
+        return None
+    elif t == 'timestamp':
+        return pa.timestamp('us')
+    elif t == 'time64':
+        return pa.time64('us')
+    else:
+        return getattr(pa, t)()
+
+
+def column_types(columns):
+    """Return a dict of column names to Arrow types, from a Source.columns list, or a Table from
+    rowgenerators.table or rowgenerators.rowpipe.
+
+    :param columns: A list of dicts with 'name' and 'type' keys, or an object with a ``columns``
+        attribute holding objects with ``name`` and ``datatype`` attributes
+    :return: dict
+    """
+
+    if columns is None:
+        return {}
+
+    columns = getattr(columns, 'columns', columns)
+
+    types = {}
+
+    for c in columns:
+        if isinstance(c, dict):
+            name, t = c.get('name'), c.get('type')
+        else:
+            name, t = c.name, getattr(c, 'datatype', None)
+
+        at = arrow_type(t)
+
+        if name is not None and at is not None:
+            types[name] = at
+
+    return types
+
+
+def record_batches(batches, columns=None):
+    """Convert the output of Source.iter_batches() into Arrow record batches
+
+    The types of the columns come from ``columns``. Columns that don't have a declared type get
+    the type that Arrow infers from the first batch, and later batches are converted to the same
+    schema.
+
+    :param batches: Iterator of a header row, then lists of columns
+    :param columns: Column type declarations, see column_types()
+    :return: A generator of pyarrow.RecordBatch
+    """
+    import pyarrow as pa
+
+    itr = iter(batches)
+
+    try:
+        headers = [str(h) for h in next(itr)]
+    except StopIteration:
+        return
+
+    types = column_types(columns)
+
+    schema = None
+
+    for cols in itr:
+
+        n = len(cols[0]) if len(cols) else 0
+
+        if schema is None and len(cols) > len(headers):
+            headers += ['col{}'.format(i) for i in range(len(headers), len(cols))]
+
+        # Short rows leave trailing columns out of the batch
+        cols = list(cols) + [[None] * n] * (len(headers) - len(cols))
+
+        if schema is None:
+            arrays = []
+            for name, values in zip(headers, cols):
+                try:
+                    arrays.append(pa.array(values, type=types.get(name), from_pandas=True))
+                except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError) as e:
+                    raise RowGeneratorError("Failed to convert column '{}' to Arrow: {}".format(name, e))
+
+            schema = pa.schema([pa.field(h, a.type) for h, a in zip(headers, arrays)])
+
+        else:
+            arrays = []
+            for field, values in zip(schema, cols):
+                try:
+                    arrays.append(pa.array(values, type=field.type, from_pandas=True))
+                except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError) as e:
+                    raise RowGeneratorError("Failed to convert column '{}' to Arrow type {}: {}. "
+                                            "Declare the column type to avoid inferring it from the first batch"
+                                            .format(field.name, field.type, e))
+
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
@@ -6,7 +6,6 @@ from __future__ import print_function
 import sys
 from itertools import islice
 
-from pkg_resources import iter_entry_points
 from rowgenerators.appurl.enumerate import enumerate_contents
 from rowgenerators.appurl.url import Url
 from rowgenerators.exceptions import SourceError, TextEncodingError
@@ -160,13 +159,16 @@ def listrowgen():
 
     args = parser.parse_args(sys.argv[1:])
 
+    from rowgenerators.registry import get_registry, GENERATOR_GROUP
+
     entries = []
-    for ep in iter_entry_points('rowgenerators'):
+    for e in get_registry(GENERATOR_GROUP).entries:
         try:
-            c = ep.load()
-        except Exception as e:
-            warn('Error:', ep.name, e)
-        entries.append([ep.name, ep.module_name, c.__name__, ])
+            c = e.load()
+        except Exception as exc:
+            warn('Error:', e.name, exc)
+            continue
+        entries.append([e.name, e.module, c.__name__, ])
 
 
     print(tabulate(sorted(entries), ['EP Name', 'Module', 'Class']))
@@ -1,19 +1,36 @@
 
 from . import DEFAULT_EPSG
 
-import warnings
-from pyproj import CRS
+from functools import lru_cache
 
-# Project changed the way to specify the CRS
-with warnings.catch_warnings(record=True) as w:
-    warnings.simplefilter("error")
-    try:
 
-        DEFAULT_CRS_SPEC = {'init': f'epsg:{DEFAULT_EPSG}'}
-        CRS(DEFAULT_CRS_SPEC)
-    except:
-        DEFAULT_CRS_SPEC = f'EPSG:{DEFAULT_EPSG}'
-        CRS(DEFAULT_CRS_SPEC)
+@lru_cache()
+def default_crs_spec():
+    """Return the CRS specification for DEFAULT_EPSG, in the form that the installed
+    version of pyproj accepts"""
+    import warnings
+    from pyproj import CRS
+
+    # Project changed the way to specify the CRS
+    with warnings.catch_warnings(record=True) as w:
+        warnings.simplefilter("error")
+        try:
+
+            spec = {'init': f'epsg:{DEFAULT_EPSG}'}
+            CRS(spec)
+        except:
+            spec = f'EPSG:{DEFAULT_EPSG}'
+            CRS(spec)
+
+    return spec
+
+
+def __getattr__(name):
+    # DEFAULT_CRS_SPEC used to be computed at import, which imports pyproj.
+    if name == 'DEFAULT_CRS_SPEC':
+        return default_crs_spec()
+
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
 
 
 def geoframe(url):
@@ -116,7 +133,7 @@ def geoframe(url, downloader='default', *args, **kwargs):
         # Wild guess. This case should be most often for Metatab processed geo files,
         # which are all 4326
         if gdf.crs is None:
-            gdf.crs = DEFAULT_CRS_SPEC
+            gdf.crs = default_crs_spec()
 
     except KeyError as e:
         raise SourceError("Failed to create GeoDataFrame for resource '{}': No geometry column".format(t))
@@ -156,7 +173,7 @@ def get_generator(source,  **kwargs):
     """
     import inspect
     import collections
-    from pkg_resources import iter_entry_points
+    from rowgenerators.registry import get_registry, GENERATOR_GROUP
     from rowgenerators.exceptions import RowGeneratorError
     from rowgenerators.appurl import parse_app_url, Url
     from rowgenerators.source import Source
@@ -226,8 +243,7 @@ def get_generator(source,  **kwargs):
     else:
         raise RowGeneratorError("Unknown arg type for source {}, type='{}'".format(source, type(source)))
 
-    classes = sorted([ep.load() for ep in iter_entry_points(group='rowgenerators') if ep.name in names],
-                     key=lambda cls: cls.priority)
+    classes = get_registry(GENERATOR_GROUP).classes(names, key=lambda cls: cls.priority)
 
     if not classes:
         raise RowGeneratorError(("Can't find generator for url '{}' \ntype={}, proto={}, "
@@ -5,20 +5,158 @@
 
 import sys
 import os
-from rowgenerators.source import Source
+from itertools import islice
+from rowgenerators.source import Source, DEFAULT_BATCH_SIZE, iter_column_batches
+from rowgenerators.generator.mapped import open_lines, is_ascii_compatible
 import warnings
 
+DEFAULT_CHUNK_SIZE = 64 * 1024 * 1024
+
+_SCAN_BLOCK_SIZE = 1024 * 1024
+
+
+def record_ranges(f, size, chunk_size=DEFAULT_CHUNK_SIZE, quotechar=b'"'):
+    """Split a binary CSV file into byte ranges of roughly chunk_size bytes that start and end on
+    record boundaries.
+
+    A newline only ends a record if it is outside of a quoted field, which is usually the case when
+    the number of quote characters before it is even. Doubled quotes inside a field count twice,
+    so they don't change the parity. A quote character in an unquoted field, which the csv module
+    reads as a literal character, does, so the ranges may not end on record boundaries; _parse_range()
+    checks that they do. Dialects with an escapechar, or without doublequote, can't be split this way.
+
+    :param f: File object, opened in binary mode
+    :param size: Size of the file, in bytes
+    :param chunk_size: Target size of each range
+    :param quotechar: Quote character, as bytes
+    :return: Generator of (start, end) tuples
+    """
+
+    start = 0
+
+    while start + chunk_size < size:
+
+        # Count quotes from the start of the range up to the target
+        f.seek(start)
+        pos = start
+        target = start + chunk_size
+        parity = 0
+
+        while pos < target:
+            block = f.read(min(_SCAN_BLOCK_SIZE, target - pos))
+            parity ^= block.count(quotechar) & 1
+            pos += len(block)
+
+        # Then look for the first newline that isn't inside a quoted field.
+        end = None
+
+        while end is None:
+            block = f.read(_SCAN_BLOCK_SIZE)
+
+            if not block:
+                break
+
+            i = 0
+
+            while True:
+                nl = block.find(b'\n', i)
+
+                if nl == -1:
+                    parity ^= block.count(quotechar, i) & 1
+                    break
+
+                parity ^= block.count(quotechar, i, nl) & 1
+
+                if parity == 0:
+                    end = pos + nl + 1
+                    break
+
+                i = nl + 1
+
+            pos += len(block)
+
+        if end is None or end >= size:
+            break
+
+        yield start, end
+
+        start = end
+
+    yield start, size
+
+
+# Line added to the end of a range, to check that the range ends on a record boundary
+_RANGE_END = 'rowgenerators range end'
+
+
+def _parse_range(args):
+    """Parse the rows in one byte range of a CSV file. Runs in a worker process.
+
+    For ranges other than the last one, the parser must be at the start of a record at the end of
+    the range, or the range ends inside a quoted field. This is checked by parsing one more line after
+    the range, which is only a row by itself if the parser was at the start of a record.
+
+    :return: The rows, or None if the range doesn't end on a record boundary
+    """
+    import csv
+    import io
+    from itertools import chain
+
+    path, start, end, encoding, fmtparams, last = args
+
+    CsvSource._set_field_size_limit()
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    # TextIOWrapper applies the same universal newline handling as open() in text mode
+    with io.TextIOWrapper(io.BytesIO(data), encoding=encoding) as tf:
+
+        if last:
+            return list(csv.reader(tf, **fmtparams))
+
+        rows = list(csv.reader(chain(tf, [_RANGE_END + '\n']), **fmtparams))
+
+    if not rows or rows[-1] != [_RANGE_END]:
+        return None
+
+    return rows[:-1]
+
+
 class CsvSource(Source):
-    """Generate rows from a CSV source"""
+    """Generate rows from a CSV source
+
+    Large files can be parsed in parallel by passing ``workers``, the number of processes
+    to use. The file is split into byte ranges of about ``chunk_size`` bytes, which are parsed
+    in a process pool. The rows of a range are only yielded after all of the ranges before it
+    have been parsed, since that checks that the range starts on a record boundary, so rows are
+    in file order, even if ``ordered`` is False. If a range doesn't end on a record boundary,
+    which can happen when an unquoted field has a quote character in it, the rest of the file is
+    read without the pool.
+
+    ``opener`` is a callable that returns a binary file object. If it is set and the file
+    does not exist yet, the rows are parsed from that file object instead, which is how
+    web resources are parsed while they download.
+    """
 
     delimiter = ','
+    quotechar = '"'
+    escapechar = None
+    doublequote = True
 
-    def __init__(self, ref, cache=None, working_dir=None, env=None, **kwargs):
+    def __init__(self, ref, cache=None, working_dir=None, env=None, workers=None, ordered=True,
+                 chunk_size=DEFAULT_CHUNK_SIZE, opener=None, **kwargs):
         super().__init__(ref, cache, working_dir, **kwargs)
 
         self.url = ref
 
-        if not self.url.exists():
+        self.workers = workers
+        self.ordered = ordered
+        self.chunk_size = chunk_size
+        self.opener = opener
+
+        if self.opener is None and not self.url.exists():
             raise FileNotFoundError(self.url)
 
         if self.url.scheme != 'file':
@@ -27,8 +165,8 @@ class CsvSource(Source):
 
         self._meta = {}
 
-    def __iter__(self):
-        """Iterate over all of the lines in the file"""
+    @staticmethod
+    def _set_field_size_limit():
 
         import csv
 
@@ -44,21 +182,136 @@ class CsvSource(Source):
         except OverflowError as e:
             # skip setting the limit for now
             pass
-        
-        self.start()
 
-        try:
-            encoding = self.url.encoding or 'utf8'
+    def _fmtparams(self):
+        """Return the csv.reader() formatting parameters for the file"""
+        return dict(delimiter=self.delimiter, quotechar=self.quotechar, escapechar=self.escapechar,
+                    doublequote=self.doublequote)
+
+    def _streaming(self):
+        """Return True if the rows should be read from the opener rather than the file"""
+        return self.opener is not None and not os.path.exists(self.url.fspath)
 
-            with open(self.url.fspath, encoding=encoding) as f:
+    def _open_lines(self):
+        encoding = self.url.encoding or 'utf8'
 
-                yield from csv.reader(f, delimiter=self.delimiter)
+        return open_lines(self.url.fspath, encoding, self.url.compression,
+                          opener=self.opener if self._streaming() else None)
+
+    def _use_parallel(self):
+        """Return True if the file should be parsed with the process pool"""
+
+        if not self.workers or self.workers < 2 or self._streaming():
+            return False
+
+        if self.url.compression and self.url.compression != 'none':
+            return False
+
+        if not is_ascii_compatible(self.url.encoding or 'utf8'):
+            return False
+
+        # Escaped quotes would change the quote count that record_ranges() uses
+        if self.escapechar is not None or not self.doublequote:
+            return False
+
+        return os.path.getsize(self.url.fspath) > self.chunk_size
+
+    def _iter_parallel(self):
+        """Parse byte ranges of the file in a process pool and yield the rows"""
+        from collections import deque
+        from concurrent.futures import ProcessPoolExecutor
+
+        path = str(self.url.fspath)
+        encoding = self.url.encoding or 'utf8'
+        size = os.path.getsize(path)
+        fmtparams = self._fmtparams()
+
+        # Limit the number of ranges in flight, so a fast reader doesn't fill memory with
+        # parsed rows that haven't been consumed
+        window = self.workers * 2
+
+        with open(path, 'rb') as f, ProcessPoolExecutor(max_workers=self.workers) as executor:
+
+            ranges = ((path, start, end, encoding, fmtparams, end == size)
+                      for start, end in record_ranges(f, size, self.chunk_size, self.quotechar.encode(encoding)))
+
+            pending = deque((args[1], executor.submit(_parse_range, args)) for args in islice(ranges, window))
+
+            while pending:
+                start, fut = pending.popleft()
+                rows = fut.result()
+
+                if rows is None:
+                    # The range before this one ended on a record boundary, so this one starts on one.
+                    for _, fut in pending:
+                        fut.cancel()
+
+                    yield from self._iter_serial(path, start, encoding)
+                    return
+
+                for args in islice(ranges, 1):
+                    pending.append((args[1], executor.submit(_parse_range, args)))
+
+                yield from rows
+
+    def _iter_serial(self, path, start, encoding):
+        """Parse the file from a byte offset that starts a record, without the pool"""
+        import csv
+        import io
+
+        with open(path, 'rb') as f:
+            f.seek(start)
+
+            with io.TextIOWrapper(f, encoding=encoding) as tf:
+                yield from csv.reader(tf, **self._fmtparams())
+
+    def __iter__(self):
+        """Iterate over all of the lines in the file"""
+
+        import csv
+
+        self._set_field_size_limit()
+
+        self.start()
+
+        if self._use_parallel():
+            yield from self._iter_parallel()
+            self.finish()
+            return
+
+        try:
+            yield from csv.reader(self._open_lines(), **self._fmtparams())
 
         except UnicodeError as e:
             raise
 
         self.finish()
 
+    def iter_batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        """Yield the header, then blocks of up to batch_size rows as lists of columns, reading
+        the rows for each block directly from the csv reader"""
+
+        import csv
+
+        if self._use_parallel():
+            yield from super().iter_batches(batch_size)
+            return
+
+        self._set_field_size_limit()
+
+        self.start()
+
+        reader = csv.reader(self._open_lines(), **self._fmtparams())
+
+        try:
+            yield next(reader)
+        except StopIteration:
+            return
+
+        yield from iter_column_batches(reader, batch_size)
+
+        self.finish()
+
     def finish(self):
         super().finish()
 
@@ -85,15 +338,26 @@ class CsvSource(Source):
         if not 'sep' in kwargs:
             kwargs['sep'] = self.delimiter
 
+        if self.url.compression and not 'compression' in kwargs:
+            kwargs['compression'] = None if self.url.compression == 'none' else self.url.compression
+
         last_exception = None
 
+        streaming = self._streaming()
+
+        src = self.opener() if streaming else self.url.fspath
+
         while True:
 
             try:
 
-                return pandas.read_csv(self.url.fspath, *args, **kwargs)
+                return pandas.read_csv(src, *args, **kwargs)
             except Exception as e:
                 last_exception = e
+            finally:
+                # Readers for chunks read the stream after this returns
+                if streaming and not kwargs.get('chunksize') and not kwargs.get('iterator'):
+                    src.close()
 
             if 'not in list' in str(last_exception) and 'parse_dates' in kwargs:
 
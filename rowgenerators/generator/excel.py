@@ -4,7 +4,7 @@
 """ """
 
 from rowgenerators.exceptions import RowGeneratorError
-from rowgenerators.source import Source
+from rowgenerators.source import Source, DEFAULT_BATCH_SIZE
 
 # Fixes https://stackoverflow.com/a/65131301
 import xlrd
@@ -42,10 +42,8 @@ class ExcelSource(Source):
 
         return values
 
-    def __iter__(self):
-        """Iterate over all of the lines in the file"""
-
-        self.start()
+    def _open_sheet(self):
+        """Open the workbook and return the sheet selected by the target segment"""
 
         wb = open_workbook(filename=str(self.url.fspath))
 
@@ -61,21 +59,47 @@ class ExcelSource(Source):
             try:
                 sheets = wb.sheets()
                 sheet_no = int(ts)
-                s = sheets[sheet_no]
+                return sheets[sheet_no]
             except (ValueError, IndexError):
                 # ValueError when Segment is the workbook name, not the number
                 # IndexError when the segment is a numeric name, such as a year,
                 # which converted with int(), but is larger than the # of sheets
-                s = wb.sheet_by_name(ts)
+                return wb.sheet_by_name(ts)
 
         except XLRDError as e:
             raise RowGeneratorError("Failed to open Excel workbook: '{}' ".format(e))
 
+    def __iter__(self):
+        """Iterate over all of the lines in the file"""
+
+        self.start()
+
+        s = self._open_sheet()
+
         for i in range(0, s.nrows):
             yield self.srow_to_list(i, s)
 
         self.finish()
 
+    def iter_batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        """Yield the header, then blocks of up to batch_size rows as lists of columns, read
+        with whole column slices from the sheet rather than cell by cell"""
+
+        self.start()
+
+        s = self._open_sheet()
+
+        if s.nrows == 0:
+            return
+
+        yield self.srow_to_list(0, s)
+
+        for start in range(1, s.nrows, batch_size):
+            end = min(start + batch_size, s.nrows)
+            yield [s.col_values(col, start, end) for col in range(s.ncols)]
+
+        self.finish()
+
     @property
     def children(self):
         """Return the sheet names from the workbook """
@@ -3,15 +3,19 @@
 
 """ """
 
+import os
+
 from rowgenerators.source import Source
+from rowgenerators.generator.mapped import open_lines
 
 class FixedSource(Source):
     """Generate rows from a fixed-width source"""
 
-    def __init__(self, ref, table=None, cache=None, working_dir=None, env=None, **kwargs):
+    def __init__(self, ref, table=None, cache=None, working_dir=None, env=None, opener=None, **kwargs):
         super().__init__(ref, cache, working_dir, **kwargs)
 
         self.table = table
+        self.opener = opener # Callable returning a binary stream to read if the file doesn't exist
 
         assert self.table
 
@@ -23,9 +27,10 @@ class FixedSource(Source):
         parse = self.table.make_fw_row_parser()
 
 
-        with open(self.ref.fspath) as f:
-            for line in f.readlines():
-                yield parse(line)
+        opener = self.opener if self.opener is not None and not os.path.exists(self.ref.fspath) else None
+
+        for line in open_lines(self.ref.fspath, self.ref.encoding or 'utf8', self.ref.compression, opener=opener):
+            yield parse(line)
 
         self.finish()
 
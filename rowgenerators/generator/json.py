@@ -6,6 +6,8 @@
 import sys
 import os
 from rowgenerators.source import Source
+from rowgenerators.appurl.util import open_decompressed
+from io import TextIOWrapper
 import json
 
 class JsonRowSource(Source):
@@ -13,12 +15,13 @@ class JsonRowSource(Source):
 
     delimiter = ','
 
-    def __init__(self, ref, cache=None, working_dir=None, env=None, **kwargs):
+    def __init__(self, ref, cache=None, working_dir=None, env=None, opener=None, **kwargs):
         super().__init__(ref, cache, working_dir, **kwargs)
 
         self.url = ref
+        self.opener = opener # Callable returning a binary stream to read if the file doesn't exist yet
 
-        if not self.url.exists():
+        if self.opener is None and not self.url.exists():
             raise FileNotFoundError(self.url)
 
         if self.url.scheme != 'file':
@@ -37,8 +40,13 @@ class JsonRowSource(Source):
             # Python 3.6 considers None to mean 'utf8', but Python 3.5 considers it to be 'ascii'
             encoding = self.url.encoding or 'utf8'
 
-            with open(self.url.fspath, encoding=encoding) as f:
-                yield from json.load(f)
+            if self.opener is not None and not os.path.exists(self.url.fspath):
+                with self.opener() as raw, \
+                        TextIOWrapper(open_decompressed(raw, self.url.compression), encoding=encoding) as f:
+                    yield from json.load(f)
+            else:
+                with TextIOWrapper(open_decompressed(self.url.fspath, self.url.compression), encoding=encoding) as f:
+                    yield from json.load(f)
 
         except UnicodeError as e:
             raise
@@ -57,12 +65,5 @@ class JsonRowSource(Source):
 
 
     def dataframe(self, limit=None, *args, **kwargs):
-        import pandas
 
-        i = iter(self)
-
-        columns =  next(i)
-
-        rows = list(i)
-
-        return pandas.DataFrame(rows, columns=columns)
+        return super().dataframe(*args, **kwargs)
@@ -0,0 +1,106 @@
+# Copyright (c) 2017 Civic Knowledge. This file is licensed under the terms of the
+# MIT License, included in this distribution as LICENSE.txt
+
+""" Line readers for text sources that scan memory mapped files, so reading a large
+file doesn't require holding it in memory. """
+
+import mmap
+from io import StringIO
+
+
+def is_ascii_compatible(encoding):
+    """Return True if the encoding represents newlines, quotes and delimiters as single ASCII bytes, so
+    the file can be split on raw bytes"""
+    import codecs
+
+    try:
+        name = codecs.lookup(encoding).name
+    except LookupError:
+        return False
+
+    if name.startswith('utf-16') or name.startswith('utf-32') or name == 'utf-8-sig':
+        return False
+
+    try:
+        return '\n\r",\t|'.encode(name) == b'\n\r",\t|'
+    except UnicodeError:
+        return False
+
+
+BLOCK_SIZE = 1024 * 1024
+
+
+def mapped_lines(f, encoding='utf8', block_size=BLOCK_SIZE):
+    """Yield the lines of a binary file, from a memory map of the file. The map is decoded a block of
+    whole lines at a time, directly from the map without copying the bytes first, so only one block
+    of text is held in memory at once.
+
+    Line ends are translated the same way as a file opened in text mode, so the lines are
+    the same as iterating ``open(path, encoding=encoding)``
+
+    :param f: File object, opened in binary mode.
+    :param encoding: Text encoding, which must be ASCII compatible
+    :param block_size: Approximate number of bytes to decode at once.
+    :return: A generator of str lines
+    """
+
+    try:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # Can't map an empty file
+        return
+
+    with mm:
+
+        if hasattr(mm, 'madvise'):
+            mm.madvise(mmap.MADV_SEQUENTIAL)
+
+        mv = memoryview(mm)
+
+        try:
+            size = len(mm)
+            pos = 0
+
+            while pos < size:
+                # End the block on a newline, so '\r\n' and multibyte characters are never split
+                nl = mm.rfind(b'\n', pos, pos + block_size)
+
+                if nl == -1:
+                    nl = mm.find(b'\n', pos + block_size)
+
+                end = size if nl == -1 else nl + 1
+
+                yield from StringIO(str(mv[pos:end], encoding), newline=None)
+
+                pos = end
+        finally:
+            mv.release()
+
+
+def open_lines(path, encoding='utf8', compression=None, opener=None):
+    """Yield the lines of a text file, using mapped_lines() when the encoding allows it, and
+    a regular text file otherwise. Compressed files are decompressed as they are read.
+
+    :param path: Path to the file
+    :param encoding: Text encoding
+    :param compression: Compression of the file, see rowgenerators.appurl.util.open_decompressed()
+    :param opener: Optional callable that returns a binary file object to read instead of
+        the path, such as a download stream. The file object is closed when the generator is.
+    :return: A generator of str lines
+    """
+    from io import TextIOWrapper
+    from rowgenerators.appurl.util import open_decompressed
+
+    if opener is not None:
+        # Decompressors don't close the file objects they wrap, so close it separately
+        with opener() as raw, TextIOWrapper(open_decompressed(raw, compression), encoding=encoding) as f:
+            yield from f
+    elif compression and compression != 'none':
+        with TextIOWrapper(open_decompressed(path, compression), encoding=encoding) as f:
+            yield from f
+    elif is_ascii_compatible(encoding):
+        with open(path, 'rb') as f:
+            yield from mapped_lines(f, encoding)
+    else:
+        with open(path, encoding=encoding) as f:
+            yield from f
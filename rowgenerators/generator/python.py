@@ -8,7 +8,7 @@ import types
 from itertools import islice
 
 from rowgenerators.exceptions import RowGeneratorError
-from rowgenerators.source import Source
+from rowgenerators.source import Source, DEFAULT_BATCH_SIZE
 from rowgenerators.appurl.util import import_name_or_class
 
 
@@ -61,15 +61,7 @@ class PythonSource(Source):
 
         o = self()
 
-        if isinstance(o, types.GeneratorType):
-
-            # Just normal data, so use the iterator in this object.
-            headers = next(islice(self, 0, 1))
-            data = islice(self, 1, None)
-
-            return DataFrame(list(data), columns=headers)
-
-        elif isinstance(o, DataFrame):
+        if isinstance(o, DataFrame) and not kwargs.get('chunksize'):
             return o
 
         else:
@@ -139,3 +131,13 @@ class PandasDataframeSource(Source):
                 yield idx_list(index) + list(row)
 
         self.finish()
+
+    def iter_batches(self, batch_size=DEFAULT_BATCH_SIZE):
+
+        from rowgenerators.generator.stata import iterate_pandas_batches
+
+        self.start()
+
+        yield from iterate_pandas_batches(self._df, batch_size)
+
+        self.finish()
@@ -29,10 +29,12 @@ class SocrataSource(Source):
     @property
     def _meta(self):
         """Return the Socrata meta data, as a nested dict"""
-        import requests
+        from rowgenerators.appurl.web.download import Downloader
 
         if not self._socrata_meta:
-            r = requests.get(self.spec.url)
+            downloader = getattr(self.spec, 'downloader', None) or Downloader.get_instance()
+
+            r = downloader.session.get(self.spec.url)
 
             r.raise_for_status()
 
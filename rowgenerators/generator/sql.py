@@ -5,7 +5,7 @@
 
 import sys
 from rowgenerators.exceptions import SourceError, RowGeneratorError
-from rowgenerators.source import Source
+from rowgenerators.source import Source, DEFAULT_BATCH_SIZE, rows_to_columns
 
 class SqlSource(Source):
     """Generate rows from a callable object. Takes kwargs from the spec to pass into the program. """
@@ -22,7 +22,7 @@ class SqlSource(Source):
 
         self.kwargs = kwargs
 
-    def __iter__(self):
+    def _execute(self):
 
         from sqlalchemy import create_engine
         from sqlalchemy.exc import  DatabaseError
@@ -34,11 +34,30 @@ class SqlSource(Source):
             raise RowGeneratorError("Database connection failed for dsn '{}' : {} ".format(self.ref.dsn,str(e)))
 
         try:
-            r = connection.execute(self.ref.sql)
+            return connection.execute(self.ref.sql)
         except DatabaseError as e:
             raise RowGeneratorError("Database query failed for dsn '{}' : {} ".format(self.ref.dsn,str(e) ))
 
+    def __iter__(self):
+
+        r = self._execute()
+
         yield r.keys()
 
         yield from r
 
+    def iter_batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        """Yield the header, then blocks of rows as lists of columns, fetched from the
+        cursor batch_size rows at a time"""
+
+        r = self._execute()
+
+        yield list(r.keys())
+
+        while True:
+            rows = r.fetchmany(batch_size)
+
+            if not rows:
+                break
+
+            yield rows_to_columns(rows)
@@ -5,7 +5,7 @@
 
 import sys
 from rowgenerators.exceptions import SourceError, RowGeneratorError
-from rowgenerators.source import Source
+from rowgenerators.source import Source, DEFAULT_BATCH_SIZE
 from rowgenerators.appurl import parse_app_url
 import pandas as pd
 import numpy as np
@@ -39,6 +39,31 @@ def iterate_pandas(df):
         for index, row in df.iterrows():
             yield idx_list(index) + list(row)
 
+def iterate_pandas_batches(df, batch_size=DEFAULT_BATCH_SIZE):
+    """Like iterate_pandas(), but after the header, yield blocks of up to batch_size rows as lists of
+    columns, sliced from the dataframe a column at a time rather than row by row"""
+
+    if len(df.index.names) == 1 and df.index.names[0] is None and df.index.dtype != np.dtype('O'):
+
+        yield list(df.columns)
+
+        index_levels = []
+
+    else:
+
+        index_names = [n if n else "index{}".format(i) for i, n in enumerate(df.index.names)]
+
+        yield index_names + list(df.columns)
+
+        index_levels = [df.index.get_level_values(i) for i in range(len(df.index.names))]
+
+    for start in range(0, len(df), batch_size):
+        end = start + batch_size
+
+        yield [l[start:end].tolist() for l in index_levels] + \
+              [df.iloc[start:end, i].tolist() for i in range(len(df.columns))]
+
+
 def to_codes(df):
     """Return a dataframe with all of the categoricals represented as codes"""
     df = df.copy()
@@ -157,3 +182,12 @@ class StataSource(Source):
             df = to_codes(df)
 
         yield from iterate_pandas(df)
+
+    def iter_batches(self, batch_size=DEFAULT_BATCH_SIZE):
+
+        df = self.dataframe()
+
+        if self.value_type == 'codes':
+            df = to_codes(df)
+
+        yield from iterate_pandas_batches(df, batch_size)
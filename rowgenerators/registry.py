@@ -0,0 +1,174 @@
+# Copyright (c) 2017 Civic Knowledge. This file is licensed under the terms of the
+# MIT License, included in this distribution as LICENSE.txt
+
+"""
+Process-wide index of the entry points for the 'rowgenerators' and 'appurl.urls' groups.
+
+The entry points for a group are scanned once, on first use, and indexed by name, so finding the
+entry points for a URL is a few dict lookups rather than a scan of every installed distribution.
+The classes are loaded only when an entry point is first matched. Call refresh() after installing
+a plugin package at runtime.
+"""
+
+from threading import RLock
+
+GENERATOR_GROUP = 'rowgenerators'
+URL_GROUP = 'appurl.urls'
+
+
+def _iter_entry_points(group):
+    """Iterate the installed entry points for a group"""
+
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        from pkg_resources import iter_entry_points
+        yield from iter_entry_points(group)
+        return
+
+    eps = entry_points()
+
+    if hasattr(eps, 'select'):
+        yield from eps.select(group=group)
+    else:
+        yield from eps.get(group, [])
+
+
+class Entry(object):
+    """An entry point, with its loaded object cached"""
+
+    def __init__(self, ep, index):
+        self.ep = ep
+        self.index = index
+        self.name = ep.name.strip()
+        self._obj = None
+
+    @property
+    def module(self):
+        try:
+            return self.ep.module
+        except AttributeError:
+            return self.ep.module_name
+
+    def load(self):
+        if self._obj is None:
+            self._obj = self.ep.load()
+
+        return self._obj
+
+    def __repr__(self):
+        return "<Entry {} = {}>".format(self.name, self.module)
+
+
+class EntryPointIndex(object):
+    """Index of the entry points of one group.
+
+    Names that can be compared directly, such as 'http:', '.csv' or '<PythonUrl>', are looked up in
+    a dict. Names that have to be evaluated against each URL, such as '/regex/' patterns and
+    '&' combinations, are kept in a separate list.
+    """
+
+    def __init__(self, group):
+        self.group = group
+        self._lock = RLock()
+        self._entries = None
+        self._by_name = None
+        self._dynamic = None
+
+    def _build(self):
+
+        with self._lock:
+            if self._entries is not None:
+                return
+
+            entries = [Entry(ep, i) for i, ep in enumerate(_iter_entry_points(self.group))]
+
+            by_name = {}
+            dynamic = []
+
+            for e in entries:
+                if '&' in e.name or (len(e.name) > 1 and e.name.startswith('/') and e.name.endswith('/')):
+                    dynamic.append(e)
+                else:
+                    by_name.setdefault(e.name, []).append(e)
+
+            self._by_name = by_name
+            self._dynamic = dynamic
+            self._entries = entries
+
+    def refresh(self):
+        """Discard the index, so it is rebuilt from the installed distributions on next use"""
+        with self._lock:
+            self._entries = None
+            self._by_name = None
+            self._dynamic = None
+
+    @property
+    def entries(self):
+        """All of the entries, in the order they were found"""
+        self._build()
+        return self._entries
+
+    def match(self, names, matcher=None):
+        """Return the entries whose name is in names, plus the dynamic entries for which
+        matcher(name) returns true, in entry point order.
+
+        :param names: Iterable of entry point names to look up directly
+        :param matcher: Function that takes an entry point name and returns true if it matches
+        :return: list of Entry
+        """
+        self._build()
+
+        found = {}
+
+        for name in names:
+            for e in self._by_name.get(name, []):
+                found[e.index] = e
+
+        if matcher is not None:
+            for e in self._dynamic:
+                if matcher(e.name):
+                    found[e.index] = e
+
+        return [found[k] for k in sorted(found)]
+
+    def classes(self, names, matcher=None, key=None):
+        """Load and return the objects for matching entries, sorted by key(), with ties in
+        entry point order"""
+
+        classes = [e.load() for e in self.match(names, matcher)]
+
+        if key is not None:
+            classes = sorted(classes, key=key)
+
+        return classes
+
+
+_indexes = {}
+_indexes_lock = RLock()
+
+
+def get_registry(group):
+    """Return the process-wide EntryPointIndex for an entry point group"""
+
+    with _indexes_lock:
+        try:
+            return _indexes[group]
+        except KeyError:
+            _indexes[group] = EntryPointIndex(group)
+            return _indexes[group]
+
+
+def refresh(group=None):
+    """Rebuild the entry point indexes, for instance after installing a plugin package at runtime.
+
+    :param group: Name of the group to refresh. If None, refresh all of them.
+    """
+    import importlib
+
+    importlib.invalidate_caches()
+
+    with _indexes_lock:
+        for g, idx in _indexes.items():
+            if group is None or g == group:
+                idx.refresh()
@@ -3,3 +3,4 @@ from .transforms import *
 from .table import Column, Table
 from .codegen import make_row_processors
 from .processor import RowProcessor
+from .codecache import CodeCache
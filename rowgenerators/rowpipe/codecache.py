@@ -0,0 +1,172 @@
+# Copyright (c) 2016 Civic Knowledge. This file is licensed under the terms of the
+# MIT License, included in this distribution as LICENSE.txt
+
+"""
+Cache of the compiled code for row processors.
+
+RowProcessor generates Python source for each destination table, and compiling it is most of the
+cost of constructing a processor. The CodeCache keys the compiled code on a hash of the source
+and of the names in the environment it runs in, and keeps the code objects in memory. If the cache
+has a directory, the code is also marshalled to files in it, like .pyc files, so other processes
+can load it without compiling. Set the ROWGENERATORS_CODE_CACHE environment variable to the
+directory to use for the default cache.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+CODE_CACHE_ENV = 'ROWGENERATORS_CODE_CACHE'
+
+
+class CodeCache(object):
+    """Compile row processor source, reusing the code objects for source that has been compiled before.
+
+    :param directory: Directory to store marshalled code in. If None, code is only cached in memory.
+    :param max_entries: Maximum number of code objects to keep in memory.
+    """
+
+    def __init__(self, directory=None, max_entries=256):
+        self.directory = directory
+        self.max_entries = max_entries
+
+        self._code = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Number of code objects found in memory, loaded from disk, and compiled
+        self.stats = {'memory': 0, 'disk': 0, 'compiled': 0}
+
+    @staticmethod
+    def key(source, env=None):
+        """Return the hash of the source and the names in the environment"""
+
+        h = hashlib.sha256(source.encode('utf8'))
+        h.update(b'\0')
+        h.update('\0'.join(sorted(str(k) for k in (env or ()))).encode('utf8'))
+
+        return h.hexdigest()
+
+    @staticmethod
+    def filename(key):
+        """Return the pseudo file name for code that doesn't have a source file"""
+        return '<rowprocessor-{}>'.format(key[:16])
+
+    def _path(self, key, filename):
+        from os.path import join
+
+        # The file name is compiled into the code object, for tracebacks, so it is part of the entry
+        ident = hashlib.sha256((key + '\0' + filename).encode('utf8')).hexdigest()
+
+        return join(self.directory, ident[:2], ident + '.pyc')
+
+    def _load(self, key, filename):
+        import marshal
+        from importlib.util import MAGIC_NUMBER
+
+        try:
+            with open(self._path(key, filename), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        header = MAGIC_NUMBER + bytes.fromhex(key)
+
+        if not data.startswith(header):
+            return None  # Written by another Python version, or damaged
+
+        try:
+            return marshal.loads(data[len(header):])
+        except (EOFError, ValueError, TypeError):
+            return None
+
+    def _save(self, key, filename, code):
+        import marshal
+        import os
+        import tempfile
+        from importlib.util import MAGIC_NUMBER
+
+        path = self._path(key, filename)
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            # Write to a temp file and rename it, so other processes never read a partial file
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(MAGIC_NUMBER + bytes.fromhex(key) + marshal.dumps(code))
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+        except OSError:
+            pass  # The cache is an optimization; a read only or full directory is not an error
+
+    def compile(self, source, env=None, filename=None):
+        """Return the code object for the source, compiling it only if it is not in the cache.
+
+        :param source: Python source code, for exec
+        :param env: The environment the code will be exec'd in. Only the names are used.
+        :param filename: File name for the code object. If None, a pseudo file name is made from
+            the key, and the source is registered with linecache, so tracebacks show the lines.
+        :return: A code object
+        """
+        import linecache
+
+        key = self.key(source, env)
+
+        if filename is None:
+            filename = self.filename(key)
+            # Entries without an mtime are kept by linecache.checkcache()
+            linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+
+        with self._lock:
+            code = self._code.get((key, filename))
+
+            if code is not None:
+                self._code.move_to_end((key, filename))
+                self.stats['memory'] += 1
+                return code
+
+        code = self._load(key, filename) if self.directory else None
+
+        if code is not None:
+            self.stats['disk'] += 1
+        else:
+            code = compile(source, filename, 'exec')
+            self.stats['compiled'] += 1
+
+            if self.directory:
+                self._save(key, filename, code)
+
+        with self._lock:
+            self._code[(key, filename)] = code
+
+            while len(self._code) > self.max_entries:
+                self._code.popitem(last=False)
+
+        return code
+
+    def clear(self):
+        """Remove the code objects from memory. Does not remove the files on disk"""
+
+        with self._lock:
+            self._code.clear()
+
+
+_code_cache = None
+
+
+def get_code_cache():
+    """Return the default CodeCache, which stores code on disk if the ROWGENERATORS_CODE_CACHE
+    environment variable is set"""
+    import os
+
+    global _code_cache
+
+    if _code_cache is None:
+        _code_cache = CodeCache(os.getenv(CODE_CACHE_ENV))
+
+    return _code_cache
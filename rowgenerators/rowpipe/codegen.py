@@ -6,6 +6,7 @@
 """
 
 import ast
+from functools import lru_cache
 
 
 def file_loc():
@@ -67,6 +68,43 @@ def row_{table}_{stage}(row, row_n, errors, scratch, accumulator, pipe, manager,
     ]
 """
 
+fused_template = """
+# {loc}
+def row_{table}_fused(row, row_n, errors, scratch, accumulator, pipe, manager, source):
+
+{body}
+
+    return [
+{stack}
+    ]
+"""
+
+batch_header = """
+from rowgenerators.rowpipe.vector import cast_column, columns_to_rows
+"""
+
+batch_template = """
+# {loc}
+def rows_{table}_{stage}(rows, errors):
+
+    if not rows:
+        return []
+
+    columns = list(zip(*rows))
+
+    return columns_to_rows([
+{stack}
+    ])
+"""
+
+# Scalar cast for a column whose first stage was skipped in batch mode: the first stage column
+# function, then the datatype cast, as the row at a time path would do.
+batch_fallback_template = """
+def {f_name}_cast(v, header_d, errors):
+    return cast_{datatype}({f_name}(v, {i_s}, {i_d}, {header_s}, header_d, None, None, errors, None, None, None, None, None),
+                header_d, errors)
+"""
+
 
 
 
@@ -74,9 +112,35 @@ class CodeGenError(Exception):
     pass
 
 
+# Read only base environment, built once per process. See base_context()
+_base_context = None
+
+
+def base_context():
+    """Return the base environment for evals, the stuff that is the same for all evals, as a read only
+    mapping. It is built on the first call, and shared by every later call in the process."""
+    from types import MappingProxyType
+
+    global _base_context
+
+    if _base_context is None:
+        _base_context = MappingProxyType(_make_base_context())
+
+    return _base_context
+
+
 def exec_context(**kwargs):
-    """Base environment for evals, the stuff that is the same for all evals. Primarily used in the
-    Caster pipe"""
+    """Environment for evals: a new dict with the base environment, and the keyword arguments on top of
+    it. Primarily used in the Caster pipe. The dict can be changed without changing the base; it is a
+    dict, rather than a layered mapping, because exec() requires a dict for globals. See base_context()"""
+
+    env = dict(base_context())
+    env.update(kwargs)
+
+    return env
+
+
+def _make_base_context():
     import dateutil.parser
     import datetime
     import random
@@ -106,7 +170,6 @@ def exec_context(**kwargs):
         partial=partial
     )
 
-    test_env.update(kwargs)
     test_env.update(dateutil.parser.__dict__)
     test_env.update(datetime.__dict__)
     test_env.update(random.__dict__)
@@ -132,13 +195,161 @@ def exec_context(**kwargs):
     return localvars
 
 
-def make_row_processors(source_headers, dest_table, env=None):
+def is_datatype_only(transforms, col_num):
+    """Return True if the only transform for a column is the conversion to its datatype, in the first
+    stage, and all of the other stages pass the value through"""
+    from rowgenerators.valuetype import ValueType
+
+    first = transforms[0][col_num]
+    parts = list(first)
+
+    if first['exception'] or len(parts) != 1:
+        return False
+
+    if not (isinstance(parts[0], type) and issubclass(parts[0], ValueType)):
+        return False
+
+    return all(list(stage[col_num]['transforms']) == ['v'] and not stage[col_num]['init']
+               for stage in transforms[1:])
+
+
+def make_batch_caster(dest_table, stage=0, fallbacks=None):
+    """
+    Make the code for a function that does the final datatype cast for a block of rows, casting each
+    column at once, with rowgenerators.rowpipe.vector.cast_column(). The function takes a list of rows
+    and the errors dict, and returns the list of cast rows.
+
+    :param dest_table: Destination table
+    :param stage: Stage number, for the name of the function
+    :param fallbacks: Dict of column numbers to (f_name, i_s, header_s, valuetype) for columns that have the
+        raw source value, because make_row_processors() skipped their first stage column function. Values that
+        can't be cast in bulk are passed through the column function before the scalar cast, and values that
+        are cast in bulk are converted to the valuetype, if the scalar cast would keep it.
+
+    :return: A tuple of the code, and the name of the function.
+    """
+    import re
+
+    table = re.sub(r'[^\w]+', '_', dest_table.name)
+
+    fallbacks = fallbacks or {}
+
+    out = [batch_header]
+    stack = []
+
+    for i, c in enumerate(dest_table):
+        datatype = c.datatype.__name__
+
+        if i in fallbacks:
+            f_name, i_s, header_s, valuetype = fallbacks[i]
+
+            out.append(batch_fallback_template.format(f_name=f_name, datatype=datatype, i_s=i_s, i_d=i,
+                                                      header_s="'" + header_s + "'"))
+            scalar = f_name + '_cast'
+        else:
+            scalar = 'cast_' + datatype
+            valuetype = None
+
+        stack.append("{}cast_column(columns[{}], '{}', {}, '{}', errors, {}),"
+                     .format(indent, i, datatype, scalar, c.name, valuetype))
+
+    out.append(batch_template.format(table=table, stage=stage, stack='\n'.join(stack), loc=file_loc()))
+
+    code = '\n'.join(out)
+
+    return code, 'rows_{table}_{stage}'.format(table=table, stage=stage)
+
+
+def make_fused_processor(dest_table, stages, batch=False):
+    """
+    Make the code for a single row function that runs all of the stages of a table, and the final
+    datatype cast. The value of each column after each stage is kept in a local variable, rather than
+    in a list that is wrapped in a RowProxy for the next stage. A stage's list and RowProxy are only
+    built when one of the next stage's column functions references ``row``, and columns that a
+    stage passes through keep the local from the stage before.
+
+    :param dest_table: Destination table
+    :param stages: One list per stage, with an entry per column. The entry is None for a column that
+        the stage passes through, or a tuple of the column function name, the input value
+        expression, the arguments that follow ``v`` and precede ``row``, and whether the function
+        references ``row``. A column function name of None means the input value is used as is.
+    :param batch: If True, leave out the final datatype cast. See make_batch_caster()
+
+    :return: A tuple of the code, and the name of the function.
+    """
+    import re
+
+    table = re.sub(r'[^\w]+', '_', dest_table.name)
+    proxy = 'row_proxy_{}'.format(table)
+
+    headers = dest_table.headers
+
+    out = []
+    body = []
+
+    values = [None] * len(headers)  # Expression for the current value of each column
+    uses_proxy = False
+
+    for stage, entries in enumerate(stages):
+
+        materialize = stage > 0 and any(e and e[3] for e in entries)
+
+        if materialize:
+            uses_proxy = True
+            body.append("    row = {}.set_row([{}])".format(proxy, ', '.join(values)))
+
+        next_values = list(values)
+
+        for col_num, entry in enumerate(entries):
+
+            if entry is None:  # Passthrough
+                if stage > 0:
+                    continue
+                expr = 'row[{}]'.format(col_num)
+
+            else:
+                f_name, v, args, _ = entry
+
+                if stage > 0:
+                    v = values[col_num]
+
+                if f_name is None:
+                    expr = v
+                else:
+                    expr = '{}({}, {}, {}, row_n, errors, scratch, accumulator, pipe, manager, source)'.format(
+                        f_name, v, args, 'row' if stage == 0 or materialize else 'None')
+
+            next_values[col_num] = 's{}_{}'.format(stage, col_num)
+            body.append("    {} = {} # {}".format(next_values[col_num], expr, headers[col_num]))
+
+        values = next_values
+
+    if uses_proxy:
+        out.append("from rowgenerators.rowproxy import row_proxy_class")
+        out.append("{} = row_proxy_class({!r})({!r})".format(proxy, headers, headers))
+
+    if batch:
+        stack = '\n'.join("{}{}, # column {}".format(indent, v, c.name) for v, c in zip(values, dest_table))
+    else:
+        stack = '\n'.join("{}cast_{}({}, '{}', errors),".format(indent, c.datatype.__name__, v, c.name)
+                          for v, c in zip(values, dest_table))
+
+    out.append(fused_template.format(table=table, body='\n'.join(body), stack=stack, loc=file_loc()))
+
+    return '\n'.join(out), 'row_{}_fused'.format(table)
+
+
+def make_row_processors(source_headers, dest_table, env=None, batch=False, fused=False):
     """
     Make multiple row processors for all of the columns in a table.
 
     :param source_headers:
     :param dest_table:
     :param env:
+    :param batch: If True, the final datatype cast is not one of the row processors. Instead, the
+        code defines ``batch_processor``, which casts a block of rows at once. See make_batch_caster()
+    :param fused: If True, there is one row processor, which runs all of the stages. See
+        make_fused_processor()
 
     :return:
     """
@@ -146,7 +357,7 @@ def make_row_processors(source_headers, dest_table, env=None):
     import re
 
     if env is None:
-        env = exec_context()
+        env = base_context()
 
     assert len(dest_table.columns) > 0
 
@@ -160,11 +371,17 @@ def make_row_processors(source_headers, dest_table, env=None):
 
     transforms = dest_table.stage_transforms
 
+    batch_fallbacks = {}
+
+    fused_stages = []
+
     for i, segments in enumerate(transforms):  # Iterate over each stage
 
         column_names = []
         column_types = []
         seg_funcs = []
+        fused_entries = []
+        fused_stages.append(fused_entries)
 
         # Iterate over each column, linking it to the segments for this stage
         for col_num, (segment, column) in enumerate(zip(segments, dest_table), 0):
@@ -175,19 +392,22 @@ def make_row_processors(source_headers, dest_table, env=None):
 
  
             col_name = column.name
-            preamble_parts, try_lines, exception, passthrough = make_stack(env, i, segment)
-
-            preamble += preamble_parts
 
             column_names.append(col_name)
             column_types.append(column.datatype)
 
             # Optimization to remove unecessary functions. Without this, the column function will
-            # have just 'v = v'
+            # have just 'v = v'. The check is before make_stack(), which would otherwise compile
+            # the 'v' as pipe code.
             if len(segment['transforms']) == 1 and segment['transforms'][0] == 'v':
                 seg_funcs.append('row[{}]'.format(col_num))
+                fused_entries.append(None)
                 continue
 
+            preamble_parts, try_lines, exception, passthrough = make_stack(env, i, segment)
+
+            preamble += preamble_parts
+
             column_name = re.sub(r'[^\w]+', '_', col_name, )
             table_name = re.sub(r'[^\w]+', '_', dest_table.name)
 
@@ -196,6 +416,17 @@ def make_row_processors(source_headers, dest_table, env=None):
 
             f_name = "{}_{}_{}".format(table_name, column_name, i)
 
+            # In batch mode, a column that is only converted to its datatype, in a first stage, gets the raw
+            # source value instead, which the batch caster casts a column at once. The column function is
+            # still defined, for the values that can't be cast in bulk.
+            if batch and i == 0 and column.name in source_headers and is_datatype_only(transforms, col_num):
+                i_s = source_headers.index(column.name)
+                valuetype = list(segment)[0].__name__  # Defined in the preamble by make_stack()
+                batch_fallbacks[col_num] = (f_name, i_s, column.name, valuetype)
+                skip_column_function = True
+            else:
+                skip_column_function = False
+
             exception = (exception if exception
                          else 'raise CasterExceptionError("' + f_name + '",header_d, v, exc, sys.exc_info())')
 
@@ -221,15 +452,24 @@ def make_row_processors(source_headers, dest_table, env=None):
 
             header_d = column.name
 
+            args = '{i_s}, {i_d}, {header_s}, \'{header_d}\''.format(
+                i_s=i_s,
+                i_d=col_num,
+                header_s="'" + header_s + "'" if header_s else 'None',
+                header_d=header_d)
+
             # Seg funcs holds the calls to the function for each column, called in the row stage function
-            seg_funcs.append(f_name
-                             + ('({v}, {i_s}, {i_d}, {header_s}, \'{header_d}\', '
-                                'row, row_n, errors, scratch, accumulator, pipe, manager, source)')
-                             .format(v=v,
-                                     i_s=i_s,
-                                     i_d=col_num,
-                                     header_s="'" + header_s + "'" if header_s else 'None',
-                                     header_d=header_d))
+            if skip_column_function:
+                seg_funcs.append('row[{}]'.format(i_s))
+                fused_entries.append((None, 'row[{}]'.format(i_s), None, False))
+            else:
+                seg_funcs.append(f_name
+                                 + ('({v}, {args}, row, row_n, errors, scratch, accumulator, pipe, manager, source)')
+                                 .format(v=v, args=args))
+
+                # The fused processor only builds a RowProxy for a stage if a column function uses it
+                uses_row = bool(re.search(r'\brow\b', '\n'.join(try_lines + [exception])))
+                fused_entries.append((f_name, v, args, uses_row))
 
             # This creates the column manipulation function.
             out.append(column_template.format(
@@ -247,6 +487,9 @@ def make_row_processors(source_headers, dest_table, env=None):
                 col_args='',  # col_args not implemented yet
                 loc=file_loc()))
 
+        if fused:
+            continue
+
         # This stack assembles all of the function calls that will generate the next row
         stack = '\n'.join("{}{}, # column {}".format(indent, l, cn)
                           for l, cn, dt in zip(seg_funcs, column_names, column_types))
@@ -261,6 +504,26 @@ def make_row_processors(source_headers, dest_table, env=None):
         row_processors.append('row_{table}_{stage}'.format(stage=i,
                                                            table=re.sub(r'[^\w]+', '_', dest_table.name)))
 
+    if fused:
+        code, name = make_fused_processor(dest_table, fused_stages, batch)
+
+        out.append(code)
+        row_processors = [name]
+
+    if batch:
+        code, name = make_batch_caster(dest_table, len(transforms), batch_fallbacks)
+
+        out.append(code)
+        out.append('row_processors = [{}]'.format(','.join(row_processors)))
+        out.append('batch_processor = {}'.format(name))
+
+        return '\n'.join([file_header] + list(dict.fromkeys(preamble)) + out)
+
+    if fused:
+        out.append('row_processors = [{}]'.format(name))
+
+        return '\n'.join([file_header] + list(dict.fromkeys(preamble)) + out)
+
     # Add the final datatype cast, which is done seperately to avoid an unecessary function call.
     stack = '\n'.join("{}cast_{}(row[{}], '{}', errors),".format(indent, c.datatype.__name__, i, c.name)
                       for i, c in enumerate(dest_table))
@@ -277,22 +540,38 @@ def make_row_processors(source_headers, dest_table, env=None):
 
     out.append('row_processors = [{}]'.format(','.join(row_processors)))
 
-    return '\n'.join([file_header] + list(set(preamble)) + out)
+    # Keep the first occurrence of each preamble line, in order, so the same table always generates
+    # the same code, and the CodeCache can find it.
+    return '\n'.join([file_header] + list(dict.fromkeys(preamble)) + out)
 
 
-def calling_code(f, f_name=None, raise_for_missing=True):
-    """Return the code string for calling a function. """
+@lru_cache(maxsize=1024)
+def _parameter_names(f):
+    """Return the parameter names of a function, or of a class's __init__. Inspecting signatures is most
+    of the cost of generating the code for a table, and the same valuetypes and transforms are in every
+    table, so the names are cached."""
     import inspect
-    from rowgenerators.exceptions import ConfigurationError
 
     if inspect.isclass(f):
         try:
-            args = inspect.signature(f.__init__).parameters.keys()
+            return tuple(inspect.signature(f.__init__).parameters.keys())
         except TypeError as e:
             raise TypeError("Failed to inspect {}: {}".format(f, e))
 
     else:
-        args = inspect.signature(f).parameters.keys()
+        return tuple(inspect.signature(f).parameters.keys())
+
+
+def calling_code(f, f_name=None, raise_for_missing=True):
+    """Return the code string for calling a function. """
+    from rowgenerators.exceptions import ConfigurationError
+
+    try:
+        hash(f)
+    except TypeError:  # Unhashable callable objects can't be cached
+        args = list(_parameter_names.__wrapped__(f))
+    else:
+        args = list(_parameter_names(f))
 
     if len(args) > 1 and list(args)[0] == 'self':
         args = list(args)[1:]
@@ -323,8 +602,7 @@ def make_stack(env, stage, segment):
     """For each transform segment, create the code in the try/except block with the
     assignements for pipes in the segment """
 
-    import string
-    import random
+    import hashlib
     from rowgenerators.valuetype import ValueType
 
     passthrough = False  # If true, signal that the stack will just return its input value
@@ -358,7 +636,8 @@ def make_stack(env, stage, segment):
 
         else:  # A transform generator, or python code.
 
-            rnd = (''.join(random.choice(string.ascii_lowercase) for _ in range(6)))
+            # Named for the code, rather than randomly, so the generated source is repeatable
+            rnd = hashlib.md5(str(t).encode('utf8')).hexdigest()[:6]
 
             name = 'tg_{}_{}_{}'.format(column.name, stage, rnd)
             try:
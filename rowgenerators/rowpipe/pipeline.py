@@ -695,9 +695,9 @@ class SelectRows(Pipe):
 
     def process_header(self, row):
 
-        from rowgenerators.rowproxy import RowProxy
+        from rowgenerators.rowproxy import row_proxy_class
 
-        self._row_proxy = RowProxy(row)
+        self._row_proxy = row_proxy_class(row)(row)
         return row
 
     def __str__(self):
@@ -1155,7 +1155,7 @@ class AddDeleteExpand(Pipe):
 
     def process_header(self, row):
 
-        from rowgenerators.rowproxy import RowProxy
+        from rowgenerators.rowproxy import row_proxy_class
 
         self.edit_functions = [None] * len(row)
 
@@ -1210,7 +1210,7 @@ class AddDeleteExpand(Pipe):
         # Run it!
         headers = self.edit_header(row)
 
-        self._row_proxy = RowProxy(headers)
+        self._row_proxy = row_proxy_class(headers)(headers)
 
         return headers
 
@@ -1321,12 +1321,18 @@ class CastColumns(Pipe):
     datatype, nullify, initialize, typecast, transform and exception, to transform the source rows to destination
     rows. The output rows have the lenghts and column types as speciefied in the destination schema.
 
+    If batch_size is set, rows are read from the source pipe in blocks, and the final datatype cast is done
+    for a whole block at once. See rowgenerators.rowpipe.vector
+
     """
 
-    def __init__(self):
+    def __init__(self, batch_size=None):
 
         super(CastColumns, self).__init__()
 
+        self.batch_size = batch_size
+        self.batch_processor = None
+
         self.row_processors = []
         self.orig_headers = None
         self.new_headers = None
@@ -1340,10 +1346,10 @@ class CastColumns(Pipe):
 
     def process_header(self, headers):
 
-        from rowgenerators.rowproxy import RowProxy
+        from rowgenerators.rowproxy import row_proxy_class
 
         self.orig_headers = headers
-        self.row_proxy_1 = RowProxy(self.orig_headers)
+        self.row_proxy_1 = row_proxy_class(self.orig_headers)(self.orig_headers)
 
         if len(self.source.dest_table.columns) <= 1:
             raise PipelineError(self, "Destination table {} has no columns, Did you run the schema phase?"
@@ -1353,10 +1359,17 @@ class CastColumns(Pipe):
 
         self.new_headers = [c.name for c in self.source.dest_table.columns]
 
-        self.row_proxy_2 = RowProxy(self.new_headers)
+        self.row_proxy_2 = row_proxy_class(self.new_headers)(self.new_headers)
 
         self.row_processors = self.bundle.build_caster_code(self.source, headers, pipe=self)
 
+        if self.batch_size and self._is_final_cast(self.row_processors[-1:]):
+            from rowgenerators.rowpipe.vector import batch_caster
+
+            # Replace the final datatype cast with one that casts a block of rows.
+            self.row_processors = self.row_processors[:-1]
+            self.batch_processor = batch_caster(self.source.dest_table)
+
         self.errors = {}
 
         for h in self.orig_headers + self.new_headers:
@@ -1364,6 +1377,18 @@ class CastColumns(Pipe):
 
         return self.new_headers
 
+    def _is_final_cast(self, procs):
+        """Return True if the only function in procs is the separate final datatype cast that
+        make_row_processors() generates for unfused code. Code from elsewhere, or fused code, which does
+        the cast in the same function as the transforms, is run as it is, a row at a time."""
+        import re
+
+        table = self.source.dest_table
+
+        name = 'row_{}_{}'.format(re.sub(r'[^\w]+', '_', table.name), len(table.stage_transforms))
+
+        return len(procs) == 1 and getattr(procs[0], '__name__', None) == name
+
     def process_body(self, row):
 
         from rowgenerators.rowpipe.exceptions import CastingError, TooManyCastingErrors
@@ -1390,6 +1415,78 @@ class CastColumns(Pipe):
 
         return row
 
+    def process_batch(self, rows):
+        """Process a block of rows. The transform stages run on each row, then, if the final datatype
+        cast could be separated from them, the cast runs on the whole block. Like process_body(), rows
+        that processing returns empty are dropped."""
+
+        from rowgenerators.rowpipe.exceptions import CastingError, TooManyCastingErrors
+
+        first_row_n = self.row_n
+
+        out = []
+
+        for row in rows:
+            row = self.process_body(row)
+
+            if row:
+                out.append(row)
+                self.row_n += 1
+
+        self.row_n = first_row_n
+
+        if self.batch_processor is None or not out:
+            return out
+
+        try:
+            return self.batch_processor(out, self.errors)
+        except CastingError as e:
+            raise PipelineError(self, "Failed to cast column in table {}, rows {}-{}: {}"
+                                .format(self.source.dest_table.name, first_row_n, first_row_n + len(out) - 1, e))
+        except TooManyCastingErrors:
+            self.report_errors()
+
+        return out
+
+    def __iter__(self):
+        from itertools import islice
+
+        if not self.batch_size:
+            yield from super(CastColumns, self).__iter__()
+            return
+
+        rg = iter(self._source_pipe)
+        self.row_n = 0
+        self.headers = self.process_header(next(rg))
+
+        yield self.headers
+
+        header_len = len(self.headers)
+
+        try:
+            while True:
+                rows = list(islice(rg, self.batch_size))
+
+                if not rows:
+                    break
+
+                for row in self.process_batch(rows):
+
+                    if row:  # Check that the rows have the same length as the header
+                        self.row_n += 1
+                        if len(row) != header_len:
+                            m = 'Header width mismatch in row {}. Row width = {}, header width = {}'.format(
+                                self.row_n, len(row), header_len)
+
+                            self.bundle.error(m)
+                            raise BadRowError(self, row, m)
+
+                        yield row
+        except StopIteration:
+            return
+
+        self.finish()
+
     def report_errors(self):
 
         from rowgenerators.rowpipe.exceptions import TooManyCastingErrors
@@ -1493,7 +1590,7 @@ class Skip(Pipe):
     def process_header(self, headers):
         from .codegen import calling_code
 
-        from rowgenerators.rowproxy import RowProxy
+        from rowgenerators.rowproxy import row_proxy_class
 
         self.env = self.bundle.exec_context(source=self.source, pipe=self)
 
@@ -1517,7 +1614,7 @@ class Skip(Pipe):
         else:
             self._check = self.table == self.source.dest_table.name
 
-        self.row_proxy = RowProxy(headers)
+        self.row_proxy = row_proxy_class(headers)(headers)
 
         return headers
 
@@ -8,15 +8,99 @@ Row generating row processor
 """
 
 from collections import defaultdict
+from rowgenerators.rowpipe.codecache import get_code_cache
 from rowgenerators.rowpipe.codegen import make_row_processors, exec_context
 from .exceptions import RowProcessorError
 
+DEFAULT_CHUNK_SIZE = 10000  # Rows for each task in the process pool
+
+# State of a worker process in the pool for a parallel RowProcessor. See _init_worker()
+_worker = None
+
+
+def _init_worker(code, code_file, env, source_headers, dest_headers, manager, source):
+    """Exec the generated code in a worker process"""
+    from rowgenerators.rowproxy import row_proxy_class
+
+    global _worker
+
+    worker_env = exec_context()
+    worker_env.update(env)
+    worker_env['source'] = source
+    worker_env['pipe'] = None
+
+    exec(get_code_cache().compile(code, worker_env, code_file), worker_env)
+
+    _worker = (worker_env['row_processors'], worker_env.get('batch_processor'),
+               row_proxy_class(source_headers)(source_headers), row_proxy_class(dest_headers)(dest_headers),
+               manager, source)
+
+
+def _process_chunk(row_n, rows):
+    """Run the row processors on a chunk of rows in a worker process. Returns the processed rows, and the
+    errors and accumulator for the chunk"""
+
+    procs, batch_proc, rp1, rp2, manager, source = _worker
+
+    errors = defaultdict(set)
+    scratch = {}
+    accumulator = {}
+
+    out = []
+
+    for i, row in enumerate(rows, row_n):
+        try:
+            rp = rp1
+
+            for proc in procs:
+                row = proc(rp.set_row(row), i, errors, scratch, accumulator, None, manager, source)
+                rp = rp2
+
+        except Exception as e:
+            raise RowProcessorError("Exception at source ({}) row {}: {}".format(type(source), i, str(e))) from e
+
+        out.append(row)
+
+    if batch_proc is not None:
+        out = batch_proc(out, errors)
+
+    return out, dict(errors), accumulator
+
+
+def merge_state(total, chunk):
+    """Merge the accumulator of a chunk into the total. Numbers are added, lists are extended, sets
+    and dicts are merged, and other values are replaced. Chunks are merged in source order, so
+    the result doesn't depend on the order the workers finish in."""
+    from numbers import Number
+
+    for k, v in chunk.items():
+        if k not in total:
+            total[k] = v
+            continue
+
+        t = total[k]
+
+        if isinstance(t, Number) and isinstance(v, Number) and not isinstance(t, bool):
+            total[k] = t + v
+        elif isinstance(t, list) and isinstance(v, list):
+            t.extend(v)
+        elif isinstance(t, set) and isinstance(v, set):
+            t.update(v)
+        elif isinstance(t, dict) and isinstance(v, dict):
+            merge_state(t, v)
+        else:
+            total[k] = v
+
+    return total
+
 
 class RowProcessor(object):
     """
     """
 
-    def __init__(self, source, dest_table, source_headers=None, env=None, manager=None, code_path=None):
+    def __init__(self, source, dest_table, source_headers=None, env=None, manager=None, code_path=None,
+                 code_cache=None, batch_size=None, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                 fused=True):
 
         """
 
@@ -25,6 +109,17 @@ class RowProcessor(object):
         :param source_headers:
         :param env:
         :param env: A higher-level controller object, to be referenced from user-written transforms.
+        :param code_path: If set, the generated code is written to this path, for debugging.
+        :param code_cache: CodeCache for the compiled code. Defaults to the shared cache from get_code_cache()
+        :param batch_size: If set, read the source in blocks of this many rows, and cast each block a
+            column at once. See rowgenerators.rowpipe.vector
+        :param workers: If greater than 1, process the rows in a pool of this many processes. The source is
+            read in this process, and sent to the workers in chunks of chunk_size rows. Each chunk has its own
+            scratch and accumulator; the errors and accumulators of the chunks are merged in source order. See
+            merge_state(). On platforms that can't fork, env, manager and source must be picklable.
+        :param chunk_size: Number of rows in each chunk, for workers
+        :param fused: If True, all of the transform stages run in one generated function, which keeps the
+            intermediate values in local variables. If False, each stage is a separate row processor.
         :return:
         """
 
@@ -39,6 +134,10 @@ class RowProcessor(object):
         self.source_headers = source_headers if source_headers is not None else self.source.headers
         self.dest_table = dest_table
         self.code_path = code_path
+        self.batch_size = batch_size
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self._env = dict(env) if env is not None else {}
 
         self.env = exec_context()
 
@@ -52,28 +151,31 @@ class RowProcessor(object):
         self.accumulator = {}
         self.errors = defaultdict(set)
 
-        self.code = make_row_processors(self.source_headers, self.dest_table, env=self.env)
+        self.code = make_row_processors(self.source_headers, self.dest_table, env=self.env,
+                                        batch=bool(batch_size), fused=fused)
+
+        if self.code_path:
+            self.write_code()
 
-        self.code_path = self.write_code()
+        self._code_file = self.code_path
 
-        exec (compile(self.code, self.code_path, 'exec'), self.env)
+        self.code_cache = code_cache if code_cache is not None else get_code_cache()
+
+        self.code_object = self.code_cache.compile(self.code, self.env, self.code_path)
+
+        if not self.code_path:
+            self.code_path = self.code_object.co_filename
+
+        exec (self.code_object, self.env)
 
         self.procs = self.env['row_processors']
+        self.batch_proc = self.env.get('batch_processor')
 
     def write_code(self):
-        import hashlib
+        """Write the generated code to code_path"""
         import os
-        import tempfile
-
-        if self.code_path:
-            path = self.code_path
 
-        else:
-            tf = tempfile.NamedTemporaryFile(prefix="rowprocessor-",
-                                             suffix='{}.py'.format(hashlib.md5(self.code.encode('utf-8')).hexdigest()),
-                                             delete=False)
-            path = tf.name
-            tf.close()
+        path = self.code_path
 
         if not os.path.exists(os.path.dirname(path)):
             os.makedirs(os.path.dirname(path))
@@ -103,14 +205,22 @@ class RowProcessor(object):
 
     def __iter__(self):
         """Iterate over all of the lines in the file"""
-        from rowgenerators.rowproxy import RowProxy
+        from rowgenerators.rowproxy import row_proxy_class
+
+        if self.workers and self.workers > 1:
+            yield from self._iter_parallel()
+            return
+
+        if self.batch_size:
+            yield from self._iter_batches()
+            return
 
         self.start()
 
         pipe = self.env['pipe']
 
-        rp1 = RowProxy(self.source_headers) # The first processor step uses the source row structure
-        rp2 = RowProxy(self.dest_table.headers) # Subsequent steps use the dest table
+        rp1 = row_proxy_class(self.source_headers)(self.source_headers) # The first processor step uses the source row structure
+        rp2 = row_proxy_class(self.dest_table.headers)(self.dest_table.headers) # Subsequent steps use the dest table
 
         for i, row in enumerate(self.source):
 
@@ -131,6 +241,143 @@ class RowProcessor(object):
 
         self.finish()
 
+    def _source_blocks(self):
+        """Yield blocks of up to batch_size source rows. Sources that have iter_batches() are read a block at
+        a time; the header that iter_batches() yields first is a block of its own, since it is also a row
+        when the source is iterated."""
+        from itertools import islice
+        from rowgenerators.rowpipe.vector import columns_to_rows
+
+        if hasattr(self.source, 'iter_batches'):
+            itr = iter(self.source.iter_batches(self.batch_size))
+
+            try:
+                yield [next(itr)]
+            except StopIteration:
+                return
+
+            for columns in itr:
+                yield columns_to_rows(columns)
+
+        else:
+            itr = iter(self.source)
+
+            while True:
+                rows = list(islice(itr, self.batch_size))
+
+                if not rows:
+                    break
+
+                yield rows
+
+    def _iter_batches(self):
+        """Iterate over the rows, with the transform stages run a row at a time and the final datatype cast
+        run on a block of rows at once"""
+        from rowgenerators.rowproxy import row_proxy_class
+
+        self.start()
+
+        pipe = self.env['pipe']
+
+        rp1 = row_proxy_class(self.source_headers)(self.source_headers)
+        rp2 = row_proxy_class(self.dest_table.headers)(self.dest_table.headers)
+
+        i = 0
+
+        for block in self._source_blocks():
+
+            rows = []
+
+            for row in block:
+                try:
+                    rp = rp1
+
+                    for proc in self.procs:
+                        row = proc(rp.set_row(row), i, self.errors, self.scratch, self.accumulator,
+                                   pipe, self.manager, self.source)
+                        rp = rp2
+
+                except Exception as e:
+                    raise RowProcessorError("Exception at source ({}) row {}: {}"
+                                            .format(type(self.source), i, str(e))) from e
+
+                rows.append(row)
+                i += 1
+
+            try:
+                rows = self.batch_proc(rows, self.errors)
+            except Exception as e:
+                raise RowProcessorError("Exception casting source ({}) rows {} to {}: {}"
+                                        .format(type(self.source), i - len(rows), i - 1, str(e))) from e
+
+            yield from rows
+
+        self.finish()
+
+    def _iter_parallel(self):
+        """Iterate over the rows, processing chunks of source rows in a process pool"""
+        import multiprocessing
+        from collections import deque
+        from concurrent.futures import ProcessPoolExecutor
+        from itertools import islice
+        from rowgenerators.rowpipe.exceptions import TooManyCastingErrors
+        from rowgenerators.valuetype.core import count_errors
+
+        self.start()
+
+        # Forked workers inherit the environment, so it doesn't have to be pickled.
+        if 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+        else:
+            context = None
+
+        initargs = (self.code, self._code_file, self._env, self.source_headers, self.dest_table.headers,
+                    self.manager, self.source)
+
+        itr = iter(self.source)
+
+        def chunks():
+            row_n = 0
+
+            while True:
+                rows = list(islice(itr, self.chunk_size))
+
+                if not rows:
+                    break
+
+                yield row_n, rows
+                row_n += len(rows)
+
+        # Limit the number of chunks in flight, so a fast source doesn't fill memory
+        window = self.workers * 2
+
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context,
+                                 initializer=_init_worker, initargs=initargs) as executor:
+
+            tasks = chunks()
+
+            pending = deque(executor.submit(_process_chunk, *args) for args in islice(tasks, window))
+
+            while pending:
+                rows, errors, accumulator = pending.popleft().result()
+
+                for args in islice(tasks, 1):
+                    pending.append(executor.submit(_process_chunk, *args))
+
+                for k, v in errors.items():
+                    self.errors[k].update(v)
+
+                merge_state(self.accumulator, accumulator)
+
+                try:
+                    count_errors(self.errors)
+                except TooManyCastingErrors as e:
+                    raise RowProcessorError("Too many casting errors: {}".format(str(e))) from e
+
+                yield from rows
+
+        self.finish()
+
     def start(self):
         pass
 
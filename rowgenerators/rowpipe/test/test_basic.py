@@ -292,6 +292,324 @@ class TestBasic(unittest.TestCase):
 
         print(rp.source_headers)
 
+    def test_code_cache(self):
+        import os
+        from tempfile import TemporaryDirectory
+        from rowgenerators.rowpipe import CodeCache
+
+        class Source(object):
+
+            headers = 'a b'.split()
+
+            def __iter__(self):
+                for i in range(5):
+                    yield (i, str(2 * i))
+
+        def table():
+            t = Table('cached')
+            t.add_column('a', datatype='int')
+            t.add_column('b', datatype='int')
+            return t
+
+        with TemporaryDirectory() as d:
+            cc = CodeCache(d)
+
+            rp1 = RowProcessor(Source(), table(), code_cache=cc)
+            rp2 = RowProcessor(Source(), table(), code_cache=cc)
+
+            self.assertIs(rp1.code_object, rp2.code_object)
+            self.assertEqual(rp1.code_path, rp2.code_path)
+            self.assertFalse(os.path.exists(rp1.code_path))
+            self.assertEqual({'memory': 1, 'disk': 0, 'compiled': 1}, cc.stats)
+
+            self.assertEqual([[i, 2 * i] for i in range(5)], list(rp2))
+
+            # A new cache, as in another process, loads the code from disk
+            cc2 = CodeCache(d)
+            rp3 = RowProcessor(Source(), table(), code_cache=cc2)
+            self.assertEqual({'memory': 0, 'disk': 1, 'compiled': 0}, cc2.stats)
+            self.assertEqual(list(rp1), list(rp3))
+
+            # Different names in the environment are a different entry
+            RowProcessor(Source(), table(), env={'extra': 1}, code_cache=cc)
+            self.assertEqual(2, cc.stats['compiled'])
+
+    def test_batch_cast(self):
+        import datetime
+        import numpy as np
+        from collections import defaultdict
+        from rowgenerators.rowpipe.vector import cast_column
+        from rowgenerators.valuetype import cast_int
+
+        errors = defaultdict(set)
+        values = ['1', ' 2 ', '', None, 'x', '4', '3.0', 5, '99999999999999999999']
+
+        self.assertEqual([1, 2, None, None, None, 4, None, 5, 99999999999999999999],
+                         cast_column(values, 'int', cast_int, 'c', errors))
+        self.assertEqual(2, len(errors['c']))  # 'x' and '3.0'
+
+        # Dates that NumPy parses but datetime.date can't represent get the scalar cast's result
+        from dateutil.parser import ParserError
+        from rowgenerators.valuetype import cast_date
+
+        self.assertEqual([datetime.date(1, 1, 1), datetime.date(2020, 1, 2)],
+                         cast_column(['-001-01-01', '2020-01-02'], 'date', cast_date, 'd', errors))
+
+        with self.assertRaises(ParserError):
+            cast_column(['2020-01-01', '0000-01-01'], 'date', cast_date, 'd', errors)
+
+        class Source(object):
+
+            headers = 'i f s d'.split()
+
+            def __iter__(self):
+                for i in range(10):
+                    yield ({3: 'bad', 7: '7.0'}.get(i, str(i)), '{}.5'.format(i), 'v{}'.format(i) if i % 2 else '',
+                           '2020-01-{:02d}'.format(i + 1) if i != 5 else 'January 6, 2020')
+
+        def table():
+            t = Table('batched')
+            t.add_column('i', datatype='int')
+            t.add_column('f', datatype='float')
+            t.add_column('s', datatype='str')
+            t.add_column('d', datatype='date')
+            return t
+
+        rp_row = RowProcessor(Source(), table())
+        rp_batch = RowProcessor(Source(), table(), batch_size=4)
+
+        rows = list(rp_row)
+        batch_rows = list(rp_batch)
+
+        self.assertEqual(rows, batch_rows)
+        # Value types are the same too, such as DateVT, which == doesn't compare
+        self.assertEqual([[type(v) for v in r] for r in rows], [[type(v) for v in r] for r in batch_rows])
+        self.assertEqual(dict(rp_row.errors), dict(rp_batch.errors))
+        self.assertEqual([5, 5.5, 'v5', datetime.date(2020, 1, 6)], rows[5])
+        self.assertIsNone(rows[3][0])
+        self.assertEqual(7, rows[7][0])  # Value types convert '7.0', which int() doesn't
+
+        # Sources with iter_batches() are read a block at a time, and may have NumPy columns
+        class BatchSource(Source):
+
+            def iter_batches(self, batch_size):
+                yield self.headers
+
+                rows = list(self)
+                for i in range(0, len(rows), batch_size):
+                    yield [np.array(c) for c in zip(*rows[i:i + batch_size])]
+
+        rp = RowProcessor(BatchSource(), table(), batch_size=4)
+
+        self.assertEqual([None, None, 's', None], next(iter(rp)))  # The header is the first row
+        self.assertEqual(rows, list(rp)[1:])
+
+    def test_cast_columns_batch(self):
+        import datetime
+        from rowgenerators.rowpipe.codegen import make_row_processors, exec_context
+        from rowgenerators.rowpipe.exceptions import TooManyCastingErrors
+        from rowgenerators.rowpipe.pipeline import CastColumns
+
+        def table():
+            t = Table('castcols')
+            t.add_column('i', datatype='int')
+            t.add_column('f', datatype='float')
+            t.add_column('d', datatype='date')
+            return t
+
+        class SourcePipe(object):
+
+            def __init__(self, bad=None):
+                self.source = self
+                self.bad = bad
+
+                self.dest_table = table()
+
+            def __iter__(self):
+                yield 'i f d'.split()
+
+                for i in range(10):
+                    yield (str(i) if i != self.bad else 'bad', '{}.5'.format(i), '2020-01-{:02d}'.format(i + 1))
+
+        class Bundle(object):
+            """Builds the caster code the way a bundle would"""
+
+            def __init__(self, fused, drop=None):
+                self.fused = fused
+                self.drop = drop
+                self.errors = []
+
+            def build_caster_code(self, source, headers, pipe=None):
+                env = exec_context()
+                exec(make_row_processors(headers, source.dest_table, env=env, fused=self.fused), env)
+
+                if self.drop is None:
+                    return env['row_processors']
+
+                def drop_row(row, row_n, errors, scratch, accumulator, pipe, bundle, source):
+                    return None if row[0] == self.drop else list(row.values())
+
+                return env['row_processors'] + [drop_row]
+
+            def error(self, m):
+                self.errors.append(m)
+
+        def cast(bundle, batch_size, bad=None):
+            cc = CastColumns(batch_size=batch_size)
+            cc.bundle = bundle
+            cc.set_source_pipe(SourcePipe(bad))
+
+            return cc, list(cc)
+
+        _, rows = cast(Bundle(fused=False), None)
+
+        self.assertEqual(['i', 'f', 'd'], rows[0])
+        self.assertEqual([5, 5.5, datetime.date(2020, 1, 6)], rows[6])
+
+        for fused in (False, True):
+            cc, batch_rows = cast(Bundle(fused=fused), 4)
+
+            # The final cast is only done in batches if it is separate from the transforms
+            self.assertEqual(not fused, cc.batch_processor is not None)
+            self.assertEqual(rows, batch_rows)
+            self.assertEqual([[type(v) for v in r] for r in rows], [[type(v) for v in r] for r in batch_rows])
+
+        # Rows that processing empties are dropped, as they are without batches
+        for batch_size in (None, 4):
+            cc, dropped = cast(Bundle(fused=True, drop=5), batch_size)
+
+            self.assertIsNone(cc.batch_processor)
+            self.assertEqual(rows[:6] + rows[7:], dropped)
+
+        # Casting errors are reported the same way
+        bundles = []
+        for batch_size in (None, 4):
+            bundles.append(Bundle(fused=False))
+
+            with self.assertRaises(TooManyCastingErrors):
+                cast(bundles[-1], batch_size, bad=3)
+
+        self.assertEqual(1, len(bundles[0].errors))
+        self.assertEqual(bundles[0].errors, bundles[1].errors)
+
+    def test_parallel(self):
+        from rowgenerators.rowpipe.processor import merge_state
+
+        class Source(object):
+
+            headers = 'i d'.split()
+
+            def __iter__(self):
+                for i in range(100):
+                    yield (str(i) if i % 10 else 'bad{}'.format(i), '2020-01-{:02d}'.format(i % 28 + 1))
+
+        def table():
+            t = Table('parallel')
+            t.add_column('i', datatype='int')
+            t.add_column('d', datatype='date')
+            return t
+
+        rp = RowProcessor(Source(), table())
+        rows = list(rp)
+
+        for batch_size in (None, 8):
+            rpp = RowProcessor(Source(), table(), workers=3, chunk_size=7, batch_size=batch_size)
+
+            self.assertEqual(rows, list(rpp))
+            self.assertEqual(dict(rp.errors), dict(rpp.errors))
+
+        self.assertEqual({'n': 3, 'l': [1, 2], 's': {1, 2}, 'd': {'a': 2, 'b': 1}, 'x': 'b'},
+                         merge_state({'n': 1, 'l': [1], 's': {1}, 'd': {'a': 1}, 'x': 'a'},
+                                     {'n': 2, 'l': [2], 's': {2}, 'd': {'a': 1, 'b': 1}, 'x': 'b'}))
+
+    def test_fused_stages(self):
+
+        def doubleit(v):
+            return v * 2
+
+        def addone(v):
+            return v + 1
+
+        def plus_a(v, row):
+            return v + row.a
+
+        env = dict(doubleit=doubleit, addone=addone, plus_a=plus_a)
+
+        class Source(object):
+
+            headers = 'a b c'.split()
+
+            def __iter__(self):
+                for i in range(10):
+                    yield (str(i), str(10 * i), 'x{}'.format(i))
+
+        def table():
+            t = Table('fused')
+            t.add_column('a', datatype='int', transform='doubleit;addone')
+            t.add_column('b', datatype='int', transform=';plus_a')
+            t.add_column('c', datatype='str')
+            return t
+
+        rp = RowProcessor(Source(), table(), env=env)
+        rp_stages = RowProcessor(Source(), table(), env=env, fused=False)
+
+        self.assertEqual(1, len(rp.procs))
+        self.assertEqual(4, len(rp_stages.procs))
+
+        rows = list(rp)
+
+        self.assertEqual(rows, list(rp_stages))
+        self.assertEqual([7, 33, 'x3'], rows[3])  # plus_a() sees a from the stage before
+
+        # Only the stage that plus_a() runs in gets a row proxy
+        self.assertEqual(1, rp.code.count('.set_row('))
+
+        self.assertEqual(rows, list(RowProcessor(Source(), table(), env=env, batch_size=4)))
+
+    def test_construction_time(self):
+        import datetime
+        from contexttimer import Timer
+        from rowgenerators.rowpipe.codegen import base_context, exec_context
+
+        # The base environment is built once, and each context is a separate dict on top of it
+        self.assertIs(base_context(), base_context())
+
+        env = exec_context(extra=1, round=None)
+        env['source'] = 'source'
+
+        self.assertEqual(1, env['extra'])
+        self.assertIsNone(env['round'])
+        self.assertNotIn('source', base_context())
+        self.assertIsNotNone(base_context()['round'])
+
+        with self.assertRaises(TypeError):
+            base_context()['source'] = 'source'
+
+        class Source(object):
+
+            headers = 'a b c d'.split()
+
+            def __iter__(self):
+                yield ('1', '2.5', 'x', '2020-01-01')
+
+        def table():
+            t = Table('construct')
+            t.add_column('a', datatype='int')
+            t.add_column('b', datatype='float')
+            t.add_column('c', datatype='str')
+            t.add_column('d', datatype='date')
+            return t
+
+        N = 200
+
+        with Timer() as t:
+            for i in range(N):
+                rp = RowProcessor(Source(), table())
+
+        self.assertEqual([[1, 2.5, 'x', datetime.date(2020, 1, 1)]], list(rp))
+
+        print('Constructions per second=', float(N) / t.elapsed)
+
 
 if __name__ == '__main__':
     unittest.main()
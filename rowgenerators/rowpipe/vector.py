@@ -0,0 +1,157 @@
+# Copyright (c) 2016 Civic Knowledge. This file is licensed under the terms of the
+# MIT License, included in this distribution as LICENSE.txt
+
+"""
+Vectorized casts for blocks of rows.
+
+The final stage of a row processor casts each value to the column's datatype, with a call to a
+cast function, such as cast_int(), for every value. For a block of rows, cast_column() casts the
+strings in a whole column at once with NumPy, which parses them with the same rules as int() and
+float(). Values that are not strings, and strings that fail the vectorized cast, are cast with
+the scalar function, so they get the same results and the same error reports as the row at a time
+path. See codegen.make_batch_caster()
+"""
+
+# Numpy dtypes to cast strings to, for datatypes that can be cast in bulk. Str columns don't need
+# a dtype; non empty strings are already cast.
+VECTOR_DTYPES = {
+    'int': 'int64',
+    'long': 'int64',
+    'id': 'int64',
+    'float': 'float64',
+    'date': 'datetime64[D]',
+    'str': None,
+    'text': None,
+    'unicode': None,
+}
+
+# Datatypes whose scalar cast returns a value type unchanged, such as DateVT, which is a date. Values of
+# these types that are cast in bulk are converted to the column's value type, to get the same results.
+KEEPS_VALUETYPE = ('date',)
+
+# Largest int that a float represents exactly
+MAX_EXACT_INT = 2 ** 53
+
+_FAILED = object()
+
+
+def columns_to_rows(columns):
+    """Transpose a list of columns into a list of rows. Columns may be lists or NumPy arrays"""
+
+    columns = [c.tolist() if hasattr(c, 'tolist') else c for c in columns]
+
+    return [list(r) for r in zip(*columns)]
+
+
+def _astype(strings, dtype):
+    """Cast an array of strings to a dtype, returning a list of Python values, with _FAILED for the
+    strings that could not be cast. When a block fails, it is split in half and each half is cast
+    again, so a few bad values don't send the whole block to the scalar path."""
+
+    try:
+        a = strings.astype(dtype)
+    except (ValueError, OverflowError, TypeError):
+        if len(strings) == 1:
+            return [_FAILED]
+
+        mid = len(strings) // 2
+
+        return _astype(strings[:mid], dtype) + _astype(strings[mid:], dtype)
+
+    if dtype.startswith('datetime64'):
+        # datetime.date objects, or ints for dates that datetime.date can't represent
+        a = a.astype(object)
+
+    return a.tolist()
+
+
+def cast_column(values, datatype, scalar_cast, header_d, errors, valuetype=None):
+    """Cast the values in a column.
+
+    :param values: A list or NumPy array of values
+    :param datatype: Name of the destination datatype, such as 'int'
+    :param scalar_cast: Cast function for a single value, such as cast_int(), for values that can't
+        be cast in bulk.
+    :param header_d: Name of the destination column, for error reports
+    :param errors: Dict of column names to sets of errors, for error reports
+    :param valuetype: The column's value type, for columns whose strings were not converted to
+        it in the first stage. See KEEPS_VALUETYPE
+    :return: A list of cast values
+    """
+    import datetime
+    import numpy as np
+
+    if datatype not in VECTOR_DTYPES:
+        return [scalar_cast(v, header_d, errors) for v in values]
+
+    if hasattr(values, 'tolist'):
+        values = values.tolist()
+
+    dtype = VECTOR_DTYPES[datatype]
+
+    out = [None] * len(values)
+    positions = []
+
+    for i, v in enumerate(values):
+        if type(v) is str:  # Not a subclass, such as FailedValue
+            # Only ISO dates, YYYY-MM-DD, are cast in bulk; other formats are left to dateutil
+            if v and (datatype != 'date' or (len(v) == 10 and v[4] == '-')):
+                positions.append(i)
+            elif v:
+                out[i] = scalar_cast(v, header_d, errors)
+        elif v is not None:
+            out[i] = scalar_cast(v, header_d, errors)
+
+    if not positions:
+        return out
+
+    if dtype is None:
+        for i in positions:
+            out[i] = values[i]
+
+        return out
+
+    cast = _astype(np.array([values[i] for i in positions], dtype=str), dtype)
+
+    # Value types convert ints through float, so larger ints are left to the scalar cast, which
+    # rounds them the same way.
+    max_int = MAX_EXACT_INT if dtype == 'int64' else None
+
+    # NumPy accepts dates, such as year 0 or negative years, that datetime.date doesn't, and
+    # returns them as ints. The scalar cast parses them, or reports the error.
+    is_date = dtype.startswith('datetime64')
+
+    if datatype not in KEEPS_VALUETYPE:
+        valuetype = None
+
+    for i, c in zip(positions, cast):
+        if (c is _FAILED or (max_int and abs(c) >= max_int)
+                or (is_date and not isinstance(c, datetime.date))):
+            out[i] = scalar_cast(values[i], header_d, errors)
+        elif valuetype is not None:
+            out[i] = scalar_cast(valuetype(c), header_d, errors)
+        else:
+            out[i] = c
+
+    return out
+
+
+def batch_caster(dest_table, env=None):
+    """Return a function that casts a block of rows to the datatypes of the columns of a table, for
+    pipes that get their row processors from elsewhere. See codegen.make_batch_caster()
+
+    :param dest_table: Destination table
+    :param env: Environment to exec the code in. Defaults to codegen.exec_context()
+    :return: A function of (rows, errors) that returns the cast rows
+    """
+    from rowgenerators.rowpipe.codecache import get_code_cache
+    from rowgenerators.rowpipe.codegen import make_batch_caster, exec_context, file_header
+
+    env = dict(env) if env is not None else exec_context()
+
+    code, name = make_batch_caster(dest_table)
+    code = file_header + code
+
+    exec(get_code_cache().compile(code, env), env)
+
+    return env[name]
@@ -11,6 +11,8 @@ will have the row data of the last row. Comvert them to dicts ( RowProxy.dict )
 
 """
 
+from functools import lru_cache
+from keyword import iskeyword
 
 
 class RowProxy(object):
@@ -141,3 +143,77 @@ class GeoRowProxy(RowProxy):
 
         return gi
 
+
+def _index_property(i):
+    """Return a property that gets and sets position i of the row"""
+
+    def fget(self):
+        return self._RowProxy__row[i]
+
+    def fset(self, v):
+        self._RowProxy__row[i] = v
+
+    return property(fget, fset)
+
+
+@lru_cache(maxsize=256)
+def _make_row_proxy_class(base, keys):
+
+    pos_map = {e: i for i, e in enumerate(keys)}
+    n = len(keys)
+
+    def __init__(self, keys=None):
+        object.__setattr__(self, '_RowProxy__row', [None] * n)
+
+    def __setattr__(self, key, value):
+        self._RowProxy__row[pos_map[key]] = value
+
+    def __getitem__(self, key):
+        if type(key) is str:
+            try:
+                return self._RowProxy__row[pos_map[key]]
+            except (KeyError, IndexError):
+                pass
+
+        # Integer keys, and the error messages
+        return base.__getitem__(self, key)
+
+    d = {
+        '__slots__': ('_RowProxy__row',),
+        '__init__': __init__,
+        '__setattr__': __setattr__,
+        '__getitem__': __getitem__,
+        '_RowProxy__keys': list(keys),
+        '_RowProxy__pos_map': pos_map,
+        '_RowProxy__initialized': True,
+    }
+
+    # Columns that are valid identifiers, and don't collide with the RowProxy methods, get a
+    # property for their position. Other names still work through __getattr__ and __getitem__
+    for k, i in pos_map.items():
+        if isinstance(k, str) and k.isidentifier() and not iskeyword(k) \
+                and not k.startswith('__') and not hasattr(base, k):
+            d[k] = _index_property(i)
+
+    return type(base.__name__, (base,), d)
+
+
+def row_proxy_class(headers, base=RowProxy):
+    """Return a RowProxy subclass specialized for a header. Columns are attributes that index the row
+    directly, the position map is shared by the class, and the row is held in a slot. Classes are
+    cached by header, so calling this for each new header is cheap.
+
+    >>> rp = row_proxy_class(['a', 'b'])(['a', 'b'])
+    >>> rp.set_row([1, 2]).b
+    2
+
+    :param headers: The header, as a sequence of column names
+    :param base: RowProxy, or a subclass such as GeoRowProxy, to extend
+    :return: A class, constructed with the header, like RowProxy
+    """
+
+    try:
+        return _make_row_proxy_class(base, tuple(headers))
+    except TypeError:
+        # Unhashable column names
+        return base
@@ -9,6 +9,28 @@ from rowgenerators.util import md5_file
 
 from .appurl.web.download import Downloader
 
+DEFAULT_BATCH_SIZE = 10000
+
+
+def rows_to_columns(rows):
+    """Transpose a block of rows into a list of columns. Short rows are padded with None, so
+    every column has one value for each row"""
+    from itertools import zip_longest
+
+    return [list(c) for c in zip_longest(*rows)]
+
+
+def iter_column_batches(itr, batch_size=DEFAULT_BATCH_SIZE):
+    """Consume a row iterator in blocks of ``batch_size`` rows, yielding each block as a list of columns"""
+
+    while True:
+        rows = list(islice(itr, batch_size))
+
+        if not rows:
+            break
+
+        yield rows_to_columns(rows)
+
 
 class RowGenerator(object):
     """Main class for accessing row generators"""
@@ -23,12 +45,12 @@ class RowGenerator(object):
 
     def registered_urls(self):
         """Return an array of registered Urls. The first row is the header"""
-        from pkg_resources import iter_entry_points
+        from .registry import get_registry, URL_GROUP
 
         entries = ['Priority', 'EP Name', 'Module', 'Class']
-        for ep in iter_entry_points('appurl.urls'):
-            c = ep.load()
-            entries.append([c.match_priority, ep.name, ep.module_name, c.__name__, ])
+        for e in get_registry(URL_GROUP).entries:
+            c = e.load()
+            entries.append([c.match_priority, e.name, e.module, c.__name__, ])
 
         return entries
 
@@ -46,6 +68,18 @@ class RowGenerator(object):
         """Iterate, yielding row proxy objects. DOes not first yield a header"""
         yield from self.url.generator.iter_rp
 
+    def iter_batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        """Yields first the header, then blocks of data rows, as lists of columns"""
+        yield from self.url.generator.iter_batches(batch_size)
+
+    def record_batches(self, batch_size=DEFAULT_BATCH_SIZE, table=None):
+        """Yield Apache Arrow RecordBatches. See Source.record_batches()"""
+        yield from self.url.generator.record_batches(batch_size, table=table)
+
+    def to_arrow(self, batch_size=DEFAULT_BATCH_SIZE, table=None):
+        """Return an Apache Arrow Table. See Source.to_arrow()"""
+        return self.url.generator.to_arrow(batch_size, table=table)
+
     @property
     def generator(self):
         """Return the data generating object"""
@@ -161,13 +195,13 @@ class Source(object):
     def iter_rp(self):
         """Iterate, yielding row proxy objects rather than rows"""
 
-        from .rowproxy import RowProxy
+        from .rowproxy import row_proxy_class
 
         itr = iter(self)
 
         headers = next(itr)
 
-        row_proxy = RowProxy(headers)
+        row_proxy = row_proxy_class(headers)(headers)
 
         for row in itr:
             yield row_proxy.set_row(row)
@@ -183,16 +217,136 @@ class Source(object):
         for row in itr:
             yield dict(zip(headers, row))
 
-    def dataframe(self, *args, **kwargs):
-        """Return a pandas dataframe from the resource"""
+    def iter_batches(self, batch_size=DEFAULT_BATCH_SIZE):
+        """Iterate over blocks of rows. Yields the header first, then lists of columns, with each
+        column holding the values for up to ``batch_size`` rows.
+
+        This implementation collects rows from the row iterator; subclasses that can read
+        many rows at once override it. Columns may be lists or NumPy arrays, depending on the source.
+        """
+
+        itr = iter(self)
+
+        try:
+            headers = next(itr)
+        except StopIteration:
+            return
+
+        yield headers
+
+        yield from iter_column_batches(itr, batch_size)
+
+    def record_batches(self, batch_size=DEFAULT_BATCH_SIZE, table=None):
+        """Yield Apache Arrow RecordBatches of up to ``batch_size`` rows, built from iter_batches().
+        Requires the pyarrow package.
+
+        :param batch_size: Maximum number of rows in each batch
+        :param table: Optional Table, from rowgenerators.table or rowgenerators.rowpipe, that sets
+            the column types. If not specified, types come from the ``columns`` property, and any
+            column without a type gets the type that Arrow infers from the first batch.
+        """
+        from .arrow import record_batches
+
+        yield from record_batches(self.iter_batches(batch_size),
+                                  table if table is not None else self.columns)
+
+    def to_arrow(self, batch_size=DEFAULT_BATCH_SIZE, table=None):
+        """Return an Apache Arrow Table, assembled from record_batches()"""
+        import pyarrow as pa
+
+        batches = list(self.record_batches(batch_size, table=table))
+
+        if not batches:
+            return pa.table({})
+
+        return pa.Table.from_batches(batches)
+
+    def iter_dataframes(self, chunksize=DEFAULT_BATCH_SIZE):
+        """Yield pandas DataFrames of up to ``chunksize`` rows, built a column at a time from
+        iter_batches(). The index of each frame continues from the one before it."""
+        from pandas import DataFrame, RangeIndex
+
+        itr = self.iter_batches(chunksize)
+
+        try:
+            headers = next(itr)
+        except StopIteration:
+            return
+
+        start = 0
+
+        for cols in itr:
+            n = len(cols[0]) if len(cols) else 0
+
+            df = DataFrame(dict(enumerate(cols)), index=RangeIndex(start, start + n))
+            df.columns = headers
+
+            start += n
+
+            yield df
+
+    def dataframe(self, *args, chunksize=None, **kwargs):
+        """Return a pandas dataframe from the resource.
+
+        The rows are read with iter_batches(), and each column of a batch is stored as a typed array if
+        all of its values are ints, floats, bools or strings, or otherwise as an array of the values. A
+        column that has the same type in every batch is concatenated. Other columns are rebuilt from their
+        values, one at a time, so pandas infers the type of each column from all of its values, as it
+        does for a list of rows. Columns of Python objects, such as ones with missing values, take as
+        much memory as lists would; use chunksize to bound the memory for those.
+
+        :param chunksize: If set, return an iterator of dataframes of up to this many rows
+            rather than a single dataframe, like pandas.read_csv(). The types of each frame are
+            inferred from its own rows.
+        """
+
+        from pandas import DataFrame, Series, concat
+        from pandas.api.types import infer_dtype
+
+        if chunksize:
+            return self.iter_dataframes(chunksize)
+
+        itr = self.iter_batches(DEFAULT_BATCH_SIZE)
+
+        try:
+            headers = next(itr)
+        except StopIteration:
+            return DataFrame()
+
+        # For each column, the (kind, Series) for each batch. The kind is None for columns that have
+        # more than one kind of value, which are held as objects, since converting them could change them,
+        # such as ints with a missing value becoming floats.
+        columns = [[] for _ in headers]
+
+        for cols in itr:
+            for buf, col in zip(columns, cols):
+                kind = infer_dtype(col, skipna=False)
+
+                if kind in ('integer', 'floating', 'boolean', 'string'):
+                    buf.append((kind, DataFrame({0: col})[0]))
+                else:
+                    buf.append((None, Series(col, dtype=object)))
+
+        data = {}
+
+        for i, buf in enumerate(columns):
+            types = {(kind, s.dtype) for kind, s in buf}
+
+            if len(types) == 1 and None not in next(iter(types)):
+                data[i] = concat([s for _, s in buf], ignore_index=True)
+            else:
+                values = []
+                for _, s in buf:
+                    values.extend(s.tolist())
+
+                data[i] = DataFrame({0: values})[0]
 
-        from pandas import DataFrame
+            buf.clear()
 
-        # Just normal data, so use the iterator in this object.
-        headers = next(islice(self, 0, 1))
-        data = islice(self, 1, None)
+        df = DataFrame(data)
+        df.columns = headers
 
-        return DataFrame(list(data), columns=headers)
+        return df
 
     def start(self):
         pass
@@ -6,7 +6,6 @@
 
 
 from rowgenerators.exceptions import SchemaError
-from tabulate import tabulate
 
 class Table(object):
 
@@ -26,6 +25,7 @@ class Table(object):
             yield c
 
     def __str__(self):
+        from tabulate import tabulate
 
         def _dt(dt):
             try:
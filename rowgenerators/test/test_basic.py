@@ -7,6 +7,12 @@ import unittest
 from os.path import dirname
 import sys
 
+try:
+    import pyarrow
+    test_arrow = True
+except ImportError:
+    test_arrow = False
+
 from rowgenerators import get_generator, parse_app_url
 from rowgenerators.generator.csv import CsvSource
 from rowgenerators.test import get_file, data_path, script_path, RowGeneratorTest
@@ -167,6 +173,339 @@ class BasicTests(RowGeneratorTest):
 
         self.assertEqual(10001, len(list(RowGenerator(url, target_format='csv' ))))
 
+    def test_iter_batches(self):
+        import warnings
+        warnings.simplefilter("ignore")
+
+        import pandas as pd
+        from rowgenerators import RowGenerator
+        from rowgenerators.generator.python import PandasDataframeSource
+        from rowgenerators.source import Source
+
+        base = data_path('public.source.civicknowledge.com/example.com/sources/')
+
+        for fn in ('simple-example.csv', 'renter_cost.tsv', 'renter_cost_excel97.xls'):
+            g = parse_app_url(base + fn).generator
+
+            rows = list(g)
+
+            itr = g.iter_batches(1000)
+            self.assertEqual(rows[0], next(itr))
+
+            batches = list(itr)
+            self.assertTrue(all(len(b) == len(rows[0]) for b in batches))
+            self.assertEqual(rows[1:], [list(r) for b in batches for r in zip(*b)], fn)
+
+            # The generic implementation, collected from __iter__
+            self.assertEqual(batches, list(Source.iter_batches(g, 1000))[1:])
+
+        rg = RowGenerator(base + 'simple-example.csv')
+        self.assertEqual([1000] * 10, [len(b[0]) for b in list(rg.iter_batches(1000))[1:]])
+
+        df = pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']}, index=pd.Index([7, 8, 9], name='id'))
+
+        b = list(PandasDataframeSource('<df>', df, None).iter_batches(2))
+
+        self.assertEqual(['id', 'a', 'b'], b[0])
+        self.assertEqual([[7, 8], [1, 2], ['x', 'y']], b[1])
+        self.assertEqual([[9], [3], ['z']], b[2])
+
+    def test_parallel_csv(self):
+        import csv
+        import io
+        import os
+        from tempfile import NamedTemporaryFile
+        from rowgenerators.generator.csv import record_ranges
+        from rowgenerators.generator.delimited import TsvSource
+
+        base = data_path('public.source.civicknowledge.com/example.com/sources/')
+
+        u = parse_app_url(base + 'simple-example.csv').get_resource().get_target()
+        rows = list(CsvSource(u))
+        self.assertEqual(rows, list(CsvSource(u, workers=2, chunk_size=50000)))
+
+        unordered = list(CsvSource(u, workers=2, ordered=False, chunk_size=50000))
+        self.assertEqual(rows[0], unordered[0])
+        self.assertEqual(sorted(rows[1:]), sorted(unordered[1:]))
+
+        u = parse_app_url(base + 'renter_cost.tsv').get_resource().get_target()
+        self.assertEqual(list(TsvSource(u)), list(TsvSource(u, workers=2, chunk_size=50000)))
+
+        # Quoted fields with embedded newlines must not be split across ranges
+        with NamedTemporaryFile('w', suffix='.csv', newline='', delete=False) as f:
+            w = csv.writer(f)
+            w.writerow(['a', 'b'])
+            for i in range(2000):
+                w.writerow([i, 'one "two"\nthree,\nfour' * (i % 3)])
+
+        self.addCleanup(os.remove, f.name)
+
+        with open(f.name, 'rb') as bf:
+            data = bf.read()
+            bf.seek(0)
+            ranges = list(record_ranges(bf, len(data), 1000))
+
+        self.assertGreater(len(ranges), 10)
+        self.assertEqual(0, ranges[0][0])
+        self.assertEqual(len(data), ranges[-1][1])
+
+        chunk_rows = [r for s, e in ranges for r in csv.reader(io.StringIO(data[s:e].decode('utf8')))]
+        self.assertEqual(list(csv.reader(io.StringIO(data.decode('utf8')))), chunk_rows)
+
+        u = parse_app_url(f.name).get_resource().get_target()
+        self.assertEqual(list(CsvSource(u)), list(CsvSource(u, workers=3, chunk_size=1000)))
+
+        # A quote in an unquoted field is a literal character, which throws off the quote count for
+        # the ranges after it. Those are read without the pool.
+        with NamedTemporaryFile('w', suffix='.csv', newline='', delete=False) as f:
+            f.write('a,b\n')
+            for i in range(200):
+                f.write('{},5"\n"x\ny",b\n'.format(i) if i == 20 else '{},"p\nq"\n'.format(i))
+
+        self.addCleanup(os.remove, f.name)
+
+        u = parse_app_url(f.name).get_resource().get_target()
+        rows = list(CsvSource(u))
+
+        self.assertEqual(['x\ny', 'b'], rows[22])
+        self.assertEqual(rows, list(CsvSource(u, workers=3, chunk_size=100)))
+        self.assertEqual(rows, list(CsvSource(u, workers=3, ordered=False, chunk_size=100)))
+
+        # Escaped quotes can't be counted, so files with them aren't parsed in parallel
+        class EscapedSource(CsvSource):
+            escapechar = '\\'
+            doublequote = False
+
+        self.assertFalse(EscapedSource(u, workers=3, chunk_size=100)._use_parallel())
+        self.assertTrue(CsvSource(u, workers=3, chunk_size=100)._use_parallel())
+
+    def test_mapped_lines(self):
+        import os
+        from tempfile import NamedTemporaryFile
+        from rowgenerators.generator.mapped import open_lines, mapped_lines
+        from rowgenerators.generator.fixed import FixedSource
+        from rowgenerators.table import Table
+
+        texts = [
+            '',
+            'a,b\n1,2\n',
+            'a,b\r\n1,"x\r\ny"\r\n2,3',
+            'a,b\r1,2\r\n3,4\n\n5,6\r',
+            'é,ü\n"ß\nø",∑\n',
+        ]
+
+        for encoding in ('utf8', 'latin1', 'utf-16'):
+            for text in texts:
+                if encoding == 'latin1':
+                    text = text.replace('∑', 's')
+
+                with NamedTemporaryFile('wb', delete=False) as f:
+                    f.write(text.encode(encoding))
+
+                self.addCleanup(os.remove, f.name)
+
+                with open(f.name, encoding=encoding) as tf:
+                    lines = list(tf)
+
+                self.assertEqual(lines, list(open_lines(f.name, encoding)), (encoding, text))
+
+                if encoding != 'utf-16':
+                    with open(f.name, 'rb') as bf:
+                        self.assertEqual(lines, list(mapped_lines(bf, encoding, block_size=3)))
+
+        base = data_path('public.source.civicknowledge.com/example.com/sources/')
+
+        u = parse_app_url(base + 'simple-example.csv').get_resource().get_target()
+
+        with open(u.fspath, newline='') as f:
+            import csv
+            self.assertEqual(list(csv.reader(f)), list(CsvSource(u)))
+
+        t = Table()
+        t.add_column('a', int, 2)
+        t.add_column('b', str, 3)
+
+        with NamedTemporaryFile('wb', suffix='.txt', delete=False) as f:
+            f.write(b' 1abc\r\n22 de\r\n')
+
+        self.addCleanup(os.remove, f.name)
+
+        rows = list(FixedSource(parse_app_url(f.name), table=t))
+        self.assertEqual([['1', 'abc'], ['22', 'de']], rows)
+
+    def test_compressed(self):
+        import bz2
+        import gzip
+        import json
+        import lzma
+        import os
+        from tempfile import mkdtemp
+        from shutil import rmtree
+        from rowgenerators.generator.json import JsonRowSource
+
+        d = mkdtemp()
+        self.addCleanup(rmtree, d)
+
+        src = data_path('public.source.civicknowledge.com/example.com/sources/simple-example.csv')
+
+        with open(src, 'rb') as f:
+            data = f.read()
+
+        rows = list(parse_app_url(src).generator)
+
+        for ext, opener in (('gz', gzip.open), ('bz2', bz2.open), ('xz', lzma.open)):
+            fn = os.path.join(d, 'simple-example.csv.' + ext)
+
+            with opener(fn, 'wb') as f:
+                f.write(data)
+
+            u = parse_app_url(fn)
+            self.assertEqual('csv', u.target_format)
+
+            g = u.generator
+            self.assertIsInstance(g, CsvSource)
+            self.assertEqual(rows, list(g))
+            self.assertEqual(10000, len(g.dataframe()))
+
+        # Only the compressed file is written
+        self.assertEqual(3, len(os.listdir(d)))
+
+        fn = os.path.join(d, 'rows.json.gz')
+
+        with gzip.open(fn, 'wt') as f:
+            json.dump(rows[:10], f)
+
+        self.assertEqual(rows[:10], list(JsonRowSource(parse_app_url(fn))))
+
+        self.assertIsNone(parse_app_url(src).compression)
+        self.assertEqual('bz2', parse_app_url('http://example.com/foo.data#&compression=bz2').compression)
+
+    def test_row_proxy_class(self):
+        from rowgenerators.rowproxy import row_proxy_class, RowProxy, GeoRowProxy
+
+        headers = ['a', 'b', 'keys', 'c d', 'a']
+
+        cls = row_proxy_class(headers)
+        self.assertIs(cls, row_proxy_class(list(headers)))
+        self.assertTrue(issubclass(cls, RowProxy))
+        self.assertTrue(issubclass(row_proxy_class(headers, GeoRowProxy), GeoRowProxy))
+
+        rp = cls(headers).set_row([1, 2, 3, 4, 5])
+
+        # Same results as RowProxy
+        orp = RowProxy(headers).set_row([1, 2, 3, 4, 5])
+
+        for k in ['a', 'b', 'keys', 'c d', 0, 4]:
+            self.assertEqual(orp[k], rp[k])
+
+        self.assertEqual((5, 2, 4), (rp.a, rp.b, getattr(rp, 'c d')))
+        self.assertEqual(headers, rp.keys())
+        self.assertEqual(orp.dict, rp.dict)
+
+        rp.b = 20
+        rp['c d'] = 40
+        self.assertEqual([1, 20, 3, 40, 5], rp.row)
+
+        with self.assertRaises(KeyError):
+            rp.x = 1
+
+        with self.assertRaises(KeyError):
+            rp.x
+
+        with self.assertRaises(KeyError):
+            rp['x']
+
+        self.assertEqual({'a': 5, 'b': 20, 'keys': 3, 'c d': 40}, rp.copy().dict)
+
+        base = data_path('public.source.civicknowledge.com/example.com/sources/')
+        g = parse_app_url(base + 'simple-example.csv').generator
+
+        self.assertEqual([r[1] for r in list(g)[1:]], [r.uuid for r in g.iter_rp])
+
+    def test_chunked_dataframe(self):
+        import pandas as pd
+        from pandas.testing import assert_frame_equal
+        from rowgenerators.generator.iterator import IteratorSource
+
+        base = data_path('public.source.civicknowledge.com/example.com/sources/')
+
+        g = parse_app_url(base + 'renter_cost_excel97.xls').generator
+
+        rows = list(g)
+        expected = pd.DataFrame(rows[1:], columns=rows[0])
+
+        df = g.dataframe()
+        assert_frame_equal(expected, df)
+
+        chunks = list(g.dataframe(chunksize=5000))
+        self.assertEqual([5000, 5000, 2003], [len(c) for c in chunks])
+        self.assertEqual(10000, chunks[-1].index[0])
+        assert_frame_equal(expected, pd.concat(chunks))
+
+        rows = [['a', 'b'], [1, 'x'], [2, None], [3, 'z']]
+        df = IteratorSource(rows).dataframe()
+        self.assertEqual('int64', str(df.a.dtype))
+        self.assertEqual([1, 2, 3], list(df.a))
+
+        df = IteratorSource(rows[:1]).dataframe()
+        self.assertEqual(['a', 'b'], list(df.columns))
+        self.assertEqual(0, len(df))
+
+        # Types are inferred from the whole column, not from each batch, so nulls after the first
+        # batch make an int column float, as they do for a frame built from a list of rows.
+        rows = [['a']] + [[i] for i in range(10000)] + [[None]] * 3
+        df = IteratorSource(rows).dataframe()
+        self.assertEqual('float64', str(df.a.dtype))
+        assert_frame_equal(pd.DataFrame(rows[1:], columns=rows[0]), df)
+
+        # Batches with different types aren't converted to a common type, which would turn the bools into ints
+        rows = [['a', 'b']] + [[i, 'x'] for i in range(10000)] + [[True, 'y']]
+        df = IteratorSource(rows).dataframe()
+        self.assertEqual('object', str(df.a.dtype))
+        self.assertIs(True, df.a.iloc[-1])
+        assert_frame_equal(pd.DataFrame(rows[1:], columns=rows[0]), df)
+
+        self.assertEqual(0, len(IteratorSource([]).dataframe().columns))
+
+    @unittest.skipIf(not test_arrow, "This test requires pyarrow")
+    def test_arrow(self):
+        import datetime
+        import pyarrow as pa
+        from rowgenerators import RowGenerator
+        from rowgenerators.generator.iterator import IteratorSource
+        from rowgenerators.rowpipe import Table
+
+        base = data_path('public.source.civicknowledge.com/example.com/sources/')
+
+        rg = RowGenerator(base + 'simple-example.csv')
+
+        batches = list(rg.record_batches(3000))
+        self.assertEqual([3000, 3000, 3000, 1000], [b.num_rows for b in batches])
+        self.assertEqual(['id', 'uuid', 'int', 'float'], batches[0].schema.names)
+
+        t = rg.to_arrow()
+        self.assertEqual(10000, t.num_rows)
+        self.assertEqual([r[1:] for r in list(rg)[1:]], [list(r.values())[1:] for r in t.to_pylist()])
+
+        rows = [['a', 'b', 'c'], [1, 'x', datetime.date(2020, 1, 1)], [2, None], [3, 'z', None]]
+
+        t = IteratorSource(rows).to_arrow(2)
+        self.assertEqual([pa.int64(), pa.string(), pa.date32()], t.schema.types)
+        self.assertEqual([None, 'z'], t.column('b').to_pylist()[1:])
+
+        table = Table('t')
+        table.add_column('a', datatype='float')
+        table.add_column('b', datatype='str')
+        table.add_column('c', datatype='date')
+
+        t = IteratorSource(rows).to_arrow(2, table=table)
+        self.assertEqual([pa.float64(), pa.string(), pa.date32()], t.schema.types)
+
+        # Inferred types come from the first batch
+        from rowgenerators.exceptions import RowGeneratorError
+        with self.assertRaises(RowGeneratorError):
+            IteratorSource([['a'], [1], ['x']]).to_arrow(1)
+
     def test_api(self):
 
         import  rowgenerators as rg
@@ -0,0 +1,94 @@
+# Copyright (c) 2017 Civic Knowledge. This file is licensed under the terms of the
+# MIT License, included in this distribution as LICENSE.txt
+
+"""
+Import time benchmarks. Set ROWGENERATORS_IMPORT_BUDGET_MS to change the limit on the
+cumulative import time of the package for the CSV path.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+from os.path import dirname
+
+from rowgenerators.test import data_path
+
+# Modules that must not be imported just to read a CSV file
+HEAVY_MODULES = ['pandas', 'numpy', 'xlrd', 'geopandas', 'h5py', 'fiona', 'shapely', 'pyproj',
+                 'pkg_resources', 'sqlalchemy', 'boto']
+
+CSV_SCRIPT = """
+import rowgenerators as rg
+g = rg.parse_app_url({!r}).generator
+for row in g:
+    pass
+"""
+
+
+def import_times(script):
+    """Run a script with ``python -X importtime`` and return a dict of top level module names to
+    cumulative import times, in microseconds, and a dict of all module names to self times"""
+
+    root = dirname(dirname(dirname(os.path.abspath(__file__))))
+
+    p = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                       cwd=root, stderr=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+
+    if p.returncode != 0:
+        raise RuntimeError(p.stderr)
+
+    cumulative = {}
+    self_times = {}
+
+    for line in p.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+
+        self_times[name.strip()] = int(self_us)
+
+        if not name[1:].startswith(' '):  # Top level import
+            cumulative[name.strip()] = int(cumulative_us)
+
+    return cumulative, self_times
+
+
+class TestImports(unittest.TestCase):
+
+    def test_csv_import_time(self):
+
+        budget_ms = float(os.environ.get('ROWGENERATORS_IMPORT_BUDGET_MS', 1000))
+
+        script = CSV_SCRIPT.format(
+            data_path('public.source.civicknowledge.com/example.com/sources/simple-example.csv'))
+
+        cumulative, self_times = import_times(script)
+
+        rg_modules = sorted(((t, n) for n, t in self_times.items() if n.startswith('rowgenerators')), reverse=True)
+
+        for t, n in rg_modules[:10]:
+            print("{:>8.1f} ms  {}".format(t / 1000, n))
+
+        imported = {n.split('.')[0] for n in self_times}
+
+        for m in HEAVY_MODULES:
+            self.assertNotIn(m, imported, "{} is imported on the CSV path".format(m))
+
+        total_ms = sum(t for n, t in cumulative.items() if n.split('.')[0] != 'site') / 1000
+
+        print("Import time: {:.1f} ms".format(total_ms))
+
+        self.assertLess(total_ms, budget_ms)
+
+    def test_package_import(self):
+
+        cumulative, self_times = import_times('import rowgenerators')
+
+        self.assertEqual({'rowgenerators'},
+                         {n for n in self_times if n.startswith('rowgenerators')})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,7 +12,14 @@ from datetime import date, time, datetime
 from decorator import decorator
 from rowgenerators.util import Constant, memoize
 
-from tableintuit.types import test_nan
+
+def test_nan(v):
+    """Return a true value if v is a NaN or a string for a NaN. Imports tableintuit, and numpy
+    with it, on first use rather than at import"""
+    from tableintuit.types import test_nan
+
+    return test_nan(v)
+
 
 ROLE = Constant()
 ROLE.DIMENSION = 'd'
@@ -416,6 +423,10 @@ class DateValue(date, ValueType):
     def __init__(self, v):
         pass
 
+    def __reduce_ex__(self, protocol):
+        # The pickle state of dates and times is bytes, which __new__ would try to parse.
+        return self.__class__, (date(self.year, self.month, self.day),)
+
 
 class TimeValue(time, ValueType):
     _pythontype = time
@@ -442,6 +453,9 @@ class TimeValue(time, ValueType):
                 return NoneValue
             raise
 
+    def __reduce_ex__(self, protocol):
+        return self.__class__, (time(self.hour, self.minute, self.second),)
+
 
 class DateTimeValue(datetime, ValueType):
     _pythontype = datetime
@@ -469,6 +483,9 @@ class DateTimeValue(datetime, ValueType):
                 return NoneValue
             raise
 
+    def __reduce_ex__(self, protocol):
+        return self.__class__, (datetime(self.year, self.month, self.day, self.hour, self.minute, self.second),)
+
 
 class KeyVT(IntValue):
     role = ROLE.KEY
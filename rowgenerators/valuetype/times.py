@@ -22,7 +22,7 @@ def cast_date(v, header_d, errors):
     elif isinstance(v, ValueType):
         return v.__date__()
     elif isinstance(v, str):
-        return parse(v).date
+        return parse(v).date()
 
     errors[header_d].add(u"Failed to cast '{}' ({}) to date in '{}': {}".format(v, type(v), header_d, v.exc))
     count_errors(errors)
@@ -56,7 +56,7 @@ def cast_time(v, header_d, errors):
     elif isinstance(v, ValueType):
         return v.__time__()
     elif isinstance(v, str):
-        return parse(v).time
+        return parse(v).time()
 
     errors[header_d].add(u"Failed to cast '{}' ({}) to time in '{}': {}".format(v, type(v), header_d, v.exc))
     count_errors(errors)
@@ -53,7 +53,9 @@ setup(
         'wrapt'
     ],
     extras_require={
-        'geo': ['fiona', 'shapely','pyproj', 'pyproject']
+        'geo': ['fiona', 'shapely','pyproj', 'pyproject'],
+        'arrow': ['pyarrow'],
+        'zstd': ['zstandard']
     },
     test_requires=['aniso8601', 'dateutil', 'fiona', 'shapely','pyproj', 'pyproject', 'contexttimer'],
     entry_points={
@@ -75,6 +77,13 @@ setup(
             #
             # Archive Urls
             ".zip = rowgenerators.appurl.archive.zip:ZipUrl",
+            ".tar = rowgenerators.appurl.archive.tar:TarUrl",
+            ".tgz = rowgenerators.appurl.archive.tar:TarUrl",
+            ".tbz2 = rowgenerators.appurl.archive.tar:TarUrl",
+            ".txz = rowgenerators.appurl.archive.tar:TarUrl",
+            ".gz = rowgenerators.appurl.archive.tar:TarUrl",
+            ".bz2 = rowgenerators.appurl.archive.tar:TarUrl",
+            ".xz = rowgenerators.appurl.archive.tar:TarUrl",
             #
             # File Urls
             ".csv = rowgenerators.appurl.file.csv:CsvFileUrl",